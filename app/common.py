@@ -4,6 +4,7 @@ import httpx
 from aiogram import Dispatcher, Bot
 from fastapi import HTTPException, Request, Depends
 from app.core.context import AppContext
+from app.tg.workers import UpdateWorkerPool
 
 
 def tg_dp() -> Dispatcher:
@@ -25,6 +26,11 @@ def tg_bot() -> Bot:
     return bot
 
 
+def tg_update_workers() -> UpdateWorkerPool | None:
+    context = AppContext()
+    return context.get_update_workers()
+
+
 @contextlib.asynccontextmanager
 async def get_async_httpx_client(**kwargs) -> httpx.AsyncClient:
     if kwargs.get('timeout') is None:
@@ -35,3 +41,4 @@ async def get_async_httpx_client(**kwargs) -> httpx.AsyncClient:
 
 BotDispatcher = t.Annotated[Dispatcher, Depends(tg_dp)]
 TgBot = t.Annotated[Bot, Depends(tg_bot)]
+UpdateWorkers = t.Annotated[UpdateWorkerPool | None, Depends(tg_update_workers)]
@@ -1,5 +1,6 @@
-import logging
+import functools
 import os
+import typing as t
 
 from pydantic_settings import (
     BaseSettings,
@@ -16,18 +17,80 @@ class Settings(BaseSettings):
     TABLE_SUFFIX: str
 
     TG_KEY: str
+    # свой Bot API сервер (локальный telegram-bot-api или заглушка в бенчмарках)
+    TG_API_SERVER: str | None = None
 
     VERSION: str = 'dev'
 
     USE_WEBHOOK: bool = False
     WEBHOOK: str
 
+    TG_POLLING_TIMEOUT: int = 30
+    TG_HANDLE_AS_TASKS: bool = True
+    TG_TASKS_LIMIT: int = 0  # 0 - без ограничения
 
-match os.getenv('MODE'):
-    case 'CICD':
-        settings = Settings()  # в этом случае переменные окружения настроены в workflow
-    case _:
-        settings = Settings(_env_file=('.env', '../.env'))
+    DYNAMO_REGION: str = 'ru-central1'
+    DYNAMO_MAX_POOL_CONNECTIONS: int = 10
+    DYNAMO_CONNECT_TIMEOUT: float = 2
+    DYNAMO_READ_TIMEOUT: float = 5
+    DYNAMO_KEEPALIVE_TIMEOUT: float = 60
+    DYNAMO_TCP_KEEPALIVE: bool = True
+    DYNAMO_RETRY_MODE: str = 'adaptive'
+    DYNAMO_MAX_ATTEMPTS: int = 3
+    # не проверять таблицу через describe_table при старте (схема заведомо верна)
+    DYNAMO_TRUST_TABLE: bool = False
+    # таблица поверх низкоуровневого клиента (app.db.fast_table): быстрее, целые числа
+    # читаются как int, а не Decimal; дробные - Decimal, как и без неё
+    DYNAMO_FAST_CLIENT: bool = False
 
-LOGGER_LEVEL = logging.DEBUG
+    # memory - в памяти процесса, dynamo - DynamoDB, tiered - L1 в памяти над DynamoDB
+    FSM_STORAGE: t.Literal['memory', 'dynamo', 'tiered'] = 'dynamo'
+    FSM_TIERED_CONSISTENCY: t.Literal['write_through', 'write_back'] = 'write_through'
+    FSM_TIERED_FLUSH_DELAY: float = 1
+    # размер и ttl L1 tiered storage берутся из FSM_CACHE_MAXSIZE / FSM_CACHE_TTL
+    FSM_CACHE_ENABLED: bool = False
+    FSM_CACHE_MAXSIZE: int = 1024
+    FSM_CACHE_TTL: float = 30
+    FSM_UNIT_OF_WORK: bool = False
+    # срок жизни FSM item в секундах от смены состояния (0 - бессрочно), TTL атрибут expires_at;
+    # FSM_TTL_BY_GROUP задаёт свой срок группам состояний: {"ClientRegister": 86400}
+    FSM_TTL: int = 0
+    FSM_TTL_BY_GROUP: dict[str, int] = {}
+    # map - данные map атрибутом data, binary - одним сжатым атрибутом data_bin (app.tg.fsm.codec);
+    # с binary update_data - чтение и запись с условием, два запроса вместо одного
+    FSM_DATA_CODEC: t.Literal['map', 'binary'] = 'map'
+    FSM_DATA_COMPRESS_MIN_SIZE: int = 128
 
+    LOG_UPDATE_PAYLOADS: bool = False
+
+    # ответ 200 сразу после валидации, обработка update в фоновых воркерах;
+    # только для uvicorn, в Cloud Functions (function_app) игнорируется
+    WEBHOOK_ACK_FIRST: bool = False
+    WEBHOOK_MAX_IN_FLIGHT: int = 64
+    WEBHOOK_DRAIN_TIMEOUT: float = 10
+    # первый подходящий вызов Bot API уходит в теле ответа на webhook
+    WEBHOOK_REPLY: bool = False
+
+    WARM_INSTANCE: bool = True
+    LIFESPAN_STARTUP_TIMEOUT: float = 60
+    LIFESPAN_SHUTDOWN_TIMEOUT: float = 60
+    # таймауты шагов старта DynamoDB; Bot и Dispatcher собираются параллельно с ними
+    STARTUP_DYNAMO_TIMEOUT: float = 10
+    STARTUP_TABLE_CHECK_TIMEOUT: float = 5
+
+
+@functools.cache
+def get_settings() -> Settings:
+    """Settings читаются при первом обращении, а не при импорте модуля"""
+    match os.getenv('MODE'):
+        case 'CICD':
+            return Settings()  # в этом случае переменные окружения настроены в workflow
+        case _:
+            return Settings(_env_file=('.env', '../.env'))
+
+
+def __getattr__(name: str):
+    # `from app.config import settings` продолжает работать, но .env читается только здесь
+    if name == 'settings':
+        return get_settings()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -7,15 +7,30 @@ class AppContext:
             cls._instance._initialized = False
         return cls._instance
 
-    def initialize(self, bot, dynamo_table, dynamo_client, dynamo_storage, dispatcher_tg):
+    def initialize(self, bot, dynamo_table, dynamo_client, dynamo_storage, dispatcher_tg, update_workers=None):
         if not self._initialized:
             self.bot = bot
             self.dynamo_table = dynamo_table
             self.dynamo_client = dynamo_client
             self.dynamo_storage = dynamo_storage
             self.dispatcher_tg = dispatcher_tg
+            self.update_workers = update_workers
             self._initialized = True
 
+    def reset(self):
+        """Забыть ресурсы lifespan, чтобы следующий initialize() записал новые"""
+        self.bot = None
+        self.dynamo_table = None
+        self.dynamo_client = None
+        self.dynamo_storage = None
+        self.dispatcher_tg = None
+        self.update_workers = None
+        self._initialized = False
+
+    @property
+    def is_initialized(self) -> bool:
+        return self._initialized
+
     def get_bot(self):
         return self.bot
 
@@ -30,3 +45,6 @@ class AppContext:
 
     def get_dispatcher_tg(self):
         return self.dispatcher_tg
+
+    def get_update_workers(self):
+        return self.update_workers
@@ -1,20 +1,123 @@
+import atexit
+import contextlib
+import contextvars
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import random
 
-LOGGER_LEVEL = logging.DEBUG
+# Уровень, формат и режим вывода задаются переменными окружения:
+#   LOGGING_LEVEL            DEBUG / INFO / WARNING ... (INFO по умолчанию)
+#   LOG_FORMAT               json / text
+#   LOG_ASYNC                1 - запись в stdout из отдельного потока через QueueListener;
+#                            только для долгоживущего процесса (uvicorn): в Cloud Functions
+#                            экземпляр замораживают после ответа и записи из очереди
+#                            задерживаются или теряются, поэтому по умолчанию запись синхронная
+#   LOG_PAYLOAD_SAMPLE_RATE  доля update, для которых логируется весь payload (0..1)
+DEFAULT_LOGGER_LEVEL = logging.INFO
 
 
-logger = logging.Logger('main_logger')
-logger.setLevel(LOGGER_LEVEL)
+def parse_log_level(name: str | None, default: int | None = DEFAULT_LOGGER_LEVEL) -> int | None:
+    """Уровень логирования по имени; неизвестное имя даёт default, а не ошибку при импорте"""
+    level = logging.getLevelName((name or '').strip().upper())
+    return level if isinstance(level, int) else default
+
+
+def parse_sample_rate(value: str | None) -> float | None:
+    """Доля от 0 до 1, значения вне диапазона обрезаются; нечисло даёт None"""
+    try:
+        rate = float(value or '0')
+    except ValueError:
+        return None
+    if rate != rate:
+        return None
+    return min(max(rate, 0.0), 1.0)
+
+
+_logger_level_name = os.getenv('LOGGING_LEVEL')
+LOGGER_LEVEL = parse_log_level(_logger_level_name)
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json').lower()
+LOG_ASYNC = os.getenv('LOG_ASYNC', '0') not in ('0', 'false', 'False')
+_payload_sample_rate = os.getenv('LOG_PAYLOAD_SAMPLE_RATE')
+LOG_PAYLOAD_SAMPLE_RATE = parse_sample_rate(_payload_sample_rate) or 0.0
+
+_log_context: contextvars.ContextVar[dict] = contextvars.ContextVar('log_context', default={})
+
+
+@contextlib.contextmanager
+def bind_log_context(**fields):
+    """Добавляет поля (update_id, user_id, ...) ко всем записям лога внутри блока"""
+    token = _log_context.set({**_log_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
+
+
+def payload_sampled() -> bool:
+    return LOG_PAYLOAD_SAMPLE_RATE > 0 and random.random() < LOG_PAYLOAD_SAMPLE_RATE
+
+
+class ContextFilter(logging.Filter):
+    """Переносит поля из bind_log_context в запись; работает в потоке вызова"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        for name, value in _log_context.get().items():
+            setattr(record, name, value)
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    context_fields = ('update_id', 'user_id', 'chat_id', 'user')
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for name in self.context_fields:
+            value = getattr(record, name, None)
+            if value is not None:
+                payload[name] = value
+        if record.exc_info:
+            payload['exc'] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+def _build_formatter() -> logging.Formatter:
+    if LOG_FORMAT == 'text':
+        return logging.Formatter('{asctime} {levelname:10} [{name}] ::: {message}', style='{')
+    return JsonFormatter()
+
 
-# file_handler = logging.FileHandler('my_app.log')
 console_handler = logging.StreamHandler()
-formatter = logging.Formatter('{asctime} {levelname:10} [{pathname} def {funcName}] ::: {message}', style='{')
+console_handler.setFormatter(_build_formatter())
+
+if LOG_ASYNC:
+    _log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    output_handler: logging.Handler = logging.handlers.QueueHandler(_log_queue)
+    log_listener = logging.handlers.QueueListener(_log_queue, console_handler, respect_handler_level=True)
+    log_listener.start()
+    atexit.register(log_listener.stop)
+else:
+    output_handler = console_handler
+    log_listener = None
+output_handler.addFilter(ContextFilter())
 
-# file_handler.setFormatter(formatter)
-console_handler.setFormatter(formatter)
 
-# logger.addHandler(file_handler)
-logger.addHandler(console_handler)  # Optional: Display log messages in the console
+logger = logging.Logger('main_logger')
+logger.setLevel(LOGGER_LEVEL)
+logger.addHandler(output_handler)
 
 dispatcher_loger = logging.Logger('yc')
 dispatcher_loger.setLevel(LOGGER_LEVEL)
+dispatcher_loger.addHandler(output_handler)
+
+if _logger_level_name and parse_log_level(_logger_level_name, default=None) is None:
+    logger.warning(f'Unknown LOGGING_LEVEL {_logger_level_name!r}, using {logging.getLevelName(LOGGER_LEVEL)}')
+if parse_sample_rate(_payload_sample_rate) is None:
+    logger.warning(f'Invalid LOG_PAYLOAD_SAMPLE_RATE {_payload_sample_rate!r}, payload sampling is disabled')
@@ -0,0 +1,152 @@
+import bisect
+import contextlib
+import contextvars
+import functools
+import time
+import typing as t
+
+# границы бакетов гистограммы латентности, секунды
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_invocation: contextvars.ContextVar[dict[str, float] | None] = contextvars.ContextVar(
+    'metrics_invocation', default=None
+)
+
+
+class Histogram:
+    def __init__(self, buckets: t.Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля по бакетам: верхняя граница бакета, куда он попал"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts):
+            cumulative += bucket_count
+            if cumulative >= rank:
+                return self.buckets[index] if index < len(self.buckets) else float('inf')
+        return float('inf')
+
+
+class MetricsRegistry:
+    """
+    Счётчики и гистограммы латентности по стадиям обработки в памяти процесса.
+
+    Отдаётся в формате Prometheus через /metrics; для функций дополнительно
+    собирается сводка стадий одного вызова (collect_invocation).
+    """
+
+    def __init__(self, prefix: str = 'tgstore'):
+        self.prefix = prefix
+        self.histograms: dict[str, Histogram] = {}
+        self.counters: dict[tuple[str, str], int] = {}
+        self.gauges: dict[str, t.Callable[[], float]] = {}
+
+    def observe(self, stage: str, seconds: float) -> None:
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = Histogram()
+        histogram.observe(seconds)
+        timings = _invocation.get()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + seconds
+
+    def inc(self, name: str, stage: str = '', value: int = 1) -> None:
+        key = (name, stage)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def register_gauge(self, name: str, read: t.Callable[[], float]) -> None:
+        """Gauge, значение которого читается вызовом read при каждой выдаче /metrics"""
+        self.gauges[name] = read
+
+    def unregister_gauge(self, name: str, read: t.Callable[[], float] | None = None) -> None:
+        """С read gauge снимается, только если его не перерегистрировали с другим read"""
+        if read is None or self.gauges.get(name) == read:
+            self.gauges.pop(name, None)
+
+    @contextlib.contextmanager
+    def timer(self, stage: str) -> t.Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.inc('errors_total', stage)
+            raise
+        finally:
+            self.observe(stage, time.perf_counter() - started)
+
+    def timed(self, stage: str):
+        """Декоратор корутины: время выполнения пишется в стадию stage"""
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with self.timer(stage):
+                    return await func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def render_prometheus(self) -> str:
+        name = f'{self.prefix}_stage_duration_seconds'
+        lines = [
+            f'# HELP {name} Latency of request processing stages',
+            f'# TYPE {name} histogram',
+        ]
+        for stage, histogram in sorted(self.histograms.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets, histogram.counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {histogram.sum}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {histogram.count}')
+        counter_names = sorted({counter for counter, _ in self.counters})
+        for counter in counter_names:
+            full_name = f'{self.prefix}_{counter}'
+            lines.append(f'# TYPE {full_name} counter')
+            for (metric, stage), value in sorted(self.counters.items()):
+                if metric == counter:
+                    labels = f'{{stage="{stage}"}}' if stage else ''
+                    lines.append(f'{full_name}{labels} {value}')
+        for gauge, read in sorted(self.gauges.items()):
+            full_name = f'{self.prefix}_{gauge}'
+            lines.append(f'# TYPE {full_name} gauge')
+            lines.append(f'{full_name} {read()}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        return {
+            stage: {
+                'count': histogram.count,
+                'p50_ms': round(histogram.quantile(0.5) * 1000, 2),
+                'p99_ms': round(histogram.quantile(0.99) * 1000, 2),
+            }
+            for stage, histogram in self.histograms.items()
+        }
+
+
+@contextlib.contextmanager
+def collect_invocation() -> t.Iterator[dict[str, float]]:
+    """Собирает суммарное время по стадиям внутри одного вызова функции"""
+    timings: dict[str, float] = {}
+    token = _invocation.set(timings)
+    try:
+        yield timings
+    finally:
+        _invocation.reset(token)
+
+
+def format_invocation(timings: dict[str, float]) -> str:
+    return ' '.join(f'{stage}={seconds * 1000:.1f}ms' for stage, seconds in timings.items())
+
+
+metrics = MetricsRegistry()
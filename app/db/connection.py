@@ -1,29 +1,177 @@
-import aioboto3
+from __future__ import annotations
+
+import asyncio
+import typing as t
+from contextlib import AsyncExitStack
+
 import pydantic
-import types_aiobotocore_dynamodb as aiodyno_types
-from contextlib import asynccontextmanager
+
 from app.config import settings
 
 from app.core.log_config import logger
 
+if t.TYPE_CHECKING:
+    # stubs нужны только для аннотаций; aioboto3 импортируется при первом open()
+    import aioboto3
+    import types_aiobotocore_dynamodb as aiodyno_types
+    from aiobotocore.config import AioConfig
+    from types_aiobotocore_dynamodb.service_resource import Table
+
+    from app.db.fast_table import FastTable
+    from app.db.memory import MemoryDynamoDB
+
+
+def is_memory_endpoint(endpoint_url) -> bool:
+    return str(endpoint_url).startswith('memory://')
+
+
+def dynamodb_config() -> AioConfig:
+    from aiobotocore.config import AioConfig
+
+    return AioConfig(
+        max_pool_connections=settings.DYNAMO_MAX_POOL_CONNECTIONS,
+        connect_timeout=settings.DYNAMO_CONNECT_TIMEOUT,
+        read_timeout=settings.DYNAMO_READ_TIMEOUT,
+        tcp_keepalive=settings.DYNAMO_TCP_KEEPALIVE,
+        retries={
+            'mode': settings.DYNAMO_RETRY_MODE,
+            'max_attempts': settings.DYNAMO_MAX_ATTEMPTS,
+        },
+        connector_args={'keepalive_timeout': settings.DYNAMO_KEEPALIVE_TIMEOUT},
+    )
+
+
+class DynamoConnectionManager:
+    """
+    Одна сессия aioboto3 и один пул соединений на контейнер.
+
+    open() открывает client и resource и держит их до close(), поэтому TLS соединения
+    переиспользуются между запросами. Открывается и закрывается в lifespan приложения.
+    Клиенты aiobotocore привязаны к циклу событий: если open() вызван уже на другом
+    цикле, старые клиенты забываются (forget) и открываются новые.
+    """
+
+    def __init__(
+        self,
+        endpoint_url: pydantic.HttpUrl = settings.YC_DATABASE_URL,
+        access_key: str = settings.YC_SERVICE_ACCOUNT_KEY_ID,
+        secret_key: str = settings.YC_SERVICE_ACCOUNT_SECRET_KEY,
+        region_name: str = settings.DYNAMO_REGION,
+    ) -> None:
+        self._setup_data = {
+            "service_name": 'dynamodb',
+            "region_name": region_name,
+            "aws_access_key_id": access_key,
+            "aws_secret_access_key": secret_key,
+            "endpoint_url": endpoint_url,
+        }
+        self._session: aioboto3.Session | None = None
+        self._stack: AsyncExitStack | None = None
+        self._tables: dict[str, Table] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+        # база в памяти вместо DynamoDB, если адрес memory:// (app.db.memory)
+        self.memory: MemoryDynamoDB | None = None
+        self.client: aiodyno_types.DynamoDBClient | None = None
+        self.resource: aiodyno_types.DynamoDBServiceResource | None = None
+
+    @property
+    def session(self) -> aioboto3.Session:
+        """Сессия aioboto3 создаётся один раз; на её events можно повесить свои хуки"""
+        if self._session is None:
+            import aioboto3
+
+            self._session = aioboto3.Session()
+        return self._session
+
+    @property
+    def is_open(self) -> bool:
+        return self._stack is not None
 
-async def dynamodb_connection(
-    endpoint_url: pydantic.HttpUrl = settings.YC_DATABASE_URL,
-    access_key: str = settings.YC_SERVICE_ACCOUNT_KEY_ID,
-    secret_key: str = settings.YC_SERVICE_ACCOUNT_SECRET_KEY,
-) -> [tuple[aiodyno_types.DynamoDBServiceResource, aiodyno_types.DynamoDBClient]]:
-    session = aioboto3.Session()
+    @property
+    def endpoint_url(self) -> str:
+        return self._setup_data['endpoint_url']
 
-    setup_data = {
-        "service_name": 'dynamodb',
-        "region_name": 'ru-central1',
-        "aws_access_key_id": access_key,
-        "aws_secret_access_key": secret_key,
-        "endpoint_url": endpoint_url,
-    }
+    async def open(self) -> 'DynamoConnectionManager':
+        loop = asyncio.get_running_loop()
+        if self.is_open:
+            if self._loop is loop:
+                return self
+            logger.warning('DynamoDB pool was opened on another event loop, reopening')
+            self.forget()
+        stack = AsyncExitStack()
+        if is_memory_endpoint(self.endpoint_url):
+            from app.db.memory import memory_database
 
-    async with session.resource(**setup_data) as dyno_resource, session.client(**setup_data) as dyno_client:
-        return dyno_resource, dyno_client
+            self.memory = memory_database(self.endpoint_url)
+            self.resource = self.memory.resource()
+            self.client = self.memory.client()
+            self._stack = stack
+            self._loop = loop
+            logger.info(f'In-memory DynamoDB opened: {self.endpoint_url}')
+            return self
+        config = dynamodb_config()
+        try:
+            self.resource = await stack.enter_async_context(
+                self.session.resource(**self._setup_data, config=config)
+            )
+            self.client = await stack.enter_async_context(
+                self.session.client(**self._setup_data, config=config)
+            )
+        except BaseException:
+            await stack.aclose()
+            raise
+        self._stack = stack
+        self._loop = loop
+        logger.info(f'DynamoDB pool opened, max_pool_connections={settings.DYNAMO_MAX_POOL_CONNECTIONS}')
+        return self
+
+    async def table(self, table_name: str = settings.TABLE_SUFFIX) -> Table | FastTable:
+        await self.open()
+        table = self._tables.get(table_name)
+        if table is None:
+            if settings.DYNAMO_FAST_CLIENT:
+                from app.db.fast_table import FastTable
+
+                table = FastTable(self.client, table_name)
+            else:
+                table = await self.resource.Table(table_name)
+            self._tables[table_name] = table
+        return table
+
+    def forget(self) -> None:
+        """
+        Забывает client и resource, не закрывая их: после смены цикла событий
+        закрыть их нельзя, соединения уйдут вместе со старым циклом.
+        """
+        self._stack = None
+        self._loop = None
+        self._tables.clear()
+        self.memory = None
+        self.client = None
+        self.resource = None
+
+    async def close(self) -> None:
+        stack = self._stack
+        if stack is not None and self._loop is not asyncio.get_running_loop():
+            self.forget()
+            return
+        self.forget()
+        if stack is not None:
+            await stack.aclose()
+            logger.info('DynamoDB pool closed')
+
+    async def __aenter__(self) -> 'DynamoConnectionManager':
+        return await self.open()
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        await self.close()
+
+
+dynamo_manager = DynamoConnectionManager()
+
+
+# describe_table на контейнер: схема таблицы между вызовами функции не меняется
+_table_descriptions: dict[str, dict] = {}
 
 
 class DynamoConnection:
@@ -38,16 +186,25 @@ class DynamoConnection:
         self._resource = dyno_resource
         self._default_table = default_table
 
-    async def table(self, table_name: str | None = None):
-        logger.debug(f'Запрашиваемая таблица: {table_name}')
+    async def describe_table(self, table_name: str | None = None) -> dict:
+        """Проверяет, что таблица существует; ответ кэшируется до конца жизни контейнера"""
         if table_name is None:
             table_name = self._default_table
+        description = _table_descriptions.get(table_name)
+        if description is not None:
+            return description
         try:
-            table_list = await self._client.list_tables()
-            table_names = table_list.get('TableNames', [])
-            logger.info(f"Доступные таблицы: {table_names}")
             response = await self._client.describe_table(TableName=table_name)
-            logger.info(f"Таблица '{table_name}' существует: {response}")
         except Exception as e:
             logger.error(f"Ошибка при проверке таблицы '{table_name}': {e}")
             raise
+        logger.debug("Таблица '%s' существует: %s", table_name, response)
+        description = _table_descriptions[table_name] = response['Table']
+        return description
+
+    async def table(self, table_name: str | None = None):
+        logger.debug(f'Запрашиваемая таблица: {table_name}')
+        if table_name is None:
+            table_name = self._default_table
+        await self.describe_table(table_name)
+        return await self._resource.Table(table_name)
@@ -1,3 +1,28 @@
+import asyncio
+import itertools
+import random
+import typing as t
+
+from boto3.dynamodb.types import TypeDeserializer
+
+from app.db import key_structure
+from app.db.fast_table import FastTable
+from app.db.marshal import marshal_item, unmarshal_item
+
+BATCH_GET_LIMIT = 100
+BATCH_WRITE_LIMIT = 25
+
+_deserializer = TypeDeserializer()
+
+
+class UnprocessedItemsError(Exception):
+    """DynamoDB так и не обработал часть batch запроса после всех повторов"""
+
+    def __init__(self, unprocessed: list):
+        super().__init__(f'{len(unprocessed)} items left unprocessed')
+        self.unprocessed = unprocessed
+
+
 async def put_item(
     table,
     partkey: str,
@@ -47,32 +72,377 @@ async def query(table, **query_args):
     return response
 
 
-async def update_item(table, Key, UpdateExpression, ExpressionAttributeNames ,ExpressionAttributeValues):
+def _read_args(
+    request_args: dict,
+    projection: t.Sequence[str] | None,
+    page_size: int | None
+) -> dict:
+    request_args = dict(request_args)
+    if projection:
+        names = dict(request_args.get('ExpressionAttributeNames', {}))
+        aliases = []
+        for index, attribute in enumerate(projection):
+            alias = f'#proj{index}'
+            names[alias] = attribute
+            aliases.append(alias)
+        request_args['ProjectionExpression'] = ', '.join(aliases)
+        request_args['ExpressionAttributeNames'] = names
+    if page_size:
+        request_args['Limit'] = page_size
+    return request_args
+
+
+async def _iter_pages(method, request_args: dict) -> t.AsyncIterator[list[dict]]:
+    request_args = dict(request_args)
+    while True:
+        response = await method(**request_args)
+        yield response.get('Items', [])
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            return
+        request_args['ExclusiveStartKey'] = last_key
+
+
+async def iter_query_pages(
+    table,
+    *,
+    projection: t.Sequence[str] | None = None,
+    page_size: int | None = None,
+    **query_args
+) -> t.AsyncIterator[list[dict]]:
+    """Постранично отдаёт результат query, следуя за LastEvaluatedKey"""
+    async for page in _iter_pages(table.query, _read_args(query_args, projection, page_size)):
+        yield page
+
+
+async def iter_query(
+    table,
+    *,
+    projection: t.Sequence[str] | None = None,
+    page_size: int | None = None,
+    limit: int | None = None,
+    **query_args
+) -> t.AsyncIterator[dict]:
+    """Отдаёт items query по одному; limit ограничивает общее число items"""
+    count = 0
+    async for page in iter_query_pages(table, projection=projection, page_size=page_size, **query_args):
+        for item in page:
+            yield item
+            count += 1
+            if limit is not None and count >= limit:
+                return
+
+
+async def iter_pattern(
+    table,
+    pattern: str | key_structure.AccessPattern,
+    *,
+    projection: t.Sequence[str] | None = None,
+    page_size: int | None = None,
+    limit: int | None = None,
+    filter_expression: str | None = None,
+    filter_names: dict | None = None,
+    filter_values: dict | None = None,
+    **fields
+) -> t.AsyncIterator[dict]:
+    """
+    Листинг по access pattern из key_structure.ACCESS_PATTERNS: query по партиции
+    таблицы или GSI, поля ключа передаются именованными аргументами.
+    Имена и значения фильтра не должны совпадать с #pk/#sk/:pk/:sk.
+    """
+    if isinstance(pattern, str):
+        pattern = key_structure.access_pattern(pattern)
+    query_args = pattern.query_args(**fields)
+    if filter_expression:
+        query_args['FilterExpression'] = filter_expression
+        query_args['ExpressionAttributeNames'].update(filter_names or {})
+        query_args['ExpressionAttributeValues'].update(filter_values or {})
+    async for item in iter_query(table, projection=projection, page_size=page_size, limit=limit, **query_args):
+        yield item
+
+
+def build_set_expression(
+    values: dict,
+    path: str | None = None,
+    prefix: str = 'f'
+) -> tuple[str, dict, dict]:
+    """
+    Собирает `SET` выражение для UpdateItem из словаря значений.
+
+    Имена атрибутов всегда идут через ExpressionAttributeNames, поэтому ключи
+    могут быть любыми строками. Если указан path, поля пишутся внутрь map атрибута.
+    """
+    names = {}
+    expression_values = {}
+    assignments = []
+    if path is not None:
+        names['#path'] = path
+    for index, (name, value) in enumerate(values.items()):
+        name_alias = f'#{prefix}{index}'
+        value_alias = f':{prefix}{index}'
+        names[name_alias] = name
+        expression_values[value_alias] = value
+        target = f'#path.{name_alias}' if path is not None else name_alias
+        assignments.append(f'{target} = {value_alias}')
+    return 'SET ' + ', '.join(assignments), names, expression_values
+
+
+async def update_item(
+    table,
+    Key,
+    UpdateExpression,
+    ExpressionAttributeNames,
+    ExpressionAttributeValues,
+    condition_expression: str | None = None
+):
+    update_args = {}
+    if condition_expression:
+        update_args['ConditionExpression'] = condition_expression
 
     response = await table.update_item(
         Key=Key,
         UpdateExpression=UpdateExpression,
         ExpressionAttributeNames=ExpressionAttributeNames,
         ExpressionAttributeValues=ExpressionAttributeValues,
-        ReturnValues='ALL_NEW'
+        ReturnValues='ALL_NEW',
+        **update_args
     )
 
     return response
 
 
 async def delete_item(
-    table_connection,
+    table,
     partkey: str,
     sortkey: str
 ):
-    async with table_connection as table_conn:
-        response = await table_conn.delete_item(Key={'partkey': partkey, 'sortkey': sortkey})
+    response = await table.delete_item(Key={'partkey': partkey, 'sortkey': sortkey})
 
     return response
 
 
-async def scan(table_connection):
-    async with table_connection as table_conn:
-        response = await table_conn.scan()
+async def scan(table):
+    response = await table.scan()
 
     return response
+
+
+_SEGMENT_DONE = object()
+
+
+async def iter_scan_pages(
+    table,
+    *,
+    segments: int = 1,
+    max_workers: int | None = None,
+    projection: t.Sequence[str] | None = None,
+    page_size: int | None = None,
+    **scan_args
+) -> t.AsyncIterator[list[dict]]:
+    """
+    Постранично отдаёт результат scan.
+
+    При segments > 1 таблица читается параллельным scan по Segment/TotalSegments,
+    одновременно работает не больше max_workers сегментов. Страницы проходят через
+    ограниченную очередь, поэтому память не растёт вместе с таблицей.
+    """
+    request_args = _read_args(scan_args, projection, page_size)
+    if segments <= 1:
+        async for page in _iter_pages(table.scan, request_args):
+            yield page
+        return
+
+    workers_count = min(max_workers or segments, segments)
+    segment_queue: asyncio.Queue[int] = asyncio.Queue()
+    for segment in range(segments):
+        segment_queue.put_nowait(segment)
+    pages: asyncio.Queue = asyncio.Queue(maxsize=workers_count * 2)
+
+    async def worker():
+        try:
+            while not segment_queue.empty():
+                segment = segment_queue.get_nowait()
+                segment_args = {**request_args, 'Segment': segment, 'TotalSegments': segments}
+                async for page in _iter_pages(table.scan, segment_args):
+                    await pages.put(page)
+        except Exception as e:
+            await pages.put(e)
+            return
+        await pages.put(_SEGMENT_DONE)
+
+    tasks = [asyncio.create_task(worker()) for _ in range(workers_count)]
+    try:
+        finished = 0
+        while finished < workers_count:
+            page = await pages.get()
+            if page is _SEGMENT_DONE:
+                finished += 1
+            elif isinstance(page, Exception):
+                raise page
+            else:
+                yield page
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def iter_scan(
+    table,
+    *,
+    segments: int = 1,
+    max_workers: int | None = None,
+    projection: t.Sequence[str] | None = None,
+    page_size: int | None = None,
+    limit: int | None = None,
+    **scan_args
+) -> t.AsyncIterator[dict]:
+    """Отдаёт items scan по одному; limit ограничивает общее число items"""
+    count = 0
+    pages = iter_scan_pages(
+        table,
+        segments=segments,
+        max_workers=max_workers,
+        projection=projection,
+        page_size=page_size,
+        **scan_args
+    )
+    try:
+        async for page in pages:
+            for item in page:
+                yield item
+                count += 1
+                if limit is not None and count >= limit:
+                    return
+    finally:
+        await pages.aclose()
+
+
+def _serialize(item: dict) -> dict:
+    return marshal_item(item)
+
+
+def _deserialize(item: dict) -> dict:
+    return {name: _deserializer.deserialize(value) for name, value in item.items()}
+
+
+def _deserializer_for(table) -> t.Callable[[dict], dict]:
+    # FastTable отдаёт целые числа как int, остальные таблицы - как boto3 resource, Decimal
+    return unmarshal_item if isinstance(table, FastTable) else _deserialize
+
+
+def _item_key(item: dict) -> tuple:
+    return item['partkey'], item['sortkey']
+
+
+def _chunks(items: list, size: int) -> t.Iterator[list]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+async def _backoff(attempt: int, base_delay: float, max_delay: float) -> None:
+    await asyncio.sleep(random.uniform(0, min(max_delay, base_delay * 2 ** attempt)))
+
+
+async def batch_get_items(
+    table,
+    keys: t.Iterable[dict],
+    *,
+    projection: t.Sequence[str] | None = None,
+    max_concurrency: int = 4,
+    max_retries: int = 8,
+    base_delay: float = 0.05,
+    max_delay: float = 2.0
+) -> list[dict]:
+    """
+    Читает items по списку ключей через BatchGetItem.
+
+    Ключи режутся на пачки по 100, пачки идут параллельно (не больше max_concurrency),
+    UnprocessedKeys повторяются с экспоненциальной задержкой и джиттером.
+    Порядок результата не совпадает с порядком ключей.
+    """
+    unique_keys = list({_item_key(key): key for key in keys}.values())
+    if not unique_keys:
+        return []
+    client = table.meta.client
+    deserialize = _deserializer_for(table)
+    request_template = _read_args({}, projection, None)
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def get_chunk(chunk: list[dict]) -> list[dict]:
+        request = {'Keys': [_serialize(key) for key in chunk], **request_template}
+        items = []
+        async with semaphore:
+            for attempt in range(max_retries + 1):
+                response = await client.batch_get_item(RequestItems={table.name: request})
+                items.extend(deserialize(item) for item in response.get('Responses', {}).get(table.name, []))
+                request = response.get('UnprocessedKeys', {}).get(table.name)
+                if not request:
+                    return items
+                if attempt < max_retries:
+                    await _backoff(attempt, base_delay, max_delay)
+        raise UnprocessedItemsError([deserialize(key) for key in request['Keys']])
+
+    chunks = await asyncio.gather(*(get_chunk(chunk) for chunk in _chunks(unique_keys, BATCH_GET_LIMIT)))
+    return [item for chunk in chunks for item in chunk]
+
+
+async def batch_write_items(
+    table,
+    put_items: t.Iterable[dict] = (),
+    delete_keys: t.Iterable[dict] = (),
+    *,
+    writes: t.Iterable[dict] = (),
+    max_concurrency: int = 4,
+    max_retries: int = 8,
+    base_delay: float = 0.05,
+    max_delay: float = 2.0
+) -> int:
+    """
+    Пишет и удаляет items через BatchWriteItem пачками по 25.
+
+    writes - операции по порядку: `{'PutRequest': {'Item': item}}` или
+    `{'DeleteRequest': {'Key': key}}`. Операции идут в порядке put_items,
+    delete_keys, writes; BatchWriteItem не принимает две операции над одним
+    ключом, поэтому для ключа остаётся последняя из них.
+
+    Пачки идут параллельно (не больше max_concurrency), UnprocessedItems
+    повторяются с экспоненциальной задержкой и джиттером. Возвращает число
+    отправленных запросов.
+    """
+    operations = itertools.chain(
+        ({'PutRequest': {'Item': item}} for item in put_items),
+        ({'DeleteRequest': {'Key': key}} for key in delete_keys),
+        writes,
+    )
+    requests_by_key = {}
+    for operation in operations:
+        if 'PutRequest' in operation:
+            item = operation['PutRequest']['Item']
+            requests_by_key[_item_key(item)] = {'PutRequest': {'Item': _serialize(item)}}
+        else:
+            key = operation['DeleteRequest']['Key']
+            requests_by_key[_item_key(key)] = {
+                'DeleteRequest': {'Key': _serialize({'partkey': key['partkey'], 'sortkey': key['sortkey']})}
+            }
+    write_requests = list(requests_by_key.values())
+    if not write_requests:
+        return 0
+    client = table.meta.client
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def write_chunk(chunk: list[dict]) -> int:
+        calls = 0
+        async with semaphore:
+            for attempt in range(max_retries + 1):
+                response = await client.batch_write_item(RequestItems={table.name: chunk})
+                calls += 1
+                chunk = response.get('UnprocessedItems', {}).get(table.name)
+                if not chunk:
+                    return calls
+                if attempt < max_retries:
+                    await _backoff(attempt, base_delay, max_delay)
+        raise UnprocessedItemsError(chunk)
+
+    calls = await asyncio.gather(*(write_chunk(chunk) for chunk in _chunks(write_requests, BATCH_WRITE_LIMIT)))
+    return sum(calls)
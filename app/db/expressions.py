@@ -0,0 +1,555 @@
+"""
+Разбор и вычисление выражений DynamoDB над items в формате AttributeValue
+({'S': ...}, {'N': ...}, {'M': {...}} ...) для таблицы в памяти (app.db.memory).
+
+Поддерживаются condition / filter / key condition выражения (сравнения,
+BETWEEN, IN, AND / OR / NOT, attribute_exists, attribute_not_exists,
+attribute_type, begins_with, contains, size), projection и update выражения
+(SET с if_not_exists, list_append, + и -, REMOVE, ADD, DELETE).
+Зарезервированные слова DynamoDB не проверяются.
+"""
+import re
+import typing as t
+from decimal import Decimal
+
+Path = tuple[str | int, ...]
+
+
+class ExpressionError(ValueError):
+    """Ошибка в выражении; таблица в памяти отвечает на неё ValidationException"""
+
+
+_TOKEN = re.compile(r'''
+    \s*(?:
+        (?P<name>\#[A-Za-z0-9_]+)
+      | (?P<value>:[A-Za-z0-9_]+)
+      | (?P<number>\d+)
+      | (?P<ident>[A-Za-z_][A-Za-z0-9_]*)
+      | (?P<op><>|<=|>=|[=<>()\[\],.+-])
+    )''', re.VERBOSE)
+
+_COMPARATORS = ('=', '<>', '<', '<=', '>', '>=')
+_UPDATE_CLAUSES = ('SET', 'REMOVE', 'ADD', 'DELETE')
+
+
+def _tokenize(text: str) -> list[tuple[str, str]]:
+    tokens = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = _TOKEN.match(text, position)
+        if match is None or match.end() == position:
+            raise ExpressionError(f'Invalid expression: syntax error near "{text[position:position + 10]}"')
+        tokens.append((match.lastgroup, match.group(match.lastgroup)))
+        position = match.end()
+    tokens.append(('end', ''))
+    return tokens
+
+
+class ExpressionContext:
+    """ExpressionAttributeNames / Values одного запроса и учёт того, что из них использовано"""
+
+    def __init__(self, names: dict[str, str] | None = None, values: dict[str, dict] | None = None):
+        self.names = names or {}
+        self.values = values or {}
+        self.used_names: set[str] = set()
+        self.used_values: set[str] = set()
+
+    def name(self, alias: str) -> str:
+        if alias not in self.names:
+            raise ExpressionError(f'An expression attribute name used in the document path is not defined; '
+                                  f'attribute name: {alias}')
+        self.used_names.add(alias)
+        return self.names[alias]
+
+    def value(self, alias: str) -> dict:
+        if alias not in self.values:
+            raise ExpressionError(f'An expression attribute value used in expression is not defined; '
+                                  f'attribute value: {alias}')
+        self.used_values.add(alias)
+        return self.values[alias]
+
+    def check_unused(self) -> None:
+        unused_names = set(self.names) - self.used_names
+        if unused_names:
+            raise ExpressionError(f'Value provided in ExpressionAttributeNames unused in expressions: '
+                                  f'keys: {{{", ".join(sorted(unused_names))}}}')
+        unused_values = set(self.values) - self.used_values
+        if unused_values:
+            raise ExpressionError(f'Value provided in ExpressionAttributeValues unused in expressions: '
+                                  f'keys: {{{", ".join(sorted(unused_values))}}}')
+
+
+class _Parser:
+    def __init__(self, text: str, context: ExpressionContext):
+        self.tokens = _tokenize(text)
+        self.position = 0
+        self.context = context
+
+    def peek(self, offset: int = 0) -> tuple[str, str]:
+        return self.tokens[min(self.position + offset, len(self.tokens) - 1)]
+
+    def next(self) -> tuple[str, str]:
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def expect(self, text: str) -> None:
+        kind, token = self.next()
+        if token != text:
+            raise ExpressionError(f'Invalid expression: expected "{text}", got "{token or "end of input"}"')
+
+    def at_keyword(self, *words: str) -> bool:
+        kind, token = self.peek()
+        return kind == 'ident' and token.upper() in words
+
+    def at_end(self) -> bool:
+        return self.peek()[0] == 'end'
+
+    def finish(self) -> None:
+        if not self.at_end():
+            raise ExpressionError(f'Invalid expression: unexpected token "{self.peek()[1]}"')
+
+    # пути и операнды
+
+    def path(self) -> Path:
+        parts: list[str | int] = [self._element()]
+        while True:
+            token = self.peek()[1]
+            if token == '.':
+                self.next()
+                parts.append(self._element())
+            elif token == '[':
+                self.next()
+                kind, number = self.next()
+                if kind != 'number':
+                    raise ExpressionError('Invalid expression: list index must be a number')
+                self.expect(']')
+                parts.append(int(number))
+            else:
+                return tuple(parts)
+
+    def _element(self) -> str:
+        kind, token = self.next()
+        if kind == 'name':
+            return self.context.name(token)
+        if kind == 'ident':
+            return token
+        raise ExpressionError(f'Invalid expression: expected attribute name, got "{token or "end of input"}"')
+
+    def operand(self) -> tuple:
+        kind, token = self.peek()
+        if kind == 'value':
+            self.next()
+            return 'value', self.context.value(token)
+        if kind == 'ident' and token.lower() == 'size' and self.peek(1)[1] == '(':
+            self.next()
+            self.expect('(')
+            path = self.path()
+            self.expect(')')
+            return 'size', path
+        return 'path', self.path()
+
+    # условия
+
+    def condition(self) -> tuple:
+        node = self._and()
+        while self.at_keyword('OR'):
+            self.next()
+            node = ('or', node, self._and())
+        return node
+
+    def _and(self) -> tuple:
+        node = self._not()
+        while self.at_keyword('AND'):
+            self.next()
+            node = ('and', node, self._not())
+        return node
+
+    def _not(self) -> tuple:
+        if self.at_keyword('NOT'):
+            self.next()
+            return 'not', self._not()
+        return self._primary()
+
+    def _primary(self) -> tuple:
+        kind, token = self.peek()
+        if token == '(':
+            self.next()
+            node = self.condition()
+            self.expect(')')
+            return node
+        if kind == 'ident' and self.peek(1)[1] == '(' and token.lower() != 'size':
+            return self._function()
+        left = self.operand()
+        if self.at_keyword('BETWEEN'):
+            self.next()
+            low = self.operand()
+            if not self.at_keyword('AND'):
+                raise ExpressionError('Invalid expression: BETWEEN requires AND')
+            self.next()
+            return 'between', left, low, self.operand()
+        if self.at_keyword('IN'):
+            self.next()
+            self.expect('(')
+            options = [self.operand()]
+            while self.peek()[1] == ',':
+                self.next()
+                options.append(self.operand())
+            self.expect(')')
+            return 'in', left, options
+        operator = self.next()[1]
+        if operator not in _COMPARATORS:
+            raise ExpressionError(f'Invalid expression: expected comparator, got "{operator or "end of input"}"')
+        return 'cmp', operator, left, self.operand()
+
+    def _function(self) -> tuple:
+        name = self.next()[1].lower()
+        self.expect('(')
+        if name in ('attribute_exists', 'attribute_not_exists'):
+            args = (self.path(),)
+        elif name in ('attribute_type', 'begins_with', 'contains'):
+            path = self.path()
+            self.expect(',')
+            args = (path, self.operand())
+        else:
+            raise ExpressionError(f'Invalid function name; function: {name}')
+        self.expect(')')
+        return ('func', name, *args)
+
+    # update
+
+    def update_value(self) -> tuple:
+        node = self._update_operand()
+        token = self.peek()[1]
+        if token in ('+', '-'):
+            self.next()
+            node = ('plus' if token == '+' else 'minus', node, self._update_operand())
+        return node
+
+    def _update_operand(self) -> tuple:
+        kind, token = self.peek()
+        if kind == 'ident' and self.peek(1)[1] == '(':
+            name = token.lower()
+            self.next()
+            self.expect('(')
+            if name == 'if_not_exists':
+                path = self.path()
+                self.expect(',')
+                node = ('if_not_exists', path, self._update_operand())
+            elif name == 'list_append':
+                first = self._update_operand()
+                self.expect(',')
+                node = ('list_append', first, self._update_operand())
+            else:
+                raise ExpressionError(f'Invalid function name; function: {name}')
+            self.expect(')')
+            return node
+        if kind == 'value':
+            self.next()
+            return 'value', self.context.value(token)
+        return 'path', self.path()
+
+
+def parse_condition(text: str, context: ExpressionContext) -> tuple:
+    parser = _Parser(text, context)
+    node = parser.condition()
+    parser.finish()
+    return node
+
+
+def parse_projection(text: str, context: ExpressionContext) -> list[Path]:
+    parser = _Parser(text, context)
+    paths = [parser.path()]
+    while parser.peek()[1] == ',':
+        parser.next()
+        paths.append(parser.path())
+    parser.finish()
+    return paths
+
+
+def parse_update(text: str, context: ExpressionContext) -> list[tuple]:
+    """Список действий ('SET', path, value) / ('REMOVE', path) / ('ADD' | 'DELETE', path, value)"""
+    parser = _Parser(text, context)
+    actions = []
+    seen = set()
+    while not parser.at_end():
+        if not parser.at_keyword(*_UPDATE_CLAUSES):
+            raise ExpressionError(f'Invalid UpdateExpression: unexpected token "{parser.peek()[1]}"')
+        clause = parser.next()[1].upper()
+        if clause in seen:
+            raise ExpressionError(f'Invalid UpdateExpression: The "{clause}" section can only be used once')
+        seen.add(clause)
+        while True:
+            path = parser.path()
+            if clause == 'SET':
+                parser.expect('=')
+                actions.append((clause, path, parser.update_value()))
+            elif clause == 'REMOVE':
+                actions.append((clause, path))
+            else:
+                kind, token = parser.next()
+                if kind != 'value':
+                    raise ExpressionError(f'Invalid UpdateExpression: {clause} requires a value')
+                actions.append((clause, path, parser.context.value(token)))
+            if parser.peek()[1] != ',':
+                break
+            parser.next()
+    if not actions:
+        raise ExpressionError('Invalid UpdateExpression: expression is empty')
+    return actions
+
+
+# вычисление
+
+def resolve(item: dict, path: Path) -> dict | None:
+    value: t.Any = {'M': item}
+    for part in path:
+        if isinstance(part, int):
+            elements = value.get('L')
+            if elements is None or part >= len(elements):
+                return None
+            value = elements[part]
+        else:
+            members = value.get('M')
+            if members is None or part not in members:
+                return None
+            value = members[part]
+    return value
+
+
+def _type_of(value: dict) -> str:
+    return next(iter(value))
+
+
+def _normalize(value: dict) -> t.Any:
+    kind, raw = next(iter(value.items()))
+    if kind == 'N':
+        return Decimal(raw)
+    if kind == 'NS':
+        return frozenset(Decimal(number) for number in raw)
+    if kind in ('SS', 'BS'):
+        return frozenset(raw)
+    if kind == 'L':
+        return tuple((_type_of(element), _normalize(element)) for element in raw)
+    if kind == 'M':
+        return tuple(sorted((name, _type_of(element), _normalize(element)) for name, element in raw.items()))
+    return raw
+
+
+def values_equal(first: dict | None, second: dict | None) -> bool:
+    if first is None or second is None:
+        return first is second
+    return _type_of(first) == _type_of(second) and _normalize(first) == _normalize(second)
+
+
+def _operand(node: tuple, item: dict) -> dict | None:
+    kind = node[0]
+    if kind == 'value':
+        return node[1]
+    if kind == 'path':
+        return resolve(item, node[1])
+    value = resolve(item, node[1])
+    if value is None:
+        return None
+    value_type, raw = next(iter(value.items()))
+    if value_type in ('S', 'B', 'SS', 'NS', 'BS', 'L', 'M'):
+        return {'N': str(len(raw))}
+    return None
+
+
+def _compare(operator: str, first: dict | None, second: dict | None) -> bool:
+    if operator == '=':
+        return values_equal(first, second)
+    if operator == '<>':
+        return not values_equal(first, second)
+    if first is None or second is None or _type_of(first) != _type_of(second) or _type_of(first) not in ('S', 'N', 'B'):
+        return False
+    left, right = _normalize(first), _normalize(second)
+    return {
+        '<': left < right,
+        '<=': left <= right,
+        '>': left > right,
+        '>=': left >= right,
+    }[operator]
+
+
+def evaluate(node: tuple, item: dict) -> bool:
+    kind = node[0]
+    if kind == 'and':
+        return evaluate(node[1], item) and evaluate(node[2], item)
+    if kind == 'or':
+        return evaluate(node[1], item) or evaluate(node[2], item)
+    if kind == 'not':
+        return not evaluate(node[1], item)
+    if kind == 'cmp':
+        return _compare(node[1], _operand(node[2], item), _operand(node[3], item))
+    if kind == 'between':
+        value = _operand(node[1], item)
+        return _compare('>=', value, _operand(node[2], item)) and _compare('<=', value, _operand(node[3], item))
+    if kind == 'in':
+        value = _operand(node[1], item)
+        return value is not None and any(values_equal(value, _operand(option, item)) for option in node[2])
+    return _function(node[1], node[2:], item)
+
+
+def _function(name: str, args: tuple, item: dict) -> bool:
+    value = resolve(item, args[0])
+    if name == 'attribute_exists':
+        return value is not None
+    if name == 'attribute_not_exists':
+        return value is None
+    if value is None:
+        return False
+    argument = _operand(args[1], item)
+    if argument is None:
+        return False
+    value_type, raw = next(iter(value.items()))
+    if name == 'attribute_type':
+        return argument.get('S') == value_type
+    argument_type, argument_raw = next(iter(argument.items()))
+    if name == 'begins_with':
+        return value_type == argument_type and value_type in ('S', 'B') and raw[:len(argument_raw)] == argument_raw
+    # contains
+    if value_type == 'S' and argument_type == 'S':
+        return argument_raw in raw
+    if value_type in ('SS', 'NS', 'BS') and argument_type == value_type[0]:
+        return _normalize(argument) in _normalize(value)
+    if value_type == 'L':
+        return any(values_equal(element, argument) for element in raw)
+    return False
+
+
+def project(item: dict, paths: list[Path]) -> dict:
+    """Оставляет в item только перечисленные пути, сохраняя вложенность"""
+    tree: dict = {}
+    for path in paths:
+        value = resolve(item, path)
+        if value is None:
+            continue
+        node = tree
+        for index, part in enumerate(path[:-1]):
+            container = 'L' if isinstance(path[index + 1], int) else 'M'
+            node = node.setdefault(part, (container, {}))[1]
+        node[path[-1]] = value
+
+    def build(node) -> dict:
+        if isinstance(node, tuple):
+            container, children = node
+            if container == 'L':
+                return {'L': [build(children[index]) for index in sorted(children)]}
+            return {'M': {name: build(child) for name, child in children.items()}}
+        return node
+
+    return {name: build(node) for name, node in tree.items()}
+
+
+def _update_value(node: tuple, item: dict) -> dict:
+    kind = node[0]
+    if kind == 'value':
+        return node[1]
+    if kind == 'path':
+        value = resolve(item, node[1])
+        if value is None:
+            raise ExpressionError('The provided expression refers to an attribute that does not exist in the item')
+        return value
+    if kind == 'if_not_exists':
+        value = resolve(item, node[1])
+        return value if value is not None else _update_value(node[2], item)
+    first, second = _update_value(node[1], item), _update_value(node[2], item)
+    if kind == 'list_append':
+        if 'L' not in first or 'L' not in second:
+            raise ExpressionError('An operand in the update expression has an incorrect data type')
+        return {'L': first['L'] + second['L']}
+    if 'N' not in first or 'N' not in second:
+        raise ExpressionError('An operand in the update expression has an incorrect data type')
+    result = Decimal(first['N']) + Decimal(second['N']) if kind == 'plus' else Decimal(first['N']) - Decimal(second['N'])
+    return {'N': str(result)}
+
+
+def _parent(item: dict, path: Path) -> dict | list:
+    if len(path) == 1:
+        return item
+    parent = resolve(item, path[:-1])
+    container = 'L' if isinstance(path[-1], int) else 'M'
+    if parent is None or container not in parent:
+        raise ExpressionError('The document path provided in the update expression is invalid for update')
+    return parent[container]
+
+
+def _set(item: dict, path: Path, value: dict) -> None:
+    parent = _parent(item, path)
+    part = path[-1]
+    if isinstance(parent, list):
+        if part >= len(parent):
+            parent.append(value)
+        else:
+            parent[part] = value
+    else:
+        parent[part] = value
+
+
+def _remove(item: dict, path: Path) -> None:
+    try:
+        parent = _parent(item, path)
+    except ExpressionError:
+        return
+    part = path[-1]
+    if isinstance(parent, list):
+        if part < len(parent):
+            del parent[part]
+    else:
+        parent.pop(part, None)
+
+
+def _add(item: dict, path: Path, value: dict) -> None:
+    current = resolve(item, path)
+    value_type = _type_of(value)
+    if value_type not in ('N', 'SS', 'NS', 'BS'):
+        raise ExpressionError('An operand in the update expression has an incorrect data type')
+    if current is None:
+        _set(item, path, value)
+    elif value_type != _type_of(current):
+        raise ExpressionError('An operand in the update expression has an incorrect data type')
+    elif value_type == 'N':
+        _set(item, path, {'N': str(Decimal(current['N']) + Decimal(value['N']))})
+    else:
+        merged = list(current[value_type])
+        merged.extend(element for element in value[value_type] if element not in merged)
+        _set(item, path, {value_type: merged})
+
+
+def _delete(item: dict, path: Path, value: dict) -> None:
+    current = resolve(item, path)
+    value_type = _type_of(value)
+    if value_type not in ('SS', 'NS', 'BS'):
+        raise ExpressionError('An operand in the update expression has an incorrect data type')
+    if current is None:
+        return
+    if value_type != _type_of(current):
+        raise ExpressionError('An operand in the update expression has an incorrect data type')
+    left = [element for element in current[value_type] if element not in value[value_type]]
+    if left:
+        _set(item, path, {value_type: left})
+    else:
+        _remove(item, path)
+
+
+def apply_update(item: dict, actions: list[tuple]) -> None:
+    """
+    Применяет действия update к item на месте.
+    Значения SET вычисляются по item до изменений, как в DynamoDB.
+    """
+    resolved = [
+        (action[0], action[1], _update_value(action[2], item) if action[0] == 'SET' else action[2:])
+        for action in actions
+    ]
+    for clause, path, value in resolved:
+        if clause == 'SET':
+            _set(item, path, value)
+        elif clause == 'REMOVE':
+            _remove(item, path)
+        elif clause == 'ADD':
+            _add(item, path, value[0])
+        else:
+            _delete(item, path, value[0])
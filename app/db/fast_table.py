@@ -0,0 +1,73 @@
+from boto3.dynamodb.conditions import ConditionBase, ConditionExpressionBuilder
+
+from app.db.marshal import marshal_item, unmarshal_item
+
+
+class _TableMeta:
+    def __init__(self, client):
+        self.client = client
+
+
+class FastTable:
+    """
+    Таблица поверх низкоуровневого клиента aiobotocore без слоя boto3 resource.
+
+    Методы и параметры как у aioboto3 Table (get_item, put_item, update_item,
+    delete_item, query, scan), поэтому таблицу можно передать в app.db.crud.common
+    и DynamoDBStorage. Значения преобразуются app.db.marshal: целые числа читаются
+    как int, дробные - как Decimal.
+    """
+
+    def __init__(self, client, name: str):
+        self.name = name
+        self.table_name = name
+        self.meta = _TableMeta(client)
+
+    def _request(self, params: dict) -> dict:
+        params = {**params, 'TableName': self.name}
+        names = params.get('ExpressionAttributeNames')
+        values = params.get('ExpressionAttributeValues')
+        builder = None
+        for field in ('KeyConditionExpression', 'FilterExpression', 'ConditionExpression'):
+            condition = params.get(field)
+            if isinstance(condition, ConditionBase):
+                builder = builder or ConditionExpressionBuilder()
+                built = builder.build_expression(condition, is_key_condition=field == 'KeyConditionExpression')
+                params[field] = built.condition_expression
+                names = {**(names or {}), **built.attribute_name_placeholders}
+                values = {**(values or {}), **built.attribute_value_placeholders}
+        if names:
+            params['ExpressionAttributeNames'] = names
+        if values:
+            params['ExpressionAttributeValues'] = marshal_item(values)
+        for field in ('Key', 'Item', 'ExclusiveStartKey'):
+            if field in params:
+                params[field] = marshal_item(params[field])
+        return params
+
+    @staticmethod
+    def _response(response: dict) -> dict:
+        for field in ('Item', 'Attributes', 'LastEvaluatedKey'):
+            if field in response:
+                response[field] = unmarshal_item(response[field])
+        if 'Items' in response:
+            response['Items'] = [unmarshal_item(item) for item in response['Items']]
+        return response
+
+    async def get_item(self, **params) -> dict:
+        return self._response(await self.meta.client.get_item(**self._request(params)))
+
+    async def put_item(self, **params) -> dict:
+        return self._response(await self.meta.client.put_item(**self._request(params)))
+
+    async def update_item(self, **params) -> dict:
+        return self._response(await self.meta.client.update_item(**self._request(params)))
+
+    async def delete_item(self, **params) -> dict:
+        return self._response(await self.meta.client.delete_item(**self._request(params)))
+
+    async def query(self, **params) -> dict:
+        return self._response(await self.meta.client.query(**self._request(params)))
+
+    async def scan(self, **params) -> dict:
+        return self._response(await self.meta.client.scan(**self._request(params)))
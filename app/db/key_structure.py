@@ -1,5 +1,251 @@
+"""
+Схема ключей общей таблицы.
+
+Все сущности лежат в одной таблице с ключом partkey / sortkey. EntityKeys
+описывает ключи сущности (и её атрибуты в GSI) форматами, которые разбираются
+один раз при импорте. AccessPattern объявляет листинг, который нужен
+приложению, как Query по партиции основной таблицы или GSI, поэтому цена
+листинга зависит от размера результата, а не таблицы. Новый листинг
+добавляется сюда в ACCESS_PATTERNS, а не делается через scan.
+
+GSI объявляется в INDEXES; create_table заводит его только у новой таблицы,
+у существующей его создаёт `python -m app.db.maintenance ensure-indexes`.
+"""
+import re
+import typing as t
+from string import Formatter
+
 table_partkey = 'partkey'
 table_sortkey = 'sortkey'
 
 client_partkey = 'client'
+# публичный формат прежних вызовов client_sortkey.format(telegramID=...);
+# CLIENT собирает тот же ключ из поля telegram_id
 client_sortkey = '{telegramID}'
+
+fsm_partkey = 'fsm_{bot_id}'
+fsm_sortkey = '{user_id}'
+
+# GSI общей таблицы: имя -> (hash атрибут, range атрибут)
+INDEXES: dict[str, tuple[str, str]] = {
+    'gsi1': ('gsi1pk', 'gsi1sk'),
+}
+
+
+class KeyStructureError(KeyError):
+    pass
+
+
+class KeyFormat:
+    """
+    Формат значения ключа вида `order_{telegram_id}`.
+
+    Шаблон разбирается один раз: значение собирается bound методом str.format,
+    для begins_with есть prefix (начало ключа до первого незаданного поля),
+    parse разбирает готовый ключ обратно в поля.
+    """
+
+    def __init__(self, template: str):
+        self.template = template
+        self._segments: list[tuple[str, str | None, t.Callable[..., str] | None]] = []
+        pattern = []
+        for literal, field, spec, conversion in Formatter().parse(template):
+            if conversion:
+                raise ValueError(f'Key format {template!r} must not use conversions')
+            pattern.append(re.escape(literal))
+            if field is None:
+                self._segments.append((literal, None, None))
+                continue
+            if not field.isidentifier():
+                raise ValueError(f'Key format {template!r} has invalid field {field!r}')
+            self._segments.append((literal, field, ('{0:' + spec + '}').format))
+            pattern.append(f'(?P<{field}>.+?)')
+        self.fields = tuple(field for _, field, _ in self._segments if field is not None)
+        self._format = template.format
+        self._regex = re.compile(''.join(pattern))
+
+    def __repr__(self) -> str:
+        return f'KeyFormat({self.template!r})'
+
+    def __call__(self, **fields: t.Any) -> str:
+        try:
+            return self._format(**fields)
+        except KeyError as e:
+            raise KeyStructureError(f'Key {self.template!r} requires field {e.args[0]!r}') from None
+
+    def prefix(self, **fields: t.Any) -> str:
+        parts = []
+        for literal, field, format_field in self._segments:
+            parts.append(literal)
+            if field is None or field not in fields:
+                break
+            parts.append(format_field(fields[field]))
+        return ''.join(parts)
+
+    def parse(self, value: str) -> dict[str, str]:
+        match = self._regex.fullmatch(value)
+        if match is None:
+            raise KeyStructureError(f'{value!r} does not match key {self.template!r}')
+        return match.groupdict()
+
+
+class EntityKeys:
+    """Ключи сущности в основной таблице и в GSI (`indexes`: имя GSI -> форматы ключей)"""
+
+    def __init__(
+        self,
+        name: str,
+        partkey: str,
+        sortkey: str,
+        indexes: dict[str, tuple[str, str]] | None = None,
+    ):
+        self.name = name
+        self.partkey = KeyFormat(partkey)
+        self.sortkey = KeyFormat(sortkey)
+        self.indexes = {
+            index: (KeyFormat(index_partkey), KeyFormat(index_sortkey))
+            for index, (index_partkey, index_sortkey) in (indexes or {}).items()
+        }
+        for index in self.indexes:
+            if index not in INDEXES:
+                raise ValueError(f'Entity {name} uses unknown index {index}')
+
+    def __repr__(self) -> str:
+        return f'EntityKeys({self.name!r}, {self.partkey.template!r}, {self.sortkey.template!r})'
+
+    def key(self, **fields: t.Any) -> dict[str, str]:
+        return {table_partkey: self.partkey(**fields), table_sortkey: self.sortkey(**fields)}
+
+    def index_key(self, index: str, **fields: t.Any) -> dict[str, str]:
+        index_partkey, index_sortkey = self.indexes[index]
+        partkey_attribute, sortkey_attribute = INDEXES[index]
+        return {partkey_attribute: index_partkey(**fields), sortkey_attribute: index_sortkey(**fields)}
+
+    def item(self, payload: dict, **fields: t.Any) -> dict:
+        """Item для put_item: payload, ключ таблицы и ключи всех GSI сущности"""
+        item = {**payload, **self.key(**fields)}
+        for index in self.indexes:
+            item.update(self.index_key(index, **fields))
+        return item
+
+    def parse(self, item: dict) -> dict[str, str]:
+        """Поля ключа из partkey и sortkey item"""
+        return {**self.partkey.parse(item[table_partkey]), **self.sortkey.parse(item[table_sortkey])}
+
+
+class AccessPattern:
+    """
+    Листинг сущности: Query по партиции основной таблицы (index=None) или GSI.
+
+    Поля из партиционного ключа обязательны; поля sortkey задают префикс для
+    begins_with, пока идут подряд от начала. newest_first - обратный порядок sortkey.
+    """
+
+    def __init__(self, name: str, entity: EntityKeys, index: str | None = None, newest_first: bool = False):
+        if index is not None and index not in entity.indexes:
+            raise ValueError(f'Entity {entity.name} is not stored in index {index}')
+        self.name = name
+        self.entity = entity
+        self.index = index
+        self.newest_first = newest_first
+        if index is None:
+            self.attributes = (table_partkey, table_sortkey)
+            self.partkey, self.sortkey = entity.partkey, entity.sortkey
+        else:
+            self.attributes = INDEXES[index]
+            self.partkey, self.sortkey = entity.indexes[index]
+
+    def __repr__(self) -> str:
+        return f'AccessPattern({self.name!r}, {self.entity.name!r}, index={self.index!r})'
+
+    def query_args(self, **fields: t.Any) -> dict:
+        """Параметры Table.query / iter_query для листинга"""
+        names = {'#pk': self.attributes[0]}
+        values = {':pk': self.partkey(**fields)}
+        condition = '#pk = :pk'
+        prefix = self.sortkey.prefix(**fields)
+        if prefix:
+            names['#sk'] = self.attributes[1]
+            values[':sk'] = prefix
+            condition += ' AND begins_with(#sk, :sk)'
+        query_args = {
+            'KeyConditionExpression': condition,
+            'ExpressionAttributeNames': names,
+            'ExpressionAttributeValues': values,
+        }
+        if self.index is not None:
+            query_args['IndexName'] = self.index
+        if self.newest_first:
+            query_args['ScanIndexForward'] = False
+        return query_args
+
+
+CLIENT = EntityKeys('client', client_partkey, '{telegram_id}')
+ADMIN = EntityKeys('admin', 'admin', '{telegram_id}')
+PRODUCT = EntityKeys(
+    'product', 'product', '{product_id}',
+    indexes={'gsi1': ('product_{category}', '{product_id}')},
+)
+# created_at - unix time, дополненный нулями, чтобы строки сортировались как числа
+ORDER = EntityKeys(
+    'order', 'order_{telegram_id}', '{created_at:012d}_{order_id}',
+    indexes={'gsi1': ('order_status_{status}', '{created_at:012d}_{order_id}')},
+)
+# FSM storage (app.tg.fsm.storage) и compact (app.db.maintenance)
+FSM = EntityKeys('fsm', fsm_partkey, fsm_sortkey)
+
+ENTITIES: dict[str, EntityKeys] = {entity.name: entity for entity in (CLIENT, ADMIN, PRODUCT, ORDER, FSM)}
+
+ACCESS_PATTERNS: dict[str, AccessPattern] = {pattern.name: pattern for pattern in (
+    AccessPattern('clients', CLIENT),
+    AccessPattern('admins', ADMIN),
+    AccessPattern('products', PRODUCT),
+    AccessPattern('products_by_category', PRODUCT, index='gsi1'),
+    AccessPattern('client_orders', ORDER, newest_first=True),
+    AccessPattern('orders_by_status', ORDER, index='gsi1', newest_first=True),
+    AccessPattern('fsm_records', FSM),
+)}
+
+
+def entity(name: str) -> EntityKeys:
+    try:
+        return ENTITIES[name]
+    except KeyError:
+        raise KeyStructureError(f'Unknown entity {name!r}') from None
+
+
+def access_pattern(name: str) -> AccessPattern:
+    try:
+        return ACCESS_PATTERNS[name]
+    except KeyError:
+        raise KeyStructureError(f'Unknown access pattern {name!r}') from None
+
+
+def table_schema() -> dict:
+    """
+    AttributeDefinitions, KeySchema и GlobalSecondaryIndexes (если GSI объявлены)
+    для create_table общей таблицы
+    """
+    attributes = [table_partkey, table_sortkey]
+    indexes = []
+    for index, (partkey_attribute, sortkey_attribute) in INDEXES.items():
+        attributes += [partkey_attribute, sortkey_attribute]
+        indexes.append({
+            'IndexName': index,
+            'KeySchema': [
+                {'AttributeName': partkey_attribute, 'KeyType': 'HASH'},
+                {'AttributeName': sortkey_attribute, 'KeyType': 'RANGE'},
+            ],
+            'Projection': {'ProjectionType': 'ALL'},
+        })
+    schema = {
+        'AttributeDefinitions': [{'AttributeName': name, 'AttributeType': 'S'} for name in attributes],
+        'KeySchema': [
+            {'AttributeName': table_partkey, 'KeyType': 'HASH'},
+            {'AttributeName': table_sortkey, 'KeyType': 'RANGE'},
+        ],
+    }
+    # пустой список GlobalSecondaryIndexes create_table не принимает
+    if indexes:
+        schema['GlobalSecondaryIndexes'] = indexes
+    return schema
@@ -0,0 +1,463 @@
+"""
+Обслуживание общей таблицы: выгрузка в JSONL, загрузка из JSONL, очистка и
+удаление истёкших FSM items.
+
+Чтение идёт параллельным scan по сегментам, запись - параллельными BatchWriteItem.
+Выгрузка в формате DynamoDB JSON, как у экспорта DynamoDB: строка `{"Item": {...}}`
+с типизированными значениями, бинарные значения в base64. Так без потерь
+переносятся числа, множества и бинарные атрибуты (например, data_bin FSM).
+compact читает только раздел FSM бота через query и удаляет items по одному
+DeleteItem с условием.
+
+migrate-fsm переносит FSM из старой раскладки (state в `state_{bot_id}`, data в
+`data_state_{bot_id}`) в один item `fsm_{bot_id}` / `{user_id}`. Storage старые
+items не читает, поэтому команду нужно выполнить при выкладке версии с новой
+раскладкой, иначе пользователи потеряют текущие состояния и data.
+
+    python -m app.db.maintenance export --file dump.jsonl
+    python -m app.db.maintenance import --file dump.jsonl
+    python -m app.db.maintenance truncate --endpoint http://localhost:9010
+    python -m app.db.maintenance compact [--older-than 604800]
+    python -m app.db.maintenance enable-ttl
+    python -m app.db.maintenance ensure-indexes
+    python -m app.db.maintenance migrate-fsm
+"""
+import argparse
+import asyncio
+import base64
+import json
+import time
+import typing as t
+from decimal import Decimal
+
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.exceptions import ClientError
+
+from app.config import settings
+from app.core.log_config import logger
+from app.db import key_structure
+from app.db.connection import DynamoConnectionManager, dynamo_manager
+from app.db.crud.common import BATCH_WRITE_LIMIT, batch_write_items, iter_pattern, iter_query, iter_scan_pages
+from app.db.marshal import marshal_item
+from app.tg.fsm.expiry import EXPIRES_ATTRIBUTE
+
+# раскладка FSM до единого item fsm_{bot_id}: state и data в разных партициях
+LEGACY_STATE_PARTKEY = 'state_{bot_id}'
+LEGACY_DATA_PARTKEY = 'data_state_{bot_id}'
+
+DEFAULT_SEGMENTS = 8
+DEFAULT_WORKERS = 8
+
+_deserializer = TypeDeserializer()
+
+
+class Progress:
+    """Считает обработанные items и раз в interval секунд пишет скорость в лог"""
+
+    def __init__(self, operation: str, interval: float = 2.0):
+        self.operation = operation
+        self.interval = interval
+        self.count = 0
+        self.started = time.monotonic()
+        self._last_report = self.started
+
+    def add(self, count: int) -> None:
+        self.count += count
+        now = time.monotonic()
+        if now - self._last_report >= self.interval:
+            self._last_report = now
+            self.report()
+
+    def report(self, final: bool = False) -> None:
+        elapsed = time.monotonic() - self.started
+        rate = self.count / elapsed if elapsed else 0.0
+        status = 'DONE' if final else 'progress'
+        logger.info(f'{self.operation} {status}: {self.count} items, {elapsed:.1f}s, {rate:.0f} items/s')
+
+
+def _encode_attribute(attribute: dict) -> dict:
+    ((kind, raw),) = attribute.items()
+    match kind:
+        case 'B':
+            return {'B': base64.b64encode(raw).decode()}
+        case 'BS':
+            return {'BS': [base64.b64encode(item).decode() for item in raw]}
+        case 'M':
+            return {'M': {name: _encode_attribute(item) for name, item in raw.items()}}
+        case 'L':
+            return {'L': [_encode_attribute(item) for item in raw]}
+    return attribute
+
+
+def _decode_attribute(attribute: dict) -> dict:
+    ((kind, raw),) = attribute.items()
+    match kind:
+        case 'B':
+            return {'B': base64.b64decode(raw)}
+        case 'BS':
+            return {'BS': [base64.b64decode(item) for item in raw]}
+        case 'M':
+            return {'M': {name: _decode_attribute(item) for name, item in raw.items()}}
+        case 'L':
+            return {'L': [_decode_attribute(item) for item in raw]}
+    return attribute
+
+
+def dump_item(item: dict) -> str:
+    """Строка выгрузки: item в DynamoDB JSON"""
+    typed = {name: _encode_attribute(value) for name, value in marshal_item(item).items()}
+    return json.dumps({'Item': typed}, ensure_ascii=False)
+
+
+def load_item(line: str) -> dict:
+    """
+    Item из строки выгрузки. Числа читаются как Decimal без потери точности.
+    Строки без `Item` - выгрузки старого формата, обычный JSON.
+    """
+    record = json.loads(line, parse_float=Decimal)
+    if 'Item' not in record:
+        return record
+    return {name: _deserializer.deserialize(_decode_attribute(value)) for name, value in record['Item'].items()}
+
+
+async def _write_batches(
+    batches: t.AsyncIterator[list[dict]],
+    write: t.Callable[[list[dict]], t.Awaitable[t.Any]],
+    workers: int,
+) -> None:
+    """Запускает write для каждой пачки, одновременно не больше workers"""
+    semaphore = asyncio.Semaphore(workers)
+    tasks: set[asyncio.Task] = set()
+    errors: list[BaseException] = []
+
+    def on_done(task: asyncio.Task) -> None:
+        tasks.discard(task)
+        semaphore.release()
+        if not task.cancelled() and task.exception() is not None:
+            errors.append(task.exception())
+
+    try:
+        async for batch in batches:
+            await semaphore.acquire()
+            if errors:
+                semaphore.release()
+                break
+            task = asyncio.create_task(write(batch))
+            tasks.add(task)
+            task.add_done_callback(on_done)
+        await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        for task in list(tasks):
+            task.cancel()
+    if errors:
+        raise errors[0]
+
+
+async def _chunked(items: t.AsyncIterator[dict], size: int) -> t.AsyncIterator[list[dict]]:
+    chunk = []
+    async for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+async def export_table(
+    table,
+    path: str,
+    *,
+    segments: int = DEFAULT_SEGMENTS,
+    workers: int = DEFAULT_WORKERS,
+) -> int:
+    progress = Progress(f'export {table.name}')
+    with open(path, 'w', encoding='utf-8') as file:
+        async for page in iter_scan_pages(table, segments=segments, max_workers=workers):
+            file.writelines(dump_item(item) + '\n' for item in page)
+            progress.add(len(page))
+    progress.report(final=True)
+    return progress.count
+
+
+async def import_table(
+    table,
+    path: str,
+    *,
+    workers: int = DEFAULT_WORKERS,
+) -> int:
+    progress = Progress(f'import {table.name}')
+
+    async def read_items() -> t.AsyncIterator[dict]:
+        with open(path, encoding='utf-8') as file:
+            for line in file:
+                if line.strip():
+                    yield load_item(line)
+
+    async def write(batch: list[dict]) -> None:
+        await batch_write_items(table, put_items=batch, max_concurrency=1)
+        progress.add(len(batch))
+
+    await _write_batches(_chunked(read_items(), BATCH_WRITE_LIMIT), write, workers)
+    progress.report(final=True)
+    return progress.count
+
+
+async def truncate_table(
+    table,
+    *,
+    segments: int = DEFAULT_SEGMENTS,
+    workers: int = DEFAULT_WORKERS,
+) -> int:
+    progress = Progress(f'truncate {table.name}')
+
+    async def write(batch: list[dict]) -> None:
+        await batch_write_items(table, delete_keys=batch, max_concurrency=1)
+        progress.add(len(batch))
+
+    async def keys() -> t.AsyncIterator[dict]:
+        async for page in iter_scan_pages(
+            table,
+            segments=segments,
+            max_workers=workers,
+            projection=['partkey', 'sortkey'],
+        ):
+            for item in page:
+                yield item
+
+    await _write_batches(_chunked(keys(), BATCH_WRITE_LIMIT), write, workers)
+    progress.report(final=True)
+    return progress.count
+
+
+async def compact_fsm(
+    table,
+    bot_id: int,
+    *,
+    now: int | None = None,
+    older_than: int | None = None,
+    workers: int = DEFAULT_WORKERS,
+) -> int:
+    """
+    Удаляет истёкшие FSM items бота, не дожидаясь DynamoDB TTL.
+
+    older_than - ещё и items без expires_at (записанные до включения срока жизни),
+    состояние которых не менялось столько секунд. Каждый item удаляется отдельным
+    DeleteItem с тем же условием, что и фильтр query: item, который продлили или
+    записали заново между query и удалением, остаётся. Возвращает число удалённых.
+    """
+    now = int(time.time()) if now is None else now
+    names = {'#expires': EXPIRES_ATTRIBUTE}
+    values = {':now': now}
+    filter_expression = '#expires <= :now'
+    if older_than is not None:
+        names['#time'] = 'time'
+        values[':cutoff'] = now - older_than
+        filter_expression += ' OR (attribute_not_exists(#expires) AND #time <= :cutoff)'
+    progress = Progress(f'compact {table.name} fsm_{bot_id}')
+
+    async def write(batch: list[dict]) -> None:
+        # BatchWriteItem не поддерживает условия, поэтому DeleteItem по одному
+        for key in batch:
+            try:
+                await table.delete_item(
+                    Key=key,
+                    ConditionExpression=filter_expression,
+                    ExpressionAttributeNames=names,
+                    ExpressionAttributeValues=values,
+                )
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+                    raise
+                continue
+            progress.add(1)
+
+    keys = iter_pattern(
+        table,
+        'fsm_records',
+        bot_id=bot_id,
+        projection=[key_structure.table_partkey, key_structure.table_sortkey],
+        filter_expression=filter_expression,
+        filter_names=names,
+        filter_values=values,
+    )
+    await _write_batches(_chunked(keys, BATCH_WRITE_LIMIT), write, workers)
+    progress.report(final=True)
+    return progress.count
+
+
+async def _legacy_partition(table, partkey: str) -> dict[str, dict]:
+    items = iter_query(
+        table,
+        KeyConditionExpression='#pk = :pk',
+        ExpressionAttributeNames={'#pk': key_structure.table_partkey},
+        ExpressionAttributeValues={':pk': partkey},
+    )
+    return {item[key_structure.table_sortkey]: item async for item in items}
+
+
+async def migrate_fsm(
+    table,
+    bot_id: int,
+    *,
+    now: int | None = None,
+    workers: int = DEFAULT_WORKERS,
+) -> int:
+    """
+    Переносит FSM бота из старой раскладки в items `fsm_{bot_id}` / `{user_id}`.
+
+    state берётся из `state_{bot_id}`, data - из `data_state_{bot_id}` (атрибуты item
+    кроме ключа) и пишется map атрибутом data, который storage читает при любом
+    FSM_DATA_CODEC. Новый item пишется с условием attribute_not_exists: item,
+    который бот уже успел записать сам, не затирается. Старые items удаляются,
+    поэтому повторный запуск ничего не меняет. Возвращает число перенесённых items.
+    """
+    now = int(time.time()) if now is None else now
+    partkey, sortkey = key_structure.table_partkey, key_structure.table_sortkey
+    states = await _legacy_partition(table, LEGACY_STATE_PARTKEY.format(bot_id=bot_id))
+    data = await _legacy_partition(table, LEGACY_DATA_PARTKEY.format(bot_id=bot_id))
+    progress = Progress(f'migrate-fsm {table.name} fsm_{bot_id}')
+
+    async def users() -> t.AsyncIterator[str]:
+        for user_id in states.keys() | data.keys():
+            yield user_id
+
+    async def write(batch: list[str]) -> None:
+        for user_id in batch:
+            state_item = states.get(user_id, {})
+            item = key_structure.FSM.item(
+                {
+                    'time': state_item.get('time', now),
+                    'bot': bot_id,
+                    'user': state_item.get('user', int(user_id)),
+                    'state': state_item.get('state'),
+                    'data': {
+                        name: value for name, value in data.get(user_id, {}).items() if name not in (partkey, sortkey)
+                    },
+                },
+                bot_id=bot_id,
+                user_id=user_id,
+            )
+            try:
+                await table.put_item(
+                    Item=item,
+                    ConditionExpression='attribute_not_exists(#pk)',
+                    ExpressionAttributeNames={'#pk': partkey},
+                )
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+                    raise
+            else:
+                progress.add(1)
+        legacy_keys = [
+            {partkey: legacy[user_id][partkey], sortkey: user_id}
+            for legacy in (states, data) for user_id in batch if user_id in legacy
+        ]
+        await batch_write_items(table, delete_keys=legacy_keys, max_concurrency=1)
+
+    await _write_batches(_chunked(users(), BATCH_WRITE_LIMIT), write, workers)
+    progress.report(final=True)
+    return progress.count
+
+
+async def enable_ttl(client, table_name: str) -> None:
+    """Включает DynamoDB TTL по атрибуту expires_at, который пишет FSM storage"""
+    await client.update_time_to_live(
+        TableName=table_name,
+        TimeToLiveSpecification={'Enabled': True, 'AttributeName': EXPIRES_ATTRIBUTE},
+    )
+
+
+async def ensure_indexes(client, table_name: str, *, poll_interval: float = 5) -> list[str]:
+    """
+    Создаёт GSI из key_structure.table_schema(), которых ещё нет у таблицы:
+    create_table заводит их только у новых таблиц. UpdateTable создаёт один GSI
+    за вызов, поэтому индексы создаются по одному, каждый следующий - после того,
+    как предыдущий стал ACTIVE. Возвращает имена созданных индексов.
+    """
+    schema = key_structure.table_schema()
+    description = (await client.describe_table(TableName=table_name))['Table']
+    existing = {index['IndexName'] for index in description.get('GlobalSecondaryIndexes', [])}
+    provisioned = description.get('BillingModeSummary', {}).get('BillingMode') != 'PAY_PER_REQUEST'
+    created = []
+    for index in schema.get('GlobalSecondaryIndexes', []):
+        if index['IndexName'] in existing:
+            continue
+        if provisioned:
+            throughput = description['ProvisionedThroughput']
+            index = {**index, 'ProvisionedThroughput': {
+                'ReadCapacityUnits': throughput['ReadCapacityUnits'],
+                'WriteCapacityUnits': throughput['WriteCapacityUnits'],
+            }}
+        attributes = {key['AttributeName'] for key in index['KeySchema']}
+        logger.info(f'ensure-indexes {table_name}: creating {index["IndexName"]}')
+        await client.update_table(
+            TableName=table_name,
+            AttributeDefinitions=[
+                definition for definition in schema['AttributeDefinitions'] if definition['AttributeName'] in attributes
+            ],
+            GlobalSecondaryIndexUpdates=[{'Create': index}],
+        )
+        await _wait_index_active(client, table_name, index['IndexName'], poll_interval)
+        created.append(index['IndexName'])
+    return created
+
+
+async def _wait_index_active(client, table_name: str, index_name: str, poll_interval: float) -> None:
+    while True:
+        description = (await client.describe_table(TableName=table_name))['Table']
+        for index in description.get('GlobalSecondaryIndexes', []):
+            if index['IndexName'] == index_name and index.get('IndexStatus') == 'ACTIVE':
+                return
+        await asyncio.sleep(poll_interval)
+
+
+def bot_id_from_token(token: str) -> int:
+    return int(token.split(':', 1)[0])
+
+
+def _parse_args(argv: t.Sequence[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog='python -m app.db.maintenance', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=[
+        'export', 'import', 'truncate', 'compact', 'enable-ttl', 'ensure-indexes', 'migrate-fsm',
+    ])
+    parser.add_argument('--table', default=settings.TABLE_SUFFIX)
+    parser.add_argument('--file', help='JSONL файл для export/import')
+    parser.add_argument('--endpoint', help='endpoint DynamoDB, например http://localhost:9010 для docker-compose')
+    parser.add_argument('--segments', type=int, default=DEFAULT_SEGMENTS)
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--bot-id', type=int, help='для compact и migrate-fsm; по умолчанию из TG_KEY')
+    parser.add_argument('--older-than', type=int, help='compact: секунды без смены состояния для items без срока')
+    args = parser.parse_args(argv)
+    if args.command in ('export', 'import') and not args.file:
+        parser.error(f'{args.command} requires --file')
+    return args
+
+
+async def main(argv: t.Sequence[str] | None = None) -> None:
+    args = _parse_args(argv)
+    manager = DynamoConnectionManager(endpoint_url=args.endpoint) if args.endpoint else dynamo_manager
+    async with manager:
+        table = await manager.table(args.table)
+        match args.command:
+            case 'export':
+                await export_table(table, args.file, segments=args.segments, workers=args.workers)
+            case 'import':
+                await import_table(table, args.file, workers=args.workers)
+            case 'truncate':
+                await truncate_table(table, segments=args.segments, workers=args.workers)
+            case 'compact':
+                bot_id = args.bot_id or bot_id_from_token(settings.TG_KEY)
+                await compact_fsm(table, bot_id, older_than=args.older_than, workers=args.workers)
+            case 'enable-ttl':
+                await enable_ttl(manager.client, args.table)
+            case 'ensure-indexes':
+                await ensure_indexes(manager.client, args.table)
+            case 'migrate-fsm':
+                bot_id = args.bot_id or bot_id_from_token(settings.TG_KEY)
+                await migrate_fsm(table, bot_id, workers=args.workers)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,142 @@
+"""
+Быстрое преобразование python значений в AttributeValue DynamoDB и обратно.
+
+boto3 TypeSerializer/TypeDeserializer универсальны: проверяют типы цепочкой
+isinstance, гоняют числа через Decimal с контекстом и возвращают Decimal.
+Здесь тип выбирается одним поиском по type(value) в таблице.
+
+Числа: целые читаются как int, дробные (и с экспонентой) - как Decimal, как
+у boto3, чтобы цены и суммы не теряли точность. Отличие от boto3 resource
+только в целых: int вместо Decimal. float, как и в boto3, не записывается
+(TypeError): дробные числа передаются Decimal, и поведение не зависит от того,
+через какую таблицу идёт запись.
+"""
+import typing as t
+from decimal import Decimal
+
+from boto3.dynamodb.types import Binary
+
+
+class MarshalError(TypeError):
+    pass
+
+
+def _marshal_str(value: str) -> dict:
+    return {'S': value}
+
+
+def _marshal_bool(value: bool) -> dict:
+    return {'BOOL': value}
+
+
+def _marshal_number(value) -> dict:
+    return {'N': str(value)}
+
+
+def _marshal_float(value: float) -> dict:
+    raise MarshalError('Float types are not supported. Use Decimal types instead.')
+
+
+def _marshal_none(_) -> dict:
+    return {'NULL': True}
+
+
+def _marshal_bytes(value) -> dict:
+    return {'B': bytes(value)}
+
+
+def _marshal_binary(value: Binary) -> dict:
+    return {'B': value.value}
+
+
+def _marshal_map(value: dict) -> dict:
+    return {'M': {name: marshal_value(item) for name, item in value.items()}}
+
+
+def _marshal_list(value) -> dict:
+    return {'L': [marshal_value(item) for item in value]}
+
+
+def _marshal_set(value) -> dict:
+    if not value:
+        raise MarshalError('DynamoDB does not support empty sets')
+    kinds = {type(item) for item in value}
+    if kinds == {str}:
+        return {'SS': list(value)}
+    if kinds <= {int, Decimal}:
+        return {'NS': [str(item) for item in value]}
+    if kinds <= {bytes, bytearray}:
+        return {'BS': [bytes(item) for item in value]}
+    raise MarshalError(f'Unsupported set item types: {kinds}')
+
+
+_MARSHALLERS: dict[type, t.Callable[[t.Any], dict]] = {
+    str: _marshal_str,
+    bool: _marshal_bool,
+    int: _marshal_number,
+    Decimal: _marshal_number,
+    float: _marshal_float,
+    type(None): _marshal_none,
+    bytes: _marshal_bytes,
+    bytearray: _marshal_bytes,
+    Binary: _marshal_binary,
+    dict: _marshal_map,
+    list: _marshal_list,
+    tuple: _marshal_list,
+    set: _marshal_set,
+    frozenset: _marshal_set,
+}
+
+
+def marshal_value(value: t.Any) -> dict:
+    marshaller = _MARSHALLERS.get(type(value))
+    if marshaller is None:
+        # подклассы (enum.StrEnum, OrderedDict) - медленный, но общий путь
+        for base, candidate in _MARSHALLERS.items():
+            if isinstance(value, base):
+                marshaller = candidate
+                break
+        else:
+            raise MarshalError(f'Unsupported type for DynamoDB: {type(value).__name__}')
+    return marshaller(value)
+
+
+def marshal_item(item: dict) -> dict:
+    return {name: marshal_value(value) for name, value in item.items()}
+
+
+def _number(raw: str) -> int | Decimal:
+    try:
+        return int(raw)
+    except ValueError:
+        return Decimal(raw)
+
+
+def unmarshal_value(attribute: dict) -> t.Any:
+    ((kind, raw),) = attribute.items()
+    match kind:
+        case 'S':
+            return raw
+        case 'N':
+            return _number(raw)
+        case 'M':
+            return {name: unmarshal_value(item) for name, item in raw.items()}
+        case 'L':
+            return [unmarshal_value(item) for item in raw]
+        case 'BOOL':
+            return raw
+        case 'NULL':
+            return None
+        case 'B':
+            return bytes(raw)
+        case 'SS':
+            return set(raw)
+        case 'NS':
+            return {_number(item) for item in raw}
+        case 'BS':
+            return {bytes(item) for item in raw}
+    raise MarshalError(f'Unknown DynamoDB attribute type {kind}')
+
+
+def unmarshal_item(item: dict) -> dict:
+    return {name: unmarshal_value(value) for name, value in item.items()}
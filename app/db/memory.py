@@ -0,0 +1,701 @@
+"""
+DynamoDB в памяти процесса для тестов, бенчмарков и локальной разработки.
+
+MemoryDynamoDB повторяет нужную приложению часть API aioboto3: клиент
+(get/put/update/delete_item, query, scan, batch_get_item, batch_write_item,
+transact_write_items, describe/list/create/update_table) и resource с Table,
+у которого есть meta.client. Схема ключа всегда partkey / sortkey из
+app.db.key_structure, query поддерживает IndexName для GSI с ключом HASH + RANGE.
+Items хранятся в формате AttributeValue, ошибки отдаются как botocore
+ClientError с кодами настоящей DynamoDB.
+
+Включается адресом базы `memory://` (например YC_DATABASE_URL=memory://?latency_ms=5):
+latency_ms добавляет задержку на каждый запрос, чтобы нагрузочные тесты
+отделяли накладные расходы приложения от сети.
+"""
+import asyncio
+import bisect
+import typing as t
+import zlib
+from decimal import Decimal
+from urllib.parse import parse_qs, urlsplit
+
+from boto3.dynamodb.conditions import ConditionBase, ConditionExpressionBuilder
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+from botocore.exceptions import ClientError
+
+from app.db import key_structure
+from app.db.expressions import (
+    ExpressionContext,
+    ExpressionError,
+    apply_update,
+    evaluate,
+    parse_condition,
+    parse_projection,
+    parse_update,
+    project,
+)
+
+KEY_ATTRIBUTES = (key_structure.table_partkey, key_structure.table_sortkey)
+BATCH_GET_LIMIT = 100
+BATCH_WRITE_LIMIT = 25
+TRANSACT_LIMIT = 100
+
+_serializer = TypeSerializer()
+_deserializer = TypeDeserializer()
+
+
+def _error(operation: str, code: str, message: str, **extra: t.Any) -> ClientError:
+    response = {
+        'Error': {'Code': code, 'Message': message},
+        'ResponseMetadata': {'HTTPStatusCode': 400},
+        **extra,
+    }
+    return ClientError(response, operation)
+
+
+def _index_attributes(operation: str, index: dict) -> tuple[str, str]:
+    schema = {key['KeyType']: key['AttributeName'] for key in index['KeySchema']}
+    if set(schema) != {'HASH', 'RANGE'}:
+        raise _error(operation, 'ValidationException',
+                     f'Memory tables only support indexes with HASH and RANGE keys: {index["IndexName"]}')
+    return schema['HASH'], schema['RANGE']
+
+
+def _sortable(value: dict) -> tuple:
+    kind, raw = next(iter(value.items()))
+    if kind == 'N':
+        return kind, Decimal(raw)
+    return kind, raw
+
+
+def _copy(value):
+    # AttributeValue - только dict, list и неизменяемые значения; быстрее copy.deepcopy
+    if type(value) is dict:
+        return {name: _copy(item) for name, item in value.items()}
+    if type(value) is list:
+        return [_copy(item) for item in value]
+    return value
+
+
+class _TableData:
+    """
+    Items одной таблицы и индексы: ключи по партициям, общий порядок для scan
+    и партиции GSI. В GSI попадают только items, у которых есть оба ключа индекса.
+    """
+
+    def __init__(self, name: str, indexes: dict[str, tuple[str, str]] | None = None):
+        self.name = name
+        self.items: dict[tuple, dict] = {}
+        self.partitions: dict[tuple, list[tuple]] = {}
+        self.order: list[tuple] = []
+        self.indexes = dict(key_structure.INDEXES if indexes is None else indexes)
+        self.index_partitions: dict[str, dict[tuple, list[tuple]]] = {index: {} for index in self.indexes}
+
+    def key_of(self, operation: str, key: dict, exact: bool = True) -> tuple:
+        if exact and set(key) != set(KEY_ATTRIBUTES):
+            raise _error(operation, 'ValidationException',
+                         'The provided key element does not match the schema')
+        try:
+            partkey, sortkey = (key[name] for name in KEY_ATTRIBUTES)
+        except KeyError:
+            raise _error(operation, 'ValidationException',
+                         'One or more parameter values were invalid: Missing the key partkey or sortkey in the item')
+        for value in (partkey, sortkey):
+            if not isinstance(value, dict) or len(value) != 1 or next(iter(value)) not in ('S', 'N', 'B'):
+                raise _error(operation, 'ValidationException',
+                             'One or more parameter values were invalid: Type mismatch for key')
+        return _sortable(partkey), _sortable(sortkey)
+
+    def get(self, key: tuple) -> dict | None:
+        return self.items.get(key)
+
+    def _index_entries(self, key: tuple, item: dict) -> t.Iterator[tuple[dict, tuple, tuple]]:
+        for index, (partkey, sortkey) in self.indexes.items():
+            if partkey in item and sortkey in item:
+                yield self.index_partitions[index], _sortable(item[partkey]), (_sortable(item[sortkey]), key)
+
+    def add_index(self, index: str, attributes: tuple[str, str]) -> None:
+        """Новый GSI сразу заполняется items таблицы, как после backfill в DynamoDB"""
+        self.indexes[index] = attributes
+        partitions = self.index_partitions[index] = {}
+        partkey, sortkey = attributes
+        for key, item in self.items.items():
+            if partkey in item and sortkey in item:
+                bisect.insort(partitions.setdefault(_sortable(item[partkey]), []), (_sortable(item[sortkey]), key))
+
+    def put(self, key: tuple, item: dict) -> None:
+        old = self.items.get(key)
+        if old is None:
+            bisect.insort(self.partitions.setdefault(key[0], []), key[1])
+            bisect.insort(self.order, key)
+        else:
+            self._unindex(key, old)
+        self.items[key] = item
+        for partitions, partkey, entry in self._index_entries(key, item):
+            bisect.insort(partitions.setdefault(partkey, []), entry)
+
+    def _unindex(self, key: tuple, item: dict) -> None:
+        for partitions, partkey, entry in self._index_entries(key, item):
+            partition = partitions[partkey]
+            del partition[bisect.bisect_left(partition, entry)]
+            if not partition:
+                del partitions[partkey]
+
+    def delete(self, key: tuple) -> dict | None:
+        item = self.items.pop(key, None)
+        if item is not None:
+            partition = self.partitions[key[0]]
+            del partition[bisect.bisect_left(partition, key[1])]
+            if not partition:
+                del self.partitions[key[0]]
+            del self.order[bisect.bisect_left(self.order, key)]
+            self._unindex(key, item)
+        return item
+
+    def describe(self) -> dict:
+        description = {
+            'TableName': self.name,
+            'TableStatus': 'ACTIVE',
+            'ItemCount': len(self.items),
+            'KeySchema': [
+                {'AttributeName': KEY_ATTRIBUTES[0], 'KeyType': 'HASH'},
+                {'AttributeName': KEY_ATTRIBUTES[1], 'KeyType': 'RANGE'},
+            ],
+            'AttributeDefinitions': [
+                {'AttributeName': KEY_ATTRIBUTES[0], 'AttributeType': 'S'},
+                {'AttributeName': KEY_ATTRIBUTES[1], 'AttributeType': 'S'},
+            ],
+            'BillingModeSummary': {'BillingMode': 'PAY_PER_REQUEST'},
+        }
+        if self.indexes:
+            description['GlobalSecondaryIndexes'] = [
+                {
+                    'IndexName': index,
+                    'KeySchema': [
+                        {'AttributeName': partkey, 'KeyType': 'HASH'},
+                        {'AttributeName': sortkey, 'KeyType': 'RANGE'},
+                    ],
+                    'Projection': {'ProjectionType': 'ALL'},
+                    'IndexStatus': 'ACTIVE',
+                }
+                for index, (partkey, sortkey) in self.indexes.items()
+            ]
+        return description
+
+
+class MemoryDynamoDB:
+    """
+    Набор таблиц в памяти. Все операции синхронны внутри одного цикла событий,
+    поэтому условия и транзакции атомарны без блокировок.
+
+    latency - секунды задержки на запрос или функция от имени операции.
+    auto_create - таблица создаётся при первом обращении, как будто её уже завели
+    со схемой app.db.key_structure, вместе с её GSI.
+    """
+
+    def __init__(
+        self,
+        latency: float | t.Callable[[str], float] = 0.0,
+        auto_create: bool = True,
+    ):
+        self.latency = latency
+        self.auto_create = auto_create
+        self.tables: dict[str, _TableData] = {}
+        self.request_hooks: list[t.Callable[[str], t.Any]] = []
+
+    @classmethod
+    def from_url(cls, endpoint_url: str) -> 'MemoryDynamoDB':
+        query = parse_qs(urlsplit(str(endpoint_url)).query)
+        latency_ms = float(query.get('latency_ms', ['0'])[0])
+        return cls(latency=latency_ms / 1000)
+
+    def client(self) -> 'MemoryClient':
+        return MemoryClient(self)
+
+    def resource(self) -> 'MemoryResource':
+        return MemoryResource(self.client())
+
+    def table_data(self, operation: str, name: str) -> _TableData:
+        data = self.tables.get(name)
+        if data is None:
+            if not self.auto_create:
+                raise _error(operation, 'ResourceNotFoundException', f'Requested resource not found: Table: {name} not found')
+            data = self.tables[name] = _TableData(name)
+        return data
+
+    async def request(self, operation: str) -> None:
+        for hook in self.request_hooks:
+            hook(operation)
+        latency = self.latency(operation) if callable(self.latency) else self.latency
+        if latency:
+            await asyncio.sleep(latency)
+
+    # операции над items в формате AttributeValue
+
+    def _context(self, params: dict) -> ExpressionContext:
+        return ExpressionContext(params.get('ExpressionAttributeNames'), params.get('ExpressionAttributeValues'))
+
+    def _check_condition(self, operation: str, params: dict, context: ExpressionContext, item: dict | None) -> None:
+        expression = params.get('ConditionExpression')
+        if expression and not evaluate(parse_condition(expression, context), item or {}):
+            raise _error(operation, 'ConditionalCheckFailedException', 'The conditional request failed')
+
+    @staticmethod
+    def _projection(params: dict, context: ExpressionContext):
+        expression = params.get('ProjectionExpression')
+        return parse_projection(expression, context) if expression else None
+
+    def get_item(self, params: dict) -> dict:
+        data = self.table_data('GetItem', params['TableName'])
+        context = self._context(params)
+        projection = self._projection(params, context)
+        context.check_unused()
+        item = data.get(data.key_of('GetItem', params['Key']))
+        if item is None:
+            return {}
+        return {'Item': project(item, projection) if projection else item}
+
+    def put_item(self, params: dict) -> dict:
+        operation = 'PutItem'
+        data = self.table_data(operation, params['TableName'])
+        item = params['Item']
+        key = data.key_of(operation, item, exact=False)
+        context = self._context(params)
+        old = data.get(key)
+        self._check_condition(operation, params, context, old)
+        context.check_unused()
+        data.put(key, _copy(item))
+        if params.get('ReturnValues') == 'ALL_OLD' and old is not None:
+            return {'Attributes': old}
+        return {}
+
+    def update_item(self, params: dict) -> dict:
+        operation = 'UpdateItem'
+        data = self.table_data(operation, params['TableName'])
+        key = data.key_of(operation, params['Key'])
+        context = self._context(params)
+        actions = parse_update(params['UpdateExpression'], context) if params.get('UpdateExpression') else []
+        if any(action[1][0] in KEY_ATTRIBUTES for action in actions):
+            raise ExpressionError('Cannot update attribute partkey or sortkey. This attribute is part of the key')
+        old = data.get(key)
+        self._check_condition(operation, params, context, old)
+        context.check_unused()
+        item = _copy(old) if old is not None else _copy(params['Key'])
+        apply_update(item, actions)
+        data.put(key, item)
+
+        return_values = params.get('ReturnValues', 'NONE')
+        if return_values == 'ALL_NEW':
+            return {'Attributes': item}
+        if return_values == 'ALL_OLD':
+            return {'Attributes': old} if old is not None else {}
+        if return_values in ('UPDATED_NEW', 'UPDATED_OLD'):
+            source = item if return_values == 'UPDATED_NEW' else (old or {})
+            names = {action[1][0] for action in actions}
+            attributes = {name: source[name] for name in names if name in source}
+            return {'Attributes': attributes} if attributes else {}
+        return {}
+
+    def delete_item(self, params: dict) -> dict:
+        operation = 'DeleteItem'
+        data = self.table_data(operation, params['TableName'])
+        key = data.key_of(operation, params['Key'])
+        context = self._context(params)
+        old = data.get(key)
+        self._check_condition(operation, params, context, old)
+        context.check_unused()
+        data.delete(key)
+        if params.get('ReturnValues') == 'ALL_OLD' and old is not None:
+            return {'Attributes': old}
+        return {}
+
+    def _page(self, operation: str, params: dict, keys: t.Iterable[tuple], data: _TableData,
+              context: ExpressionContext, key_filter=None, key_attributes: tuple = KEY_ATTRIBUTES) -> dict:
+        filter_node = parse_condition(params['FilterExpression'], context) if params.get('FilterExpression') else None
+        projection = self._projection(params, context)
+        context.check_unused()
+        limit = params.get('Limit')
+        items, scanned, last_key = [], 0, None
+        keys = iter(keys)
+        for key in keys:
+            item = data.items[key]
+            if key_filter is not None and not key_filter(item):
+                continue
+            scanned += 1
+            if filter_node is None or evaluate(filter_node, item):
+                items.append(project(item, projection) if projection else item)
+            if limit is not None and scanned >= limit:
+                # LastEvaluatedKey только если дальше ещё есть подходящие items
+                if any(key_filter is None or key_filter(data.items[rest]) for rest in keys):
+                    last_key = {name: item[name] for name in key_attributes}
+                break
+        response = {'Count': len(items), 'ScannedCount': scanned}
+        if params.get('Select') != 'COUNT':
+            response['Items'] = items
+        if last_key is not None:
+            response['LastEvaluatedKey'] = last_key
+        return response
+
+    def query(self, params: dict) -> dict:
+        operation = 'Query'
+        data = self.table_data(operation, params['TableName'])
+        context = self._context(params)
+        index = params.get('IndexName')
+        if index is None:
+            partkey_attribute, key_attributes = KEY_ATTRIBUTES[0], KEY_ATTRIBUTES
+        elif index in data.indexes:
+            partkey_attribute = data.indexes[index][0]
+            key_attributes = (*KEY_ATTRIBUTES, *data.indexes[index])
+        else:
+            raise _error(operation, 'ValidationException', f'The table does not have the specified index: {index}')
+        condition = parse_condition(params['KeyConditionExpression'], context)
+        conjuncts = _conjuncts(condition)
+        partition = next(
+            (node for node in conjuncts if node[0] == 'cmp' and node[1] == '='
+             and node[2] == ('path', (partkey_attribute,)) and node[3][0] == 'value'),
+            None,
+        )
+        if partition is None:
+            raise ExpressionError(f'Query condition missed key schema element: {partkey_attribute}')
+        rest = [node for node in conjuncts if node is not partition]
+        partkey = _sortable(partition[3][1])
+        # партиция отсортирована: продолжение ищется bisect по ключу сортировки, как в scan,
+        # поэтому удалённый между страницами ExclusiveStartKey не возвращает к началу
+        if index is None:
+            entries = data.partitions.get(partkey, [])
+        else:
+            entries = data.index_partitions[index].get(partkey, [])
+        forward = params.get('ScanIndexForward', True)
+        start = params.get('ExclusiveStartKey')
+        low, high = 0, len(entries)
+        if start:
+            start_key = data.key_of(operation, {name: start[name] for name in KEY_ATTRIBUTES if name in start})
+            if index is None:
+                start_entry = start_key[1]
+            else:
+                start_entry = (_sortable(start[data.indexes[index][1]]), start_key)
+            if forward:
+                low = bisect.bisect_right(entries, start_entry)
+            else:
+                high = bisect.bisect_left(entries, start_entry)
+        if index is None:
+            keys = [(partkey, sortkey) for sortkey in entries[low:high]]
+        else:
+            keys = [key for _, key in entries[low:high]]
+        if not forward:
+            keys.reverse()
+
+        def key_filter(item: dict) -> bool:
+            return all(evaluate(node, item) for node in rest)
+
+        return self._page(operation, params, keys, data, context, key_filter if rest else None, key_attributes)
+
+    def scan(self, params: dict) -> dict:
+        operation = 'Scan'
+        data = self.table_data(operation, params['TableName'])
+        context = self._context(params)
+        keys: t.Iterable[tuple] = data.order
+        start = params.get('ExclusiveStartKey')
+        if start:
+            keys = data.order[bisect.bisect_right(data.order, data.key_of(operation, start)):]
+        segments = params.get('TotalSegments')
+        if segments:
+            segment = params['Segment']
+            keys = (key for key in keys if _segment_of(key, segments) == segment)
+        return self._page(operation, params, keys, data, context)
+
+    def batch_get_item(self, params: dict) -> dict:
+        operation = 'BatchGetItem'
+        request_items = params['RequestItems']
+        if sum(len(request['Keys']) for request in request_items.values()) > BATCH_GET_LIMIT:
+            raise _error(operation, 'ValidationException',
+                         f'Too many items requested for the BatchGetItem call (limit {BATCH_GET_LIMIT})')
+        responses = {}
+        for table_name, request in request_items.items():
+            data = self.table_data(operation, table_name)
+            context = self._context(request)
+            projection = self._projection(request, context)
+            context.check_unused()
+            keys = [data.key_of(operation, key) for key in request['Keys']]
+            if len(set(keys)) != len(keys):
+                raise _error(operation, 'ValidationException', 'Provided list of item keys contains duplicates')
+            found = [data.get(key) for key in keys]
+            responses[table_name] = [
+                project(item, projection) if projection else item for item in found if item is not None
+            ]
+        return {'Responses': responses, 'UnprocessedKeys': {}}
+
+    def batch_write_item(self, params: dict) -> dict:
+        operation = 'BatchWriteItem'
+        request_items = params['RequestItems']
+        if sum(len(requests) for requests in request_items.values()) > BATCH_WRITE_LIMIT:
+            raise _error(operation, 'ValidationException',
+                         f'Too many items requested for the BatchWriteItem call (limit {BATCH_WRITE_LIMIT})')
+        writes = []
+        for table_name, requests in request_items.items():
+            data = self.table_data(operation, table_name)
+            seen = set()
+            for request in requests:
+                if 'PutRequest' in request:
+                    item = request['PutRequest']['Item']
+                    key = data.key_of(operation, item, exact=False)
+                else:
+                    item = None
+                    key = data.key_of(operation, request['DeleteRequest']['Key'])
+                if key in seen:
+                    raise _error(operation, 'ValidationException', 'Provided list of item keys contains duplicates')
+                seen.add(key)
+                writes.append((data, key, item))
+        for data, key, item in writes:
+            if item is None:
+                data.delete(key)
+            else:
+                data.put(key, _copy(item))
+        return {'UnprocessedItems': {}}
+
+    def transact_write_items(self, params: dict) -> dict:
+        operation = 'TransactWriteItems'
+        transact_items = params['TransactItems']
+        if len(transact_items) > TRANSACT_LIMIT:
+            raise _error(operation, 'ValidationException',
+                         f'Member must have length less than or equal to {TRANSACT_LIMIT}')
+        prepared, seen, reasons, failed = [], set(), [], False
+        for transact_item in transact_items:
+            ((kind, request),) = transact_item.items()
+            data = self.table_data(operation, request['TableName'])
+            key = data.key_of(operation, request['Item'] if kind == 'Put' else request['Key'], exact=kind != 'Put')
+            if (data.name, key) in seen:
+                raise _error(operation, 'ValidationException',
+                             'Transaction request cannot include multiple operations on one item')
+            seen.add((data.name, key))
+            context = self._context(request)
+            actions = parse_update(request['UpdateExpression'], context) if kind == 'Update' else None
+            condition = request.get('ConditionExpression')
+            passed = not condition or evaluate(parse_condition(condition, context), data.get(key) or {})
+            context.check_unused()
+            reasons.append({'Code': 'None'} if passed else
+                           {'Code': 'ConditionalCheckFailed', 'Message': 'The conditional request failed'})
+            failed = failed or not passed
+            prepared.append((kind, request, data, key, actions))
+        if failed:
+            codes = ', '.join(reason['Code'] for reason in reasons)
+            raise _error(operation, 'TransactionCanceledException',
+                         f'Transaction cancelled, please refer cancellation reasons for specific reasons [{codes}]',
+                         CancellationReasons=reasons)
+
+        updated = []
+        for kind, request, data, key, actions in prepared:
+            if kind == 'Update':
+                old = data.get(key)
+                item = _copy(old) if old is not None else _copy(request['Key'])
+                apply_update(item, actions)
+                updated.append((data, key, item))
+            elif kind == 'Put':
+                updated.append((data, key, _copy(request['Item'])))
+            elif kind == 'Delete':
+                updated.append((data, key, None))
+        for data, key, item in updated:
+            if item is None:
+                data.delete(key)
+            else:
+                data.put(key, item)
+        return {}
+
+
+def _conjuncts(node: tuple) -> list[tuple]:
+    if node[0] == 'and':
+        return _conjuncts(node[1]) + _conjuncts(node[2])
+    return [node]
+
+
+def _segment_of(key: tuple, segments: int) -> int:
+    return zlib.crc32(repr(key[0]).encode()) % segments
+
+
+class _Waiter:
+    async def wait(self, **_: t.Any) -> None:
+        pass
+
+
+class MemoryClient:
+    """Низкоуровневый клиент: параметры и ответы в формате AttributeValue, как у aiobotocore"""
+
+    _operations = {
+        'get_item': 'GetItem',
+        'put_item': 'PutItem',
+        'update_item': 'UpdateItem',
+        'delete_item': 'DeleteItem',
+        'query': 'Query',
+        'scan': 'Scan',
+        'batch_get_item': 'BatchGetItem',
+        'batch_write_item': 'BatchWriteItem',
+        'transact_write_items': 'TransactWriteItems',
+    }
+
+    def __init__(self, database: MemoryDynamoDB):
+        self.database = database
+
+    async def call(self, method: str, params: dict) -> dict:
+        operation = self._operations[method]
+        await self.database.request(operation)
+        try:
+            response = getattr(self.database, method)(params)
+        except ExpressionError as e:
+            raise _error(operation, 'ValidationException', str(e))
+        # ответ не делит объекты с хранилищем, как будто прошёл через сеть
+        return _copy(response)
+
+    def __getattr__(self, method: str):
+        if method not in self._operations:
+            raise AttributeError(method)
+
+        async def operation(**params):
+            return await self.call(method, params)
+
+        return operation
+
+    async def describe_table(self, TableName: str) -> dict:
+        await self.database.request('DescribeTable')
+        return {'Table': self.database.table_data('DescribeTable', TableName).describe()}
+
+    async def list_tables(self, **_: t.Any) -> dict:
+        await self.database.request('ListTables')
+        return {'TableNames': sorted(self.database.tables)}
+
+    async def create_table(
+        self,
+        TableName: str,
+        KeySchema: list[dict],
+        GlobalSecondaryIndexes: list[dict] = (),
+        **_: t.Any,
+    ) -> dict:
+        await self.database.request('CreateTable')
+        if TableName in self.database.tables:
+            raise _error('CreateTable', 'ResourceInUseException', f'Table already exists: {TableName}')
+        if [schema['AttributeName'] for schema in KeySchema] != list(KEY_ATTRIBUTES):
+            raise _error('CreateTable', 'ValidationException',
+                         f'Memory tables only support the key schema {KEY_ATTRIBUTES}')
+        indexes = {index['IndexName']: _index_attributes('CreateTable', index) for index in GlobalSecondaryIndexes}
+        data = self.database.tables[TableName] = _TableData(TableName, indexes)
+        return {'TableDescription': data.describe()}
+
+    async def update_table(self, TableName: str, GlobalSecondaryIndexUpdates: list[dict] = (), **_: t.Any) -> dict:
+        """Из изменений таблицы поддерживается только создание GSI"""
+        operation = 'UpdateTable'
+        await self.database.request(operation)
+        data = self.database.table_data(operation, TableName)
+        for update in GlobalSecondaryIndexUpdates:
+            ((action, index),) = update.items()
+            if action != 'Create':
+                raise _error(operation, 'ValidationException', f'Memory tables only support creating indexes: {action}')
+            if index['IndexName'] in data.indexes:
+                raise _error(operation, 'ValidationException', f'Index already exists: {index["IndexName"]}')
+            data.add_index(index['IndexName'], _index_attributes(operation, index))
+        return {'TableDescription': data.describe()}
+
+    async def delete_table(self, TableName: str) -> dict:
+        await self.database.request('DeleteTable')
+        data = self.database.tables.pop(TableName, None)
+        if data is None:
+            raise _error('DeleteTable', 'ResourceNotFoundException', f'Requested resource not found: {TableName}')
+        return {'TableDescription': data.describe()}
+
+    def get_waiter(self, _: str) -> _Waiter:
+        return _Waiter()
+
+    async def close(self) -> None:
+        pass
+
+
+class _TableMeta:
+    def __init__(self, client: MemoryClient):
+        self.client = client
+
+
+class MemoryTable:
+    """Аналог aioboto3 Table: python значения на входе и выходе, числа читаются как Decimal"""
+
+    def __init__(self, client: MemoryClient, name: str):
+        self.name = name
+        self.table_name = name
+        self.meta = _TableMeta(client)
+
+    def _serialize_request(self, params: dict) -> dict:
+        params = {**params, 'TableName': self.name}
+        names = dict(params.get('ExpressionAttributeNames') or {})
+        values = dict(params.get('ExpressionAttributeValues') or {})
+        builder = ConditionExpressionBuilder()
+        for field in ('KeyConditionExpression', 'FilterExpression', 'ConditionExpression'):
+            condition = params.get(field)
+            if isinstance(condition, ConditionBase):
+                built = builder.build_expression(condition, is_key_condition=field == 'KeyConditionExpression')
+                params[field] = built.condition_expression
+                names.update(built.attribute_name_placeholders)
+                values.update(built.attribute_value_placeholders)
+        if names:
+            params['ExpressionAttributeNames'] = names
+        if values:
+            params['ExpressionAttributeValues'] = {alias: _serializer.serialize(value) for alias, value in values.items()}
+        for field in ('Key', 'Item', 'ExclusiveStartKey'):
+            if field in params:
+                params[field] = {name: _serializer.serialize(value) for name, value in params[field].items()}
+        return params
+
+    @staticmethod
+    def _deserialize_response(response: dict) -> dict:
+        for field in ('Item', 'Attributes', 'LastEvaluatedKey'):
+            if field in response:
+                response[field] = {name: _deserializer.deserialize(value) for name, value in response[field].items()}
+        if 'Items' in response:
+            response['Items'] = [
+                {name: _deserializer.deserialize(value) for name, value in item.items()}
+                for item in response['Items']
+            ]
+        return response
+
+    async def _call(self, method: str, params: dict) -> dict:
+        # как у boto3 resource: TypeError сериализации (float) до запроса
+        request = self._serialize_request(params)
+        response = await self.meta.client.call(method, request)
+        return self._deserialize_response(dict(response))
+
+    async def get_item(self, **params) -> dict:
+        return await self._call('get_item', params)
+
+    async def put_item(self, **params) -> dict:
+        return await self._call('put_item', params)
+
+    async def update_item(self, **params) -> dict:
+        return await self._call('update_item', params)
+
+    async def delete_item(self, **params) -> dict:
+        return await self._call('delete_item', params)
+
+    async def query(self, **params) -> dict:
+        return await self._call('query', params)
+
+    async def scan(self, **params) -> dict:
+        return await self._call('scan', params)
+
+
+class MemoryResource:
+    def __init__(self, client: MemoryClient):
+        self.meta = _TableMeta(client)
+
+    async def Table(self, name: str) -> MemoryTable:
+        return MemoryTable(self.meta.client, name)
+
+    async def close(self) -> None:
+        pass
+
+
+_databases: dict[str, MemoryDynamoDB] = {}
+
+
+def memory_database(endpoint_url: str) -> MemoryDynamoDB:
+    """Одна база на адрес в пределах процесса: данные переживают перезапуск lifespan"""
+    database = _databases.get(str(endpoint_url))
+    if database is None:
+        database = _databases[str(endpoint_url)] = MemoryDynamoDB.from_url(endpoint_url)
+    return database
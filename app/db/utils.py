@@ -1,42 +1,22 @@
-import aioboto3
 import datetime
 
 from app.config import settings
 from app.core.log_config import logger
+from app.db import key_structure
+from app.db.connection import dynamo_manager
+from app.db.maintenance import truncate_table
 
 
 async def connect_ydb():
-    YC_DATABASE_URL = settings.YC_DATABASE_URL
-    YC_SERVICE_ACCOUNT_KEY_ID = settings.YC_SERVICE_ACCOUNT_KEY_ID
-    YC_SERVICE_ACCOUNT_SECRET_KEY = settings.YC_SERVICE_ACCOUNT_SECRET_KEY
-    session = aioboto3.Session()
-    async with session.client(
-        'dynamodb',
-        endpoint_url=YC_DATABASE_URL,
-        region_name='us-east-1',
-        aws_access_key_id=YC_SERVICE_ACCOUNT_KEY_ID,
-        aws_secret_access_key=YC_SERVICE_ACCOUNT_SECRET_KEY
-    ) as dynamodb:
-        return dynamodb
+    manager = await dynamo_manager.open()
+    return manager.client
 
 
 async def connect_table(table_name: str):
     start_time = datetime.datetime.now()
-    YC_DATABASE_URL = settings.YC_DATABASE_URL
-    YC_SERVICE_ACCOUNT_KEY_ID = settings.YC_SERVICE_ACCOUNT_KEY_ID
-    YC_SERVICE_ACCOUNT_SECRET_KEY = settings.YC_SERVICE_ACCOUNT_SECRET_KEY
-
-    session = aioboto3.Session()
-    async with session.resource(
-        'dynamodb',
-        endpoint_url=YC_DATABASE_URL,
-        region_name='us-east-1',
-        aws_access_key_id=YC_SERVICE_ACCOUNT_KEY_ID,
-        aws_secret_access_key=YC_SERVICE_ACCOUNT_SECRET_KEY
-    ) as dynamodb:
-        table = await dynamodb.Table(table_name)
-        logger.debug(f'DynamoDB connection duration: {datetime.datetime.now() - start_time}', extra={'user': '-'})
-        return table
+    table = await dynamo_manager.table(table_name)
+    logger.debug(f'DynamoDB connection duration: {datetime.datetime.now() - start_time}', extra={'user': '-'})
+    return table
 
 
 async def create_table(
@@ -44,13 +24,20 @@ async def create_table(
     table_name,
     attribute_definitions,
     key_schema,
-    provisioned_throughput
+    provisioned_throughput,
+    global_secondary_indexes=()
 ):
+    index_args = {}
+    if global_secondary_indexes:
+        index_args['GlobalSecondaryIndexes'] = [
+            {**index, 'ProvisionedThroughput': provisioned_throughput} for index in global_secondary_indexes
+        ]
     response = await dynamodb_client.create_table(
         TableName=table_name,
         AttributeDefinitions=attribute_definitions,
         KeySchema=key_schema,
-        ProvisionedThroughput=provisioned_throughput
+        ProvisionedThroughput=provisioned_throughput,
+        **index_args
     )
 
     # Wait for the table to be created
@@ -67,10 +54,7 @@ async def create_table(
 async def drop_general_table():
     TABLE_NAME = settings.TABLE_SUFFIX
     table = await connect_table(TABLE_NAME)
-    scan = await table.scan()
-    async with table.batch_writer() as batch:
-        for item in scan['Items']:
-            await batch.delete_item(Key={'partkey': item['partkey'], 'sortkey': item['sortkey']})
+    await truncate_table(table)
 
 
 class SetupTableConnection:
@@ -88,26 +72,8 @@ async def init_local_db_test_table(table_suffix: str):
     GENERAL_TABLE_NAME = mode=table_suffix
     dynamodb = await connect_ydb()
 
-    attribute_definitions = [
-        {
-            'AttributeName': 'partkey',
-            'AttributeType': 'S'
-        },
-        {
-            'AttributeName': 'sortkey',
-            'AttributeType': 'S'
-        }
-    ]
-    key_schema = [
-        {
-            'AttributeName': 'partkey',
-            'KeyType': 'HASH'
-        },
-        {
-            'AttributeName': 'sortkey',
-            'KeyType': 'RANGE'
-        }
-    ]
+    # схема ключей и GSI, по которым идут листинги из key_structure.ACCESS_PATTERNS
+    schema = key_structure.table_schema()
 
     provisioned_throughput = {
         'ReadCapacityUnits': 5,
@@ -123,9 +89,10 @@ async def init_local_db_test_table(table_suffix: str):
         await create_table(
             dynamodb_client=dynamodb,
             table_name=GENERAL_TABLE_NAME,
-            attribute_definitions=attribute_definitions,
-            key_schema=key_schema,
-            provisioned_throughput=provisioned_throughput
+            attribute_definitions=schema['AttributeDefinitions'],
+            key_schema=schema['KeySchema'],
+            provisioned_throughput=provisioned_throughput,
+            global_secondary_indexes=schema.get('GlobalSecondaryIndexes', ())
         )
     else:
         print(f'{GENERAL_TABLE_NAME} already exists')
@@ -1,59 +1,116 @@
+import asyncio
+import time
+
 import uvicorn
 
-from aiogram import Bot
-from aiogram.client.default import DefaultBotProperties
-from aiogram.enums import ParseMode
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
 
 from app.routers import main_router
-from app.tg.create_app import create_tg
-from app.tg.fsm.storage import DynamoDBStorage
+from app.tg.create_app import attach_table, build_bot, create_tg, shared_dispatcher
+from app.tg.workers import UpdateWorkerPool
 from app.db import connection as app_dynamo
 from app.config import settings
 from app.core.log_config import logger
 from app.core.context import AppContext
+from app.core.metrics import metrics
 
 
-@asynccontextmanager
-async def lifespan(_: FastAPI):
-    logger.info("Lifespan STARTUP")
-    bot = Bot(token=settings.TG_KEY, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-    logger.info("BOT CREATED")
+async def startup_step(name: str, timeout: float, coro):
+    """Шаг старта со своим таймаутом; время пишется в стадию startup.<name>"""
+    with metrics.timer(f'startup.{name}'):
+        try:
+            async with asyncio.timeout(timeout):
+                return await coro
+        except TimeoutError:
+            logger.error(f'Startup step {name} did not finish in {timeout}s')
+            raise
 
-    logger.info("DATABASE INITIALIZATION...")
-    resource_conn, client_conn = await app_dynamo.dynamodb_connection()
 
+async def start_dynamo(dynamo: app_dynamo.DynamoConnectionManager):
+    logger.info("DATABASE INITIALIZATION...")
+    await startup_step('dynamo', settings.STARTUP_DYNAMO_TIMEOUT, dynamo.open())
+    if not settings.DYNAMO_TRUST_TABLE:
+        conn = app_dynamo.DynamoConnection(dynamo.client, dynamo.resource)
+        await startup_step('table_check', settings.STARTUP_TABLE_CHECK_TIMEOUT, conn.describe_table())
     logger.info("DATABASE INITIALIZATION \t\tSUCCESS")
+    return await dynamo.table()
 
-    conn = app_dynamo.DynamoConnection(client_conn, resource_conn)
-    logger.debug(f'starting... after conn created')
-    table = await conn.table('dev')
-    logger.debug(f'starting... before yield, {table=}, {client_conn=}')
+
+def start_telegram():
+    """Bot и Dispatcher без таблицы: синхронная работа без сети, идёт в потоке"""
+    with metrics.timer('startup.telegram'):
+        bot = build_bot()
+        tg_dp = shared_dispatcher()
+    logger.info("BOT CREATED")
+    return bot, tg_dp
+
+
+def ack_first_enabled(serverless: bool) -> bool:
+    """
+    Включать ли UpdateWorkerPool. В функции обработка после ответа не гарантирована,
+    поэтому WEBHOOK_ACK_FIRST там игнорируется.
+    """
+    if not (settings.USE_WEBHOOK and settings.WEBHOOK_ACK_FIRST):
+        return False
+    if serverless:
+        logger.warning('WEBHOOK_ACK_FIRST is ignored in Cloud Functions: updates are processed before the response')
+        return False
+    return True
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    logger.info("Lifespan STARTUP")
+    startup_started = time.perf_counter()
+    dynamo = app_dynamo.dynamo_manager
+    try:
+        # пока открываются клиенты DynamoDB и идёт describe_table, Bot и Dispatcher
+        # собираются в потоке: старт занимает столько, сколько более медленный шаг
+        async with asyncio.TaskGroup() as startup:
+            dynamo_task = startup.create_task(start_dynamo(dynamo))
+            telegram_task = startup.create_task(asyncio.to_thread(start_telegram))
+    except BaseException:
+        await dynamo.close()
+        raise
+    table = dynamo_task.result()
+    bot, tg_dp = telegram_task.result()
+    attach_table(tg_dp, table)
     logger.info("APPLICATION STARTUP \t\tCOMPLETE")
-    logger.info("DYNAMO STORAGE INITIALIZATION")
-    dynamo_storage = DynamoDBStorage(table=table)
-    logger.info("DYNAMO STORAGE INITIALIZATION \t\tSUCCESS")
-    async with create_tg(bot=bot, storage=dynamo_storage, use_webhook=settings.USE_WEBHOOK) as tg_dp:
-        logger.info("TG BOT - SUCCESS")
-        AppContext().initialize(
-            bot=bot,
-            dynamo_table=table,
-            dynamo_client=client_conn,
-            dynamo_storage=dynamo_storage,
-            dispatcher_tg=tg_dp)
-        yield
-        logger.info("TG BOT`s SHUTDOWN")
+
+    async with dynamo:
+        async with create_tg(bot=bot, dp=tg_dp, use_webhook=settings.USE_WEBHOOK) as tg_dp:
+            logger.info("TG BOT - SUCCESS")
+            update_workers = None
+            if ack_first_enabled(app.state.serverless):
+                update_workers = UpdateWorkerPool(tg_dp, bot, max_in_flight=settings.WEBHOOK_MAX_IN_FLIGHT)
+            AppContext().initialize(
+                bot=bot,
+                dynamo_table=table,
+                dynamo_client=dynamo.client,
+                dynamo_storage=tg_dp.fsm.storage,
+                dispatcher_tg=tg_dp,
+                update_workers=update_workers)
+            metrics.observe('lifespan_startup', time.perf_counter() - startup_started)
+            try:
+                yield
+            finally:
+                if update_workers is not None:
+                    await update_workers.close(timeout=settings.WEBHOOK_DRAIN_TIMEOUT)
+                AppContext().reset()
+            logger.info("TG BOT`s SHUTDOWN")
 
     logger.info("APPLICATION SHUTDOWN")
 
 
-def create_app() -> FastAPI:
+def create_app(serverless: bool = False) -> FastAPI:
+    """serverless - приложение запускается в Cloud Functions (function_app)"""
     fastapi_dev = FastAPI(
         lifespan=lifespan,
         root_path=f"/{settings.VERSION}",
         title="TG STORE DEV"
     )
+    fastapi_dev.state.serverless = serverless
     logger.info('INCLUDES ROUTERS')
     fastapi_dev.include_router(main_router)
 
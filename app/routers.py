@@ -1,32 +1,64 @@
 from fastapi import Response, Request, APIRouter
+from fastapi.responses import JSONResponse, PlainTextResponse
 from aiogram.types import Update
 
-from app.common import TgBot, BotDispatcher
-from app.core.log_config import logger
+from app.common import TgBot, BotDispatcher, UpdateWorkers
+from app.config import settings
+from app.core.log_config import logger, payload_sampled
+from app.core.metrics import metrics
+from app.tg.webhook_reply import process_update
 
 main_router = APIRouter()
 
 
 @main_router.post('/tgwebhook', tags=['telegram'], response_model=None)
-async def telegram_webhook(request: Request, dp: BotDispatcher, bot: TgBot) -> Response:
-    """Handle incoming Telegram updates by putting them into the `update_queue`"""
+async def telegram_webhook(
+    request: Request,
+    dp: BotDispatcher,
+    bot: TgBot,
+    update_workers: UpdateWorkers
+) -> Response:
+    """
+    Handle incoming Telegram updates: validate the raw body and feed it to the dispatcher.
+    With WEBHOOK_ACK_FIRST the update is queued to background workers and answered at once;
+    if the pool does not accept it (shutdown, redeploy), the answer is 503 and Telegram retries.
+    """
+    reply_payload = None
     try:
-        json_data = await request.json()
-        logger.info(f"Дернули rout: {json_data}")
+        body = await request.body()
+        if settings.LOG_UPDATE_PAYLOADS or payload_sampled():
+            logger.info('Дернули rout: %s', body)
 
-        update = Update.model_validate(json_data, context={"bot": bot})
-        logger.info(f'UPDATE: {update=}')
-        await dp.feed_update(update=update, bot=bot)
+        with metrics.timer('update_validate'):
+            update = Update.model_validate_json(body, context={"bot": bot})
+        logger.info('UPDATE: %s', update.update_id)
+        if update_workers is not None:
+            try:
+                await update_workers.submit(update)
+            except Exception as e:
+                # 200 здесь потерял бы update: Telegram повторяет только не-200 ответы
+                logger.error(f'Update {update.update_id} не принят воркерами: {e}')
+                return Response(status_code=503, content='Update не принят, повторите позже')
+        else:
+            with metrics.timer('feed_update'):
+                reply_payload = await process_update(dp, bot, update)
 
     except Exception as e:
         logger.error(f"Что-то в роуте: {e}")
-        return Response(status_code=500, content=str(e))
-    finally:
+    else:
         logger.info("Update processed successfully")
-        return Response(status_code=200, content='Update передан боту')
+    # Telegram повторяет update на любой ответ кроме 200, поэтому ошибки обработки только логируются
+    if reply_payload is not None:
+        return JSONResponse(status_code=200, content=reply_payload)
+    return Response(status_code=200, content='Update передан боту')
 
 
 @main_router.get('/checkstate', tags=['service'])
 async def check_state(request: Request):
     state = request.app.state
     return Response(status_code=200, content=str(state))
+
+
+@main_router.get('/metrics', tags=['service'])
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render_prometheus(), media_type='text/plain; version=0.0.4')
@@ -1,32 +1,127 @@
+import functools
+
 from aiogram import Bot, Dispatcher
 from contextlib import asynccontextmanager
 from asyncio import create_task, CancelledError
 
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.enums import ParseMode
+from aiogram.fsm.storage.base import BaseStorage
 
+from app.tg.fsm.cache import TTLCache
+from app.tg.fsm.codec import DataCodec
+from app.tg.fsm.expiry import FSMExpiry
+from app.tg.fsm.memory import MemoryFSMStorage
 from app.tg.fsm.storage import DynamoDBStorage
+from app.tg.fsm.tiered import TieredStorage
+from app.tg.fsm.middleware import install_unit_of_work
+from app.tg.middlewares import BotApiMetricsMiddleware, ConcurrencyLimitMiddleware, LogContextMiddleware
+from app.tg.webhook_reply import WebhookReplyMiddleware
 from app.db import connection as app_dynamo
-from app.tg.routers.start import router as start_rout
+from app.tg.routers import start
 from app.core.log_config import logger
 from app.config import settings
 
 
+def build_fsm_expiry() -> FSMExpiry | None:
+    if not settings.FSM_TTL and not settings.FSM_TTL_BY_GROUP:
+        return None
+    return FSMExpiry(default=settings.FSM_TTL, groups=settings.FSM_TTL_BY_GROUP)
+
+
+def build_data_codec() -> DataCodec | None:
+    if settings.FSM_DATA_CODEC == 'map':
+        return None
+    return DataCodec(min_size=settings.FSM_DATA_COMPRESS_MIN_SIZE)
+
+
+def build_storage(table) -> BaseStorage:
+    """FSM storage по settings.FSM_STORAGE"""
+    match settings.FSM_STORAGE:
+        case 'memory':
+            return MemoryFSMStorage()
+        case 'tiered':
+            return TieredStorage(
+                DynamoDBStorage(table=table, expiry=build_fsm_expiry(), codec=build_data_codec()),
+                cache=TTLCache(maxsize=settings.FSM_CACHE_MAXSIZE, ttl=settings.FSM_CACHE_TTL),
+                consistency=settings.FSM_TIERED_CONSISTENCY,
+                flush_delay=settings.FSM_TIERED_FLUSH_DELAY,
+            )
+    fsm_cache = None
+    if settings.FSM_CACHE_ENABLED:
+        fsm_cache = TTLCache(maxsize=settings.FSM_CACHE_MAXSIZE, ttl=settings.FSM_CACHE_TTL)
+    return DynamoDBStorage(table=table, cache=fsm_cache, expiry=build_fsm_expiry(), codec=build_data_codec())
+
+
+def build_bot() -> Bot:
+    session = None
+    if settings.TG_API_SERVER:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(settings.TG_API_SERVER))
+    bot = Bot(token=settings.TG_KEY, session=session, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    bot.session.middleware(BotApiMetricsMiddleware())
+    if settings.WEBHOOK_REPLY:
+        bot.session.middleware(WebhookReplyMiddleware())
+    return bot
+
+
+def build_dispatcher(storage: BaseStorage | None = None) -> Dispatcher:
+    """Dispatcher с графом роутеров и middleware; у каждого Dispatcher свои роутеры"""
+    dp = Dispatcher(storage=storage) if storage is not None else Dispatcher()
+    dp.update.outer_middleware(LogContextMiddleware())
+    if settings.FSM_UNIT_OF_WORK and isinstance(storage, (DynamoDBStorage, TieredStorage)):
+        install_unit_of_work(dp, storage)
+    if settings.TG_TASKS_LIMIT:
+        dp.update.outer_middleware(ConcurrencyLimitMiddleware(settings.TG_TASKS_LIMIT))
+    dp.include_router(start.create_router())
+    return dp
+
+
+@functools.cache
+def shared_dispatcher() -> Dispatcher:
+    """
+    Dispatcher точек входа, один на процесс: граф роутеров и storage собираются
+    при первом старте, следующие старты тёплого контейнера их не пересобирают.
+    Таблицы у него нет - она привязана к циклу событий, её на каждом старте
+    передаёт attach_table.
+    """
+    return build_dispatcher(build_storage(table=None))
+
+
+def attach_table(dp: Dispatcher, table) -> Dispatcher:
+    """Подставляет в FSM storage таблицу текущего старта; storage в памяти она не нужна"""
+    if isinstance(dp.fsm.storage, (DynamoDBStorage, TieredStorage)):
+        dp.fsm.storage.table = table
+    return dp
+
+
+def resolve_allowed_updates(dp: Dispatcher) -> list[str]:
+    """Типы update, на которые в роутерах есть хендлеры; остальные Telegram не будет присылать"""
+    return dp.resolve_used_update_types()
+
+
+async def setup_webhook(bot: Bot, dp: Dispatcher, url: str = settings.WEBHOOK) -> bool:
+    allowed_updates = resolve_allowed_updates(dp)
+    logger.info(f'setWebhook {url}, allowed_updates={allowed_updates}')
+    return await bot.set_webhook(url, allowed_updates=allowed_updates)
+
+
 @asynccontextmanager
-async def create_tg(bot: Bot, storage: DynamoDBStorage, use_webhook: bool):
+async def create_tg(bot: Bot, dp: Dispatcher, use_webhook: bool):
     logger.info("Crate TG in Lifespan")
-    dp = Dispatcher(storage=storage)
-    if not hasattr(dp, '_start_rout_added'):
-        dp.include_router(start_rout)
-        dp._start_rout_added = True
-    else:
-        logger.info(f'Router is already attached')
 
     if use_webhook:
         logger.info(f'Webhook use: {settings.WEBHOOK}')
     else:
-        logger.info('BOT USE LOCAL POLLING')
-        polling_task = create_task(dp.start_polling(bot, polling_timeout=2))
+        allowed_updates = resolve_allowed_updates(dp)
+        logger.info(f'BOT USE LOCAL POLLING, allowed_updates={allowed_updates}')
+        polling_task = create_task(dp.start_polling(
+            bot,
+            polling_timeout=settings.TG_POLLING_TIMEOUT,
+            handle_as_tasks=settings.TG_HANDLE_AS_TASKS,
+            allowed_updates=allowed_updates,
+        ))
 
     try:
         yield dp
@@ -39,7 +134,10 @@ async def create_tg(bot: Bot, storage: DynamoDBStorage, use_webhook: bool):
             except CancelledError:
                 logger.info('Polling task cancelled.')
 
-        await bot.close()
+        # tiered storage в режиме write_back дописывает очередь в DynamoDB
+        await dp.fsm.storage.close()
+        # bot.close() - это метод Bot API close, а не закрытие HTTP сессии
+        await bot.session.close()
         logger.info('SHUTDOWN')
 
 
@@ -52,7 +150,7 @@ async def create_tg(bot: Bot, storage: DynamoDBStorage, use_webhook: bool):
 #             dynamo_storage = DynamoDBStorage(table=table)
 #             try:
 #                 dp = Dispatcher(storage=dynamo_storage)
-#                 dp.include_router(start_rout)
+#                 dp.include_router(start.create_router())
 #             except Exception as e:
 #                 logger.error(e)
 #             logger.info(f'Webhook use: {settings.WEBHOOK}')
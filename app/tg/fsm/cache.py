@@ -0,0 +1,52 @@
+import time
+import typing as t
+from collections import OrderedDict
+
+MISSING = object()
+
+
+class TTLCache:
+    """
+    Ограниченный LRU кэш с временем жизни записи.
+
+    Используется DynamoDBStorage как слой read-through/write-through: чтения идут
+    из памяти, пока запись не устарела, записи сразу обновляют кэш.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 30, timer: t.Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._timer = timer
+        self._items: OrderedDict[t.Hashable, tuple[float, t.Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key: t.Hashable, default: t.Any = MISSING) -> t.Any:
+        entry = self._items.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > self._timer():
+                self._items.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._items[key]
+        self.misses += 1
+        return default
+
+    def set(self, key: t.Hashable, value: t.Any) -> None:
+        self._items[key] = (self._timer() + self.ttl, value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def invalidate(self, key: t.Hashable) -> None:
+        self._items.pop(key, None)
+
+    def clear(self) -> None:
+        self._items.clear()
+
+    def stats(self) -> dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._items)}
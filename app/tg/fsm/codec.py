@@ -0,0 +1,89 @@
+import json
+import zlib
+from decimal import Decimal
+
+# первый байт значения - версия формата
+PLAIN_JSON = 1
+ZLIB_JSON = 2
+
+
+class DataCodecError(ValueError):
+    pass
+
+
+class _ExactNumbers(Exception):
+    """В data есть дробный Decimal: нужен медленный путь без потери точности"""
+
+
+def _json_default(value):
+    # числа из старых items приходят из DynamoDB как Decimal
+    if isinstance(value, Decimal):
+        if value == value.to_integral_value():
+            return int(value)
+        raise _ExactNumbers
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=str)
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def _json_key(key) -> str:
+    if isinstance(key, str):
+        return key
+    # те же правила для ключей, что у json.dumps
+    return json.dumps(key) if isinstance(key, (bool, type(None))) else str(key)
+
+
+def _dumps_exact(value) -> str:
+    """JSON, в котором дробный Decimal записан числом из str(value), как в DynamoDB"""
+    if isinstance(value, Decimal):
+        if not value.is_finite():
+            raise ValueError(f'Out of range Decimal value {value} is not JSON compliant')
+        return str(int(value)) if value == value.to_integral_value() else str(value)
+    if isinstance(value, dict):
+        items = (f'{json.dumps(_json_key(k), ensure_ascii=False)}:{_dumps_exact(v)}' for k, v in value.items())
+        return '{' + ','.join(items) + '}'
+    if isinstance(value, (set, frozenset)):
+        value = sorted(value, key=str)
+    if isinstance(value, (list, tuple)):
+        return '[' + ','.join(map(_dumps_exact, value)) + ']'
+    return json.dumps(value, ensure_ascii=False, allow_nan=False, default=_json_default)
+
+
+class DataCodec:
+    """
+    FSM data в одном бинарном атрибуте: байт версии + JSON, сжатый zlib.
+
+    Маленькие payload сжатие только раздувает, поэтому до min_size байт JSON
+    пишется как есть (версия PLAIN_JSON). Новые форматы получают свой байт
+    версии, decode понимает все известные.
+
+    Дробные числа возвращаются как Decimal - так же, как их отдаёт DynamoDB
+    из map-атрибута, поэтому data не зависит от FSM_DATA_CODEC.
+    """
+
+    def __init__(self, min_size: int = 128, level: int = 6):
+        self.min_size = min_size
+        self.level = level
+
+    def encode(self, data: dict) -> bytes:
+        try:
+            raw = json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=_json_default).encode()
+        except _ExactNumbers:
+            raw = _dumps_exact(data).encode()
+        if len(raw) >= self.min_size:
+            compressed = zlib.compress(raw, self.level)
+            if len(compressed) < len(raw):
+                return bytes((ZLIB_JSON,)) + compressed
+        return bytes((PLAIN_JSON,)) + raw
+
+    def decode(self, blob) -> dict:
+        # boto3 resource отдаёт Binary, low-level клиент - bytes
+        blob = bytes(blob)
+        if not blob:
+            raise DataCodecError('Empty FSM data payload')
+        version, payload = blob[0], blob[1:]
+        if version == PLAIN_JSON:
+            return json.loads(payload, parse_float=Decimal)
+        if version == ZLIB_JSON:
+            return json.loads(zlib.decompress(payload), parse_float=Decimal)
+        raise DataCodecError(f'Unknown FSM data codec version {version}')
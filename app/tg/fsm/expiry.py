@@ -0,0 +1,41 @@
+import time
+import typing as t
+
+# TTL атрибут таблицы: DynamoDB сама удаляет items, у которых он в прошлом
+EXPIRES_ATTRIBUTE = 'expires_at'
+
+
+class FSMExpiry:
+    """
+    Срок жизни FSM item по группе состояния.
+
+    Группа - часть state до двоеточия (`ClientRegister:name` -> `ClientRegister`).
+    Срок отсчитывается от последней смены состояния; 0 - item не истекает.
+    Для item без состояния (state=None или только данные) действует default.
+    """
+
+    def __init__(
+        self,
+        default: int = 0,
+        groups: dict[str, int] | None = None,
+        clock: t.Callable[[], float] = time.time,
+    ):
+        self.default = default
+        self.groups = groups or {}
+        self.clock = clock
+
+    def ttl(self, state: str | None) -> int:
+        if state is None:
+            return self.default
+        return self.groups.get(state.split(':', 1)[0], self.default)
+
+    def now(self) -> int:
+        return int(self.clock())
+
+    def expires_at(self, state: str | None) -> int | None:
+        ttl = self.ttl(state)
+        return self.now() + ttl if ttl else None
+
+    def is_expired(self, item: dict) -> bool:
+        expires_at = item.get(EXPIRES_ATTRIBUTE)
+        return expires_at is not None and expires_at <= self.now()
@@ -0,0 +1,76 @@
+from dataclasses import dataclass, field
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage
+
+from app.core.metrics import metrics
+from app.tg.fsm.storage import fsm_item_key
+
+
+@dataclass
+class MemoryRecord:
+    state: str | None = None
+    data: dict = field(default_factory=dict)
+
+
+class MemoryFSMStorage(BaseStorage):
+    """
+    FSM storage в памяти процесса для локального polling и нагрузочных тестов.
+
+    Ключи те же, что у DynamoDBStorage (`fsm_{bot_id}` / `{user_id}`), поэтому
+    состояние не зависит от чата и при смене storage ведёт себя так же.
+    Данные живут до перезапуска процесса.
+    """
+
+    def __init__(self):
+        self.records: dict[tuple[str, str], MemoryRecord] = {}
+
+    async def close(self):
+        pass
+
+    async def wait_closed(self):
+        pass
+
+    @staticmethod
+    def _record_key(key) -> tuple[str, str]:
+        return tuple(fsm_item_key(key).values())
+
+    def _record(self, key) -> MemoryRecord:
+        record_key = self._record_key(key)
+        record = self.records.get(record_key)
+        if record is None:
+            record = self.records[record_key] = MemoryRecord()
+        return record
+
+    @metrics.timed('fsm_set_state')
+    async def set_state(self, *, chat=None, user=None, state=None, key=None):
+        if isinstance(state, State):
+            state = state.state
+        self._record(key).state = state
+
+    @metrics.timed('fsm_get_state')
+    async def get_state(self, *, chat=None, user=None, key=None):
+        record = self.records.get(self._record_key(key))
+        return record.state if record is not None else None
+
+    @metrics.timed('fsm_set_data')
+    async def set_data(self, *, chat=None, user=None, data=None, key=None):
+        self._record(key).data = dict(data or {})
+
+    @metrics.timed('fsm_get_data')
+    async def get_data(self, *, chat=None, user=None, default=None, key=None):
+        record = self.records.get(self._record_key(key))
+        if record is not None and record.data:
+            return record.data.copy()
+        return default or {}
+
+    @metrics.timed('fsm_update_data')
+    async def update_data(self, *, chat=None, user=None, data=None, key, **kwargs):
+        record = self._record(key)
+        if data:
+            record.data.update(data)
+        return record.data.copy()
+
+    @metrics.timed('fsm_reset_state_data')
+    async def reset_state_data(self, *, chat=None, user=None, key=None):
+        self.records.pop(self._record_key(key), None)
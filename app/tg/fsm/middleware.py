@@ -0,0 +1,36 @@
+import typing as t
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.types import TelegramObject
+
+from app.tg.fsm.storage import DynamoDBStorage
+from app.tg.fsm.tiered import TieredStorage
+
+
+class FSMUnitOfWorkMiddleware(BaseMiddleware):
+    """
+    Outer middleware для update: все изменения FSM storage за время обработки
+    одного update копятся и записываются в DynamoDB одним запросом в конце.
+    """
+
+    def __init__(self, storage: DynamoDBStorage | TieredStorage):
+        self.storage = storage
+
+    async def __call__(
+        self,
+        handler: t.Callable[[TelegramObject, dict[str, t.Any]], t.Awaitable[t.Any]],
+        event: TelegramObject,
+        data: dict[str, t.Any],
+    ) -> t.Any:
+        async with self.storage.unit_of_work():
+            return await handler(event, data)
+
+
+def install_unit_of_work(dp: Dispatcher, storage: DynamoDBStorage | TieredStorage) -> None:
+    """
+    Подключает FSMUnitOfWorkMiddleware снаружи FSMContextMiddleware aiogram: тот
+    читает raw_state до хендлера, и это чтение тоже должно попасть в unit of work.
+    """
+    dp.update.outer_middleware.unregister(dp.fsm)
+    dp.update.outer_middleware(FSMUnitOfWorkMiddleware(storage))
+    dp.update.outer_middleware(dp.fsm)
@@ -1,10 +1,99 @@
-from aiogram.fsm.storage.base import BaseStorage
+import dataclasses
+import typing as t
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
+from botocore.exceptions import ClientError
 from datetime import datetime
 
+from app.core.metrics import metrics
+from app.db import key_structure
+from app.db.marshal import marshal_item
+from app.tg.fsm.cache import TTLCache, MISSING
+from app.tg.fsm.codec import DataCodec
+from app.tg.fsm.expiry import EXPIRES_ATTRIBUTE, FSMExpiry
+
+
+def _is_condition_failed(error: ClientError) -> bool:
+    return error.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException'
+
+
+# FSM data, закодированные DataCodec; без codec данные лежат map атрибутом data
+DATA_BLOB_ATTRIBUTE = 'data_bin'
+# decode понимает все версии формата и от настроек codec не зависит: data_bin
+# читается и после того, как codec выключили
+_blob_decoder = DataCodec()
+
+
+def fsm_item_key(key) -> dict:
+    """Ключ FSM item пользователя: `fsm_{bot_id}` / `{user_id}`; общий для всех FSM storage"""
+    return key_structure.FSM.key(bot_id=key.bot_id, user_id=key.user_id)
+
+
+@dataclass
+class _PendingRecord:
+    """
+    Изменения одного FSM item, накопленные за время обработки update.
+
+    data - новые данные целиком (set_data), data_updates - поля, которые
+    дописываются в data (update_data). loaded - state и data, прочитанные
+    в этом unit of work одним GetItem.
+    """
+    key: StorageKey
+    state: t.Any = MISSING
+    data: dict | None = None
+    data_updates: dict = field(default_factory=dict)
+    deleted: bool = False
+    loaded: dict | None = None
+
+    @property
+    def has_writes(self) -> bool:
+        return self.state is not MISSING or self.data is not None or bool(self.data_updates) or self.deleted
+
 
 class DynamoDBStorage(BaseStorage):
-    def __init__(self, table):
+    """
+    FSM storage aiogram поверх одной таблицы DynamoDB.
+
+    Состояние и данные пользователя лежат в одном item
+    `fsm_{bot_id}` / `{user_id}` с атрибутами `state` и `data` (map).
+    Старая раскладка (`state_{bot_id}` и `data_state_{bot_id}`) не читается:
+    её переносит `python -m app.db.maintenance migrate-fsm`.
+
+    Внутри unit_of_work() записи не уходят в базу сразу, а копятся и
+    сбрасываются одним запросом при выходе без ошибки; чтения видят накопленные
+    значения, а state и data читаются одним GetItem на весь unit of work.
+
+    С expiry каждая смена состояния пишет TTL атрибут `expires_at`. Истёкший
+    item читается как пустой и удаляется при чтении, не дожидаясь DynamoDB TTL.
+    Запись в истёкший item не проходит по условию: item удаляется и пишется
+    заново, поэтому старые state и data не воскресают.
+
+    С codec данные пишутся одним бинарным атрибутом `data_bin` вместо map `data`;
+    items, записанные раньше, читаются из `data` и переезжают при следующей записи.
+    data_bin читается и без codec: поля, дописанные update_data в map `data`,
+    накладываются на него, а set_data пишет map целиком и удаляет data_bin.
+    Дописать поля в data_bin можно только чтением и записью с условием, см.
+    _update_encoded_data.
+    """
+
+    def __init__(
+        self,
+        table,
+        cache: TTLCache | None = None,
+        expiry: FSMExpiry | None = None,
+        codec: DataCodec | None = None,
+    ):
         self.table = table
+        self.cache = cache
+        self.expiry = expiry
+        self.codec = codec
+        self._pending: ContextVar[dict[tuple, _PendingRecord] | None] = ContextVar(
+            f'fsm_unit_of_work_{id(self)}', default=None
+        )
 
     async def close(self):
         pass
@@ -12,73 +101,428 @@ class DynamoDBStorage(BaseStorage):
     async def wait_closed(self):
         pass
 
+    _item_key = staticmethod(fsm_item_key)
+
+    def _cache_get(self, kind: str, key):
+        if self.cache is None:
+            return MISSING
+        return self.cache.get((kind, key.bot_id, key.user_id))
+
+    def _cache_set(self, kind: str, key, value):
+        if self.cache is not None:
+            self.cache.set((kind, key.bot_id, key.user_id), value)
+
+    def _cache_invalidate(self, key):
+        if self.cache is not None:
+            self.cache.invalidate(('state', key.bot_id, key.user_id))
+            self.cache.invalidate(('data', key.bot_id, key.user_id))
+
+    @staticmethod
+    def _add_condition(params: dict, condition: str) -> None:
+        existing = params.get('ConditionExpression')
+        params['ConditionExpression'] = f'{existing} AND {condition}' if existing else condition
+
+    @staticmethod
+    def _update_expression(assignments: list[str], removes: list[str]) -> str:
+        expression = 'SET ' + ', '.join(assignments)
+        if removes:
+            expression += ' REMOVE ' + ', '.join(removes)
+        return expression
+
+    def _state_expiry(self, state, assignments: list[str], removes: list[str], names: dict, values: dict):
+        """Срок жизни item для нового состояния"""
+        if self.expiry is None:
+            return
+        names['#expires'] = EXPIRES_ATTRIBUTE
+        expires_at = self.expiry.expires_at(state)
+        if expires_at is None:
+            removes.append('#expires')
+            return
+        values[':expires'] = expires_at
+        assignments.append('#expires = :expires')
+
+    def _data_expiry(self, assignments: list[str], names: dict, values: dict) -> None:
+        """Запись данных срок не продлевает, но item без срока получает срок по умолчанию"""
+        if self.expiry is None or not self.expiry.default:
+            return
+        names['#expires'] = EXPIRES_ATTRIBUTE
+        values[':expires'] = self.expiry.expires_at(None)
+        assignments.append('#expires = if_not_exists(#expires, :expires)')
+
+    def _ensure_data_map(self, assignments: list[str], names: dict, values: dict) -> None:
+        """
+        Item с состоянием сразу получает пустой map data: тогда update_data дописывает
+        поля одним UpdateItem, без второго запроса, создающего map
+        """
+        if self.codec is not None:
+            return
+        names['#data'] = 'data'
+        values[':empty_data'] = {}
+        assignments.append('#data = if_not_exists(#data, :empty_data)')
+
+    def _data_assignment(self, data: dict, assignments: list[str], removes: list[str], names: dict, values: dict):
+        names['#data'] = 'data'
+        names['#blob'] = DATA_BLOB_ATTRIBUTE
+        if self.codec is None:
+            values[':data'] = data
+            assignments.append('#data = :data')
+            removes.append('#blob')
+            return
+        values[':blob'] = self.codec.encode(data)
+        assignments.append('#blob = :blob')
+        removes.append('#data')
+
+    @staticmethod
+    def _item_data(item: dict) -> dict | None:
+        """
+        data item. Запись с codec удаляет map data, поэтому оба атрибута бывают только
+        у item из data_bin, в который без codec дописали поля, - они новее data_bin.
+        """
+        blob = item.get(DATA_BLOB_ATTRIBUTE)
+        if blob is None:
+            return item.get('data')
+        return {**_blob_decoder.decode(blob), **(item.get('data') or {})}
+
+    def _pending_record(self, key, create: bool = False) -> _PendingRecord | None:
+        records = self._pending.get()
+        if records is None:
+            return None
+        record_key = (key.bot_id, key.user_id)
+        record = records.get(record_key)
+        if record is None and create:
+            record = records[record_key] = _PendingRecord(key=key)
+        return record
+
+    @asynccontextmanager
+    async def unit_of_work(self):
+        if self._pending.get() is not None:
+            yield
+            return
+        records: dict[tuple, _PendingRecord] = {}
+        token = self._pending.set(records)
+        try:
+            yield
+        finally:
+            self._pending.reset(token)
+        # изменения хендлера, упавшего с ошибкой, не записываются
+        await self._flush([record for record in records.values() if record.has_writes])
+
+    async def _load(self, record: _PendingRecord) -> dict:
+        """state и data item; в unit of work читаются один раз"""
+        if record.loaded is None:
+            state, data = self._cache_get('state', record.key), self._cache_get('data', record.key)
+            if state is MISSING or data is MISSING:
+                item = await self._get_attributes(record.key, 'state', *self._data_attributes())
+                state, data = item.get('state'), self._item_data(item)
+                self._cache_set('state', record.key, state)
+                self._cache_set('data', record.key, data)
+            else:
+                item = None
+            record.loaded = {'state': state, 'data': data or {}, 'item': item}
+        return record.loaded
+
+    def _record_update(self, record: _PendingRecord, create_data: bool = False) -> dict:
+        """
+        Параметры UpdateItem для record. data_updates пишутся по полям в существующий
+        map data, а с create_data - новым map; условие не даёт перепутать эти случаи.
+        """
+        names = {'#time': 'time', '#bot': 'bot', '#user': 'user'}
+        values = {
+            ':time': int(datetime.now().timestamp()),
+            ':bot': record.key.bot_id,
+            ':user': record.key.user_id,
+        }
+        assignments = ['#time = :time', '#bot = :bot', '#user = :user']
+        removes = []
+        conditions = []
+        if self.expiry is not None:
+            # истёкший item не дописывается: его нужно удалить и писать заново
+            names['#expires'] = EXPIRES_ATTRIBUTE
+            values[':now'] = self.expiry.now()
+            conditions.append('(attribute_not_exists(#expires) OR #expires > :now)')
+        if record.state is not MISSING or record.deleted:
+            names['#state'] = 'state'
+            values[':state'] = None if record.state is MISSING else record.state
+            assignments.append('#state = :state')
+            self._state_expiry(values[':state'], assignments, removes, names, values)
+        else:
+            self._data_expiry(assignments, names, values)
+        if record.data is not None or record.deleted:
+            self._data_assignment(record.data or {}, assignments, removes, names, values)
+        elif record.data_updates:
+            names['#data'] = 'data'
+            if create_data:
+                values[':data'] = dict(record.data_updates)
+                assignments.append('#data = :data')
+                conditions.append('attribute_not_exists(#data)')
+            else:
+                for index, (name, value) in enumerate(record.data_updates.items()):
+                    names[f'#f{index}'] = name
+                    values[f':f{index}'] = value
+                    assignments.append(f'#data.#f{index} = :f{index}')
+                conditions.append('attribute_exists(#data)')
+        elif record.state is not MISSING:
+            self._ensure_data_map(assignments, names, values)
+        params = {
+            'Key': self._item_key(record.key),
+            'UpdateExpression': self._update_expression(assignments, removes),
+            'ExpressionAttributeNames': names,
+            'ExpressionAttributeValues': values,
+        }
+        if conditions:
+            params['ConditionExpression'] = ' AND '.join(conditions)
+        return params
+
+    def _merges_data(self, record: _PendingRecord) -> bool:
+        return bool(record.data_updates) and record.data is None and not record.deleted
+
+    @staticmethod
+    def _has_data_map(record: _PendingRecord) -> bool:
+        """Есть ли у item map data; если item в unit of work не читался, считаем, что есть"""
+        item = record.loaded['item'] if record.loaded is not None else None
+        return item is None or 'data' in item
+
+    async def _write_record(self, record: _PendingRecord) -> dict | None:
+        """Пишет record; возвращает data item после записи, если они известны"""
+        if record.deleted and record.state is MISSING and record.data is None:
+            await self.table.delete_item(Key=self._item_key(record.key))
+            return {}
+        if not self._merges_data(record):
+            try:
+                await self.table.update_item(**self._record_update(record))
+            except ClientError as e:
+                # без data_updates условие одно - item не истёк
+                if not _is_condition_failed(e):
+                    raise
+                await self._delete_expired(record.key)
+                await self.table.update_item(**self._record_update(record))
+            return record.data
+        if self.codec is not None:
+            return await self._update_encoded_data(record)
+        # Поля пишутся внутрь существующего map атрибутом UpdateItem без чтения:
+        # один запрос, если у item уже есть map data (его создают set_state и set_data).
+        # Если map ещё нет, атрибут создаётся вторым запросом; гонку двух первых
+        # записей закрывают условия attribute_exists/attribute_not_exists, поэтому
+        # при конкурентной первой записи запросов может быть до четырёх.
+        # С expiry после первой неудачи проверяется, не истёк ли item: истёкший
+        # удаляется, и поля пишутся новым map.
+        attempts = (False, True) if self._has_data_map(record) else (True, False)
+        expiry_checked = self.expiry is None
+        for _ in range(2):
+            for create_data in attempts:
+                try:
+                    response = await self.table.update_item(
+                        **self._record_update(record, create_data=create_data), ReturnValues='ALL_NEW'
+                    )
+                    return self._item_data(response['Attributes']) or {}
+                except ClientError as e:
+                    if not _is_condition_failed(e):
+                        raise
+                if not expiry_checked:
+                    expiry_checked = True
+                    await self._delete_expired(record.key)
+        raise RuntimeError(f'FSM update_data for user {record.key.user_id} did not converge')
+
+    @metrics.timed('fsm_flush')
+    async def _flush(self, records: list[_PendingRecord]):
+        if not records:
+            return
+        if len(records) == 1 or (self.codec is not None and any(map(self._merges_data, records))):
+            # закодированные данные дописываются чтением и записью, в транзакцию не входят
+            results = [await self._write_record(record) for record in records]
+        else:
+            results = await self._write_transaction(records)
+
+        for record, data in zip(records, results):
+            if record.deleted:
+                self._cache_invalidate(record.key)
+            if record.state is not MISSING:
+                self._cache_set('state', record.key, record.state)
+            if data is not None:
+                self._cache_set('data', record.key, data)
+            elif record.data_updates and self.cache is not None:
+                self.cache.invalidate(('data', record.key.bot_id, record.key.user_id))
+
+    async def _write_transaction(self, records: list[_PendingRecord]) -> list[dict | None]:
+        writes = []
+        for record in records:
+            if record.deleted and record.state is MISSING and record.data is None:
+                writes.append({'Delete': {'Key': self._item_key(record.key)}})
+            else:
+                writes.append({'Update': self._record_update(record, create_data=not self._has_data_map(record))})
+        client = self.table.meta.client
+        try:
+            for start in range(0, len(writes), 100):
+                await client.transact_write_items(
+                    TransactItems=[self._serialize_write(write) for write in writes[start:start + 100]]
+                )
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') != 'TransactionCanceledException':
+                raise
+            # не выполнилось условие одного из items (например, у него ещё нет map data):
+            # items пишутся по одному, каждый со своими повторами
+            return [await self._write_record(record) for record in records]
+        return [{} if record.deleted and record.data is None else record.data for record in records]
+
+    def _serialize_write(self, write: dict) -> dict:
+        ((operation, params),) = write.items()
+        params = {
+            **params,
+            'TableName': self.table.name,
+            'Key': marshal_item(params['Key']),
+        }
+        if 'ExpressionAttributeValues' in params:
+            params['ExpressionAttributeValues'] = marshal_item(params['ExpressionAttributeValues'])
+        return {operation: params}
+
+    async def _get_attributes(self, key, *attributes: str) -> dict:
+        """Item с указанными атрибутами; истёкший item - пустой словарь"""
+        if self.expiry is not None:
+            attributes += (EXPIRES_ATTRIBUTE,)
+        names = {f'#attr{index}': attribute for index, attribute in enumerate(attributes)}
+        response = await self.table.get_item(
+            Key=self._item_key(key),
+            ProjectionExpression=', '.join(names),
+            ExpressionAttributeNames=names,
+        )
+        item = response.get('Item', {})
+        if self.expiry is not None and self.expiry.is_expired(item):
+            await self._delete_expired(key)
+            return {}
+        return item
+
+    @staticmethod
+    def _data_attributes() -> tuple[str, ...]:
+        # data_bin читается и без codec: item могли записать, пока codec был включён
+        return DATA_BLOB_ATTRIBUTE, 'data'
+
+    async def _get_data(self, key) -> dict | None:
+        return self._item_data(await self._get_attributes(key, *self._data_attributes()))
+
+    async def _delete_expired(self, key):
+        # DynamoDB TTL удаляет items с задержкой до нескольких суток;
+        # условие не даёт удалить item, который тем временем продлили
+        try:
+            await self.table.delete_item(
+                Key=self._item_key(key),
+                ConditionExpression='#expires <= :now',
+                ExpressionAttributeNames={'#expires': EXPIRES_ATTRIBUTE},
+                ExpressionAttributeValues={':now': self.expiry.now()},
+            )
+        except ClientError as e:
+            if not _is_condition_failed(e):
+                raise
+        self._cache_invalidate(key)
+
+    @metrics.timed('fsm_set_state')
     async def set_state(self, *, chat=None, user=None, state=None, key=None):
-        if state:
+        if isinstance(state, State):
             state = state.state
-        data = {
-            'time': int(datetime.now().timestamp()),
-            'bot': key.bot_id,
-            'user': key.user_id,
-            'state': state
-            }
-        async with self.table as table:
-            await table.put_item(
-                Item={
-                    'partkey': f'state_{key.bot_id}',
-                    'sortkey': f'{key.user_id}',
-                    **data
-                }
-            )
+        record = self._pending_record(key, create=True)
+        if record is not None:
+            record.state = state
+            return
+        await self._write_record(_PendingRecord(key=key, state=state))
+        self._cache_set('state', key, state)
 
+    @metrics.timed('fsm_get_state')
     async def get_state(self, *, chat=None, user=None, key=None):
-        async with self.table as table:
-            response = await table.get_item(
-                Key={
-                    'partkey': f'state_{key.bot_id}',
-                    'sortkey': f'{key.user_id}'
-                }
-            )
-        item = response.get('Item')
-        if item:
-            return item['state']
-        return None
+        record = self._pending_record(key, create=True)
+        if record is not None:
+            if record.state is not MISSING:
+                return record.state
+            if record.deleted:
+                return None
+            return (await self._load(record))['state']
+        cached = self._cache_get('state', key)
+        if cached is not MISSING:
+            return cached
+        state = (await self._get_attributes(key, 'state')).get('state')
+        self._cache_set('state', key, state)
+        return state
 
+    @metrics.timed('fsm_set_data')
     async def set_data(self, *, chat=None, user=None, data=None, key=None):
-        async with self.table as table:
-            await table.put_item(
-                Item={
-                    'partkey': f'data_state_{key.bot_id}',
-                    'sortkey': f'{key.user_id}',
-                    **data
-                }
-            )
+        data = dict(data or {})
+        record = self._pending_record(key, create=True)
+        if record is not None:
+            record.data = data
+            record.data_updates.clear()
+            return
+        await self._write_record(_PendingRecord(key=key, data=data))
+        self._cache_set('data', key, data)
 
+    @metrics.timed('fsm_get_data')
     async def get_data(self, *, chat=None, user=None, default=None, key=None):
-        async with self.table as table:
-            response = await table.get_item(
-                Key={
-                    'partkey': f'data_state_{key.bot_id}',
-                    'sortkey': f'{key.user_id}',
-                }
-            )
-        item = response.get('Item')
-        if item:
-            return item
+        record = self._pending_record(key, create=True)
+        if record is not None:
+            if record.data is not None:
+                return record.data.copy()
+            if record.deleted:
+                return default or {}
+            current = {**(await self._load(record))['data'], **record.data_updates}
+            return current or default or {}
+        cached = self._cache_get('data', key)
+        if cached is MISSING:
+            cached = await self._get_data(key)
+            self._cache_set('data', key, cached)
+        if cached:
+            return cached.copy()
         return default or {}
 
+    @metrics.timed('fsm_update_data')
     async def update_data(self, *, chat=None, user=None, data=None, key,  **kwargs):
-        current_data = await self.get_data(chat=chat, user=user, key=key, default={})
-        if not isinstance(current_data, dict):
-            current_data = {}
-        current_data.update(data or {})
-        await self.set_data(chat=chat, user=user, data=current_data, key=key)
-        return current_data
+        if not data:
+            return await self.get_data(key=key)
+
+        record = self._pending_record(key, create=True)
+        if record is not None:
+            if record.data is not None or record.deleted:
+                record.data = {**(record.data or {}), **data}
+                return record.data.copy()
+            # в базу уйдут только эти поля; item читается, только если хендлер
+            # ещё не читал его в этом unit of work, - ради возвращаемого значения
+            record.data_updates.update(data)
+            return {**(await self._load(record))['data'], **record.data_updates}
 
+        current_data = await self._write_record(_PendingRecord(key=key, data_updates=dict(data)))
+        self._cache_set('data', key, current_data)
+        return current_data.copy()
+
+    async def _update_encoded_data(self, record: _PendingRecord) -> dict:
+        # Закодированные данные нельзя дописать по полям: чтение, слияние и запись
+        # с условием, что data_bin не изменился с момента чтения. Поэтому update_data
+        # с codec - два запроса (GetItem и UpdateItem) вместо одного; item, уже
+        # прочитанный в unit of work, повторно не читается. Если data_bin меняют
+        # параллельно, попытка повторяется, после третьей неудачи - RuntimeError.
+        item = record.loaded['item'] if record.loaded is not None else None
+        for _ in range(3):
+            if item is None:
+                item = await self._get_attributes(record.key, DATA_BLOB_ATTRIBUTE, 'data')
+            current_data = {**(self._item_data(item) or {}), **record.data_updates}
+            params = self._record_update(dataclasses.replace(record, data=current_data, data_updates={}))
+            if DATA_BLOB_ATTRIBUTE in item:
+                self._add_condition(params, '#blob = :read_blob')
+                params['ExpressionAttributeValues'][':read_blob'] = bytes(item[DATA_BLOB_ATTRIBUTE])
+            else:
+                self._add_condition(params, 'attribute_not_exists(#blob)')
+            try:
+                await self.table.update_item(**params)
+                return current_data
+            except ClientError as e:
+                if not _is_condition_failed(e):
+                    raise
+            item = None
+        raise RuntimeError(f'FSM update_data for user {record.key.user_id} did not converge')
+
+    @metrics.timed('fsm_reset_state_data')
     async def reset_state_data(self, *, chat=None, user=None, key=None):
-        async with self.table as table:
-            await table.delete_item(
-                Key={
-                    'partkey': f'state_data_{key.bot_id}',
-                    'sortkey': f'{key.user_id}'
-                }
-            )
+        record = self._pending_record(key, create=True)
+        if record is not None:
+            record.deleted = True
+            record.state = MISSING
+            record.data = None
+            record.data_updates.clear()
+            return
+        await self.table.delete_item(Key=self._item_key(key))
+        self._cache_invalidate(key)
@@ -0,0 +1,199 @@
+import asyncio
+import contextvars
+from contextlib import asynccontextmanager
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage
+
+from app.core.log_config import logger
+from app.core.metrics import metrics
+from app.tg.fsm.cache import TTLCache, MISSING
+from app.tg.fsm.storage import DynamoDBStorage, _PendingRecord
+
+WRITE_THROUGH = 'write_through'
+WRITE_BACK = 'write_back'
+CONSISTENCY_MODES = (WRITE_THROUGH, WRITE_BACK)
+
+
+class TieredStorage(BaseStorage):
+    """
+    FSM storage из двух уровней: L1 - TTLCache в памяти процесса, L2 - DynamoDBStorage.
+
+    Чтения обслуживает L1, пока запись моложе ttl кэша, иначе L2. ttl ограничивает,
+    насколько долго другой экземпляр приложения может видеть устаревшее состояние.
+
+    consistency:
+        write_through - запись уходит в L2, затем обновляется L1; хендлер продолжает
+            работу только после записи в DynamoDB.
+        write_back - запись попадает в L1 и в очередь, очередь пишется в L2 одним
+            unit_of_work через flush_delay секунд, при flush() и close(). Последние
+            записи теряются при падении процесса, а в serverless функции фоновая
+            запись может не успеть до заморозки - режим для polling и uvicorn.
+    """
+
+    def __init__(
+        self,
+        l2: DynamoDBStorage,
+        cache: TTLCache,
+        consistency: str = WRITE_THROUGH,
+        flush_delay: float = 1,
+    ):
+        if consistency not in CONSISTENCY_MODES:
+            raise ValueError(f'Unknown FSM consistency {consistency!r}, expected one of {CONSISTENCY_MODES}')
+        self.l2 = l2
+        self.cache = cache
+        self.consistency = consistency
+        self.flush_delay = flush_delay
+        self._dirty: dict[tuple, _PendingRecord] = {}
+        self._flush_task: asyncio.Task | None = None
+
+    @property
+    def table(self):
+        return self.l2.table
+
+    @table.setter
+    def table(self, table):
+        self.l2.table = table
+
+    async def close(self):
+        await self.flush()
+        await self.l2.close()
+
+    async def wait_closed(self):
+        pass
+
+    def _cache_get(self, kind: str, key):
+        # несброшенные записи write_back важнее L1: запись в L1 могла быть вытеснена
+        record = self._dirty.get((key.bot_id, key.user_id))
+        if record is not None:
+            if kind == 'state' and record.state is not MISSING:
+                return record.state
+            if kind == 'data' and record.data is not None:
+                return record.data
+            if record.deleted:
+                return None if kind == 'state' else {}
+        value = self.cache.get((kind, key.bot_id, key.user_id))
+        metrics.inc('fsm_l1_hits_total' if value is not MISSING else 'fsm_l1_misses_total', kind)
+        return value
+
+    def _cache_set(self, kind: str, key, value):
+        self.cache.set((kind, key.bot_id, key.user_id), value)
+
+    @asynccontextmanager
+    async def unit_of_work(self):
+        try:
+            async with self.l2.unit_of_work():
+                yield
+        except BaseException:
+            # L1 уже видит записи, которые L2 мог не принять
+            self.cache.clear()
+            raise
+
+    def _dirty_record(self, key) -> _PendingRecord:
+        record_key = (key.bot_id, key.user_id)
+        record = self._dirty.get(record_key)
+        if record is None:
+            record = self._dirty[record_key] = _PendingRecord(key=key)
+        if self._flush_task is None or self._flush_task.done():
+            self._schedule_flush()
+        return record
+
+    def _schedule_flush(self):
+        # задача стартует в пустом контексте: в контексте хендлера она унаследовала бы
+        # его unit of work, и запись очереди ушла бы в чужую, уже закрытую транзакцию
+        self._flush_task = asyncio.create_task(self._delayed_flush(), context=contextvars.Context())
+
+    async def _delayed_flush(self):
+        await asyncio.sleep(self.flush_delay)
+        try:
+            await self.flush()
+        except Exception:
+            # записи вернулись в очередь, следующая попытка через flush_delay
+            self._schedule_flush()
+
+    async def flush(self):
+        """Пишет накопленные в режиме write_back изменения в L2"""
+        if not self._dirty:
+            return
+        records, self._dirty = self._dirty, {}
+        try:
+            # flush() из хендлера тоже пишет в своём unit of work, а не в unit of work
+            # хендлера: очередь уже забрана и при его ошибке пропала бы
+            await asyncio.create_task(self._write_records(records), context=contextvars.Context())
+        except Exception as e:
+            logger.error(f'FSM write-back flush of {len(records)} records failed: {e}')
+            # более свежие изменения тех же ключей важнее неудавшихся
+            self._dirty = {**records, **self._dirty}
+            raise
+
+    async def _write_records(self, records: dict[tuple, _PendingRecord]):
+        async with self.l2.unit_of_work():
+            for record in records.values():
+                if record.deleted:
+                    await self.l2.reset_state_data(key=record.key)
+                if record.state is not MISSING:
+                    await self.l2.set_state(key=record.key, state=record.state)
+                if record.data is not None:
+                    await self.l2.set_data(key=record.key, data=record.data)
+
+    @metrics.timed('fsm_tiered_set_state')
+    async def set_state(self, *, chat=None, user=None, state=None, key=None):
+        if isinstance(state, State):
+            state = state.state
+        if self.consistency == WRITE_BACK:
+            self._dirty_record(key).state = state
+        else:
+            await self.l2.set_state(key=key, state=state)
+        self._cache_set('state', key, state)
+
+    @metrics.timed('fsm_tiered_get_state')
+    async def get_state(self, *, chat=None, user=None, key=None):
+        state = self._cache_get('state', key)
+        if state is MISSING:
+            state = await self.l2.get_state(key=key)
+            self._cache_set('state', key, state)
+        return state
+
+    @metrics.timed('fsm_tiered_set_data')
+    async def set_data(self, *, chat=None, user=None, data=None, key=None):
+        data = dict(data or {})
+        if self.consistency == WRITE_BACK:
+            self._dirty_record(key).data = data
+        else:
+            await self.l2.set_data(key=key, data=data)
+        self._cache_set('data', key, data)
+
+    @metrics.timed('fsm_tiered_get_data')
+    async def get_data(self, *, chat=None, user=None, default=None, key=None):
+        data = self._cache_get('data', key)
+        if data is MISSING:
+            data = await self.l2.get_data(key=key)
+            self._cache_set('data', key, data)
+        if data:
+            return data.copy()
+        return default or {}
+
+    @metrics.timed('fsm_tiered_update_data')
+    async def update_data(self, *, chat=None, user=None, data=None, key, **kwargs):
+        if not data:
+            return await self.get_data(key=key)
+        if self.consistency == WRITE_BACK:
+            current = await self.get_data(key=key)
+            current.update(data)
+            self._dirty_record(key).data = current
+        else:
+            current = await self.l2.update_data(key=key, data=data)
+        self._cache_set('data', key, current)
+        return current.copy()
+
+    @metrics.timed('fsm_tiered_reset_state_data')
+    async def reset_state_data(self, *, chat=None, user=None, key=None):
+        if self.consistency == WRITE_BACK:
+            record = self._dirty_record(key)
+            record.deleted = True
+            record.state = MISSING
+            record.data = None
+        else:
+            await self.l2.reset_state_data(key=key)
+        self._cache_set('state', key, None)
+        self._cache_set('data', key, {})
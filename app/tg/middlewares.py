@@ -0,0 +1,61 @@
+import asyncio
+import typing as t
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import Response
+from aiogram.dispatcher.middlewares.user_context import UserContextMiddleware
+from aiogram.types import TelegramObject, Update
+
+from app.core.log_config import bind_log_context
+from app.core.metrics import metrics
+
+
+class ConcurrencyLimitMiddleware(BaseMiddleware):
+    """Outer middleware для update: не больше limit update обрабатываются одновременно"""
+
+    def __init__(self, limit: int):
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def __call__(
+        self,
+        handler: t.Callable[[TelegramObject, dict[str, t.Any]], t.Awaitable[t.Any]],
+        event: TelegramObject,
+        data: dict[str, t.Any],
+    ) -> t.Any:
+        async with self._semaphore:
+            return await handler(event, data)
+
+
+class LogContextMiddleware(BaseMiddleware):
+    """Outer middleware для update: update_id, user_id и chat_id попадают во все записи лога"""
+
+    async def __call__(
+        self,
+        handler: t.Callable[[TelegramObject, dict[str, t.Any]], t.Awaitable[t.Any]],
+        event: TelegramObject,
+        data: dict[str, t.Any],
+    ) -> t.Any:
+        if not isinstance(event, Update):
+            return await handler(event, data)
+        context = UserContextMiddleware.resolve_event_context(event)
+        with bind_log_context(
+            update_id=event.update_id,
+            user_id=context.user.id if context.user else None,
+            chat_id=context.chat.id if context.chat else None,
+        ):
+            return await handler(event, data)
+
+
+class BotApiMetricsMiddleware(BaseRequestMiddleware):
+    """Request middleware Bot: время каждого вызова Bot API в метриках по имени метода"""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot: Bot,
+        method: TelegramMethod,
+    ) -> Response:
+        with metrics.timer(f'bot_api.{method.__api_method__}'):
+            return await make_request(bot, method)
@@ -2,9 +2,13 @@ from aiogram import Router
 from aiogram.filters import Command, CommandStart
 from aiogram.types import Message
 
-router = Router()
 
-
-@router.message(CommandStart)
 async def start_answer(message: Message):
-    await message.answer('Привет это старт команда')
+    return message.answer('Привет это старт команда')
+
+
+def create_router() -> Router:
+    # роутер подключается только к одному Dispatcher, поэтому каждому Dispatcher - свой
+    router = Router(name='start')
+    router.message.register(start_answer, CommandStart)
+    return router
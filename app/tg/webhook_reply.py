@@ -0,0 +1,116 @@
+import typing as t
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import (
+    AnswerCallbackQuery,
+    AnswerInlineQuery,
+    AnswerPreCheckoutQuery,
+    AnswerShippingQuery,
+    SendChatAction,
+    TelegramMethod,
+)
+from aiogram.methods.base import Response
+from aiogram.types import Update
+
+from app.config import settings
+
+
+# Telegram выполнит ответ на webhook после всех вызовов, сделанных во время обработки.
+# Откладывать можно только методы, порядок которых относительно остальных не важен;
+# deleteMessage или editMessageText, отложенные за следующий sendMessage, изменили бы
+# то, что видит пользователь. Результат всех этих методов - просто True, который
+# Telegram не возвращает из ответа на webhook.
+DEFERRABLE_METHODS: frozenset[type[TelegramMethod]] = frozenset({
+    AnswerCallbackQuery,
+    AnswerInlineQuery,
+    AnswerPreCheckoutQuery,
+    AnswerShippingQuery,
+    SendChatAction,
+})
+
+
+class WebhookReply:
+    """Первый подходящий вызов Bot API за время обработки update, который уйдёт ответом на webhook"""
+
+    def __init__(self):
+        self.payload: dict | None = None
+
+    @staticmethod
+    def is_eligible(method: TelegramMethod) -> bool:
+        return type(method) in DEFERRABLE_METHODS
+
+    def offer(self, bot: Bot, method: TelegramMethod) -> bool:
+        if self.payload is not None or not self.is_eligible(method):
+            return False
+        self.payload = build_reply_payload(bot, method)
+        return self.payload is not None
+
+
+_webhook_reply: ContextVar[WebhookReply | None] = ContextVar('webhook_reply', default=None)
+
+
+@contextmanager
+def collect_webhook_reply() -> t.Iterator[WebhookReply]:
+    reply = WebhookReply()
+    token = _webhook_reply.set(reply)
+    try:
+        yield reply
+    finally:
+        _webhook_reply.reset(token)
+
+
+class WebhookReplyMiddleware(BaseRequestMiddleware):
+    """Request middleware Bot: внутри collect_webhook_reply() откладывает первый подходящий вызов"""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot: Bot,
+        method: TelegramMethod,
+    ) -> Response:
+        reply = _webhook_reply.get()
+        if reply is not None and reply.offer(bot, method):
+            return Response(ok=True, result=True)
+        return await make_request(bot, method)
+
+
+def build_reply_payload(bot: Bot, method: TelegramMethod) -> dict | None:
+    """
+    JSON тело ответа на webhook для вызова метода Bot API.
+    Методы с загрузкой файлов так отправить нельзя, для них возвращается None.
+    """
+    files = {}
+    payload = {'method': method.__api_method__}
+    for key, value in method.model_dump(warnings=False).items():
+        value = bot.session.prepare_value(value, bot=bot, files=files, _dumps_json=False)
+        if value is not None:
+            payload[key] = value
+    if files:
+        return None
+    return payload
+
+
+async def process_update(dp: Dispatcher, bot: Bot, update: Update) -> dict | None:
+    """
+    Обрабатывает update и возвращает JSON для ответа на webhook, если он есть.
+
+    С WEBHOOK_REPLY первый вызов из DEFERRABLE_METHODS или, если его не было, метод,
+    который вернул хендлер, отдаются Telegram в теле ответа вместо отдельного запроса.
+    Telegram выполнит его уже после всех вызовов, сделанных во время обработки.
+    """
+    if not settings.WEBHOOK_REPLY:
+        result = await dp.feed_update(update=update, bot=bot)
+        if isinstance(result, TelegramMethod):
+            await bot(result)
+        return None
+
+    with collect_webhook_reply() as reply:
+        result = await dp.feed_update(update=update, bot=bot)
+    if isinstance(result, TelegramMethod):
+        if reply.payload is None and (payload := build_reply_payload(bot, result)) is not None:
+            return payload
+        await bot(result)
+    return reply.payload
@@ -0,0 +1,116 @@
+import asyncio
+import typing as t
+from collections import deque
+
+from aiogram import Bot, Dispatcher
+from aiogram.dispatcher.middlewares.user_context import UserContextMiddleware
+from aiogram.methods import TelegramMethod
+from aiogram.types import Update
+
+from app.core.log_config import logger
+from app.core.metrics import metrics
+
+# gauge /metrics: update, принятые с ответом 200 и ещё не обработанные
+QUEUE_DEPTH_GAUGE = 'webhook_queue_depth'
+
+
+class UpdateWorkerPoolClosed(RuntimeError):
+    """Пул останавливается и update больше не принимает"""
+
+
+class UpdateWorkerPool:
+    """
+    Обработка update в фоне после ответа Telegram.
+
+    Update одного чата (или пользователя) обрабатываются строго по порядку,
+    разные чаты - параллельно. Одновременно в работе и в очереди не больше
+    max_in_flight update: submit() ждёт, пока освободится место. Глубина
+    очереди публикуется gauge webhook_queue_depth, пока пул не закрыт.
+
+    Только для долгоживущего процесса (uvicorn, polling). В Cloud Functions
+    экземпляр могут заморозить или остановить сразу после ответа, и принятый
+    update потеряется: Telegram уже получил 200 и повторять его не будет.
+    """
+
+    def __init__(self, dp: Dispatcher, bot: Bot, max_in_flight: int = 64):
+        self.dp = dp
+        self.bot = bot
+        self.max_in_flight = max_in_flight
+        self._capacity = asyncio.Semaphore(max_in_flight)
+        self._lanes: dict[t.Hashable, deque[Update]] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self._depth = 0
+        self._closed = False
+        metrics.register_gauge(QUEUE_DEPTH_GAUGE, self._read_depth)
+
+    @property
+    def depth(self) -> int:
+        """Сколько update принято и ещё не обработано"""
+        return self._depth
+
+    def _read_depth(self) -> int:
+        return self._depth
+
+    @staticmethod
+    def ordering_key(update: Update) -> t.Hashable:
+        context = UserContextMiddleware.resolve_event_context(update)
+        if context.chat is not None:
+            return 'chat', context.chat.id
+        if context.user is not None:
+            return 'user', context.user.id
+        return 'update', update.update_id
+
+    async def submit(self, update: Update) -> None:
+        if self._closed:
+            raise UpdateWorkerPoolClosed('UpdateWorkerPool is closed')
+        await self._capacity.acquire()
+        if self._closed:
+            # пул закрыли, пока submit ждал места
+            self._capacity.release()
+            raise UpdateWorkerPoolClosed('UpdateWorkerPool is closed')
+        self._depth += 1
+        key = self.ordering_key(update)
+        lane = self._lanes.get(key)
+        if lane is not None:
+            lane.append(update)
+            return
+        self._lanes[key] = deque([update])
+        task = asyncio.create_task(self._run_lane(key))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_lane(self, key: t.Hashable) -> None:
+        lane = self._lanes[key]
+        try:
+            while lane:
+                update = lane.popleft()
+                try:
+                    result = await self.dp.feed_update(bot=self.bot, update=update)
+                    if isinstance(result, TelegramMethod):
+                        await self.bot(result)
+                except Exception as e:
+                    logger.error(f'Ошибка обработки update {update.update_id} в фоне: {e}')
+                finally:
+                    self._depth -= 1
+                    self._capacity.release()
+        finally:
+            # при отмене оставшиеся в очереди update тоже освобождают место
+            for _ in lane:
+                self._depth -= 1
+                self._capacity.release()
+            del self._lanes[key]
+
+    async def close(self, timeout: float = 10) -> None:
+        """Перестать принимать update и дождаться обработки уже принятых"""
+        self._closed = True
+        if not self._tasks:
+            metrics.unregister_gauge(QUEUE_DEPTH_GAUGE, self._read_depth)
+            return
+        logger.info(f'Drain update workers: {self._depth} updates in flight')
+        done, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.error(f'Drain timeout: {len(pending)} lanes cancelled, {self._depth} updates dropped')
+            await asyncio.gather(*pending, return_exceptions=True)
+        metrics.unregister_gauge(QUEUE_DEPTH_GAUGE, self._read_depth)
@@ -0,0 +1,129 @@
+import asyncio
+import base64
+import re
+from urllib.parse import urlencode, urlsplit
+
+from app.yc.types import YFunctionEvent, YFunctionResponse
+from app.core.log_config import dispatcher_loger
+
+_BINARY_CONTENT_TYPE = re.compile(r"(?:image|video|audio)/|.*(?:zip|pdf)")
+_DEFAULT_HOST = "raw-function.net"
+
+
+def is_binary_content_type(content_type: str | None) -> bool:
+    if not content_type:
+        return False
+    return _BINARY_CONTENT_TYPE.match(content_type) is not None
+
+
+def event_body(event: YFunctionEvent) -> bytes:
+    body = event.get("body")
+    if not body:
+        return b""
+    if event.get("isBase64Encoded"):
+        return base64.b64decode(body)
+    if isinstance(body, bytes):
+        return body
+    return body.encode()
+
+
+def _query_string(event: YFunctionEvent, url_query: str) -> bytes:
+    params = event.get("multiValueQueryStringParameters") or event.get("queryStringParameters")
+    if not params:
+        return url_query.encode("latin-1")
+    query = urlencode(params, doseq=True)
+    if url_query:
+        query = f"{url_query}&{query}"
+    return query.encode("latin-1")
+
+
+def build_scope(event: YFunctionEvent) -> dict:
+    """Собирает ASGI http scope прямо из события Yandex Cloud Functions"""
+    headers = event.get("headers") or {}
+    host = headers.get("Host") or headers.get("host") or _DEFAULT_HOST
+    scheme = "https"
+    if host.startswith("http"):
+        scheme, _, host = host.partition("://")
+
+    url = urlsplit(event.get("url") or "/")
+    path = url.path or "/"
+    client_ip = ((event.get("requestContext") or {}).get("identity") or {}).get("sourceIp")
+
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": "2.3"},
+        "http_version": "1.1",
+        "method": event["httpMethod"],
+        "scheme": scheme,
+        "path": path,
+        "raw_path": path.encode("latin-1"),
+        "query_string": _query_string(event, url.query),
+        "root_path": "",
+        "headers": [
+            (name.lower().encode("latin-1"), str(value).encode("latin-1"))
+            for name, value in headers.items()
+        ],
+        "server": (host, 443 if scheme == "https" else 80),
+        "client": (client_ip, 0) if client_ip else None,
+    }
+
+
+def _response_headers(raw_headers: list[tuple[bytes, bytes]]) -> dict[str, str]:
+    headers: dict[str, str] = {}
+    for raw_name, raw_value in raw_headers:
+        name, value = raw_name.decode("latin-1"), raw_value.decode("latin-1")
+        headers[name] = f"{headers[name]}, {value}" if name in headers else value
+    return headers
+
+
+async def invoke_asgi(app, event: YFunctionEvent) -> YFunctionResponse:
+    """
+    Прогоняет событие функции через ASGI приложение без промежуточного http клиента
+    и возвращает ответ в формате YFunctionResponse.
+    """
+    scope = build_scope(event)
+    request_message = {"type": "http.request", "body": event_body(event), "more_body": False}
+    request_sent = False
+    response_complete = asyncio.Event()
+    status_code = 500
+    raw_headers = []
+    body_chunks = []
+    response_started = False
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return request_message
+        await response_complete.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status_code, raw_headers, response_started
+        if message["type"] == "http.response.start":
+            response_started = True
+            status_code = message["status"]
+            raw_headers = message.get("headers", [])
+        elif message["type"] == "http.response.body":
+            body_chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                response_complete.set()
+
+    try:
+        await app(scope, receive, send)
+    except Exception as e:
+        if not response_started:
+            raise
+        dispatcher_loger.error(f"ASGI приложение упало после начала ответа: {e}")
+    finally:
+        response_complete.set()
+
+    headers = _response_headers(raw_headers)
+    body = b"".join(body_chunks)
+    is_binary_ = is_binary_content_type(headers.get("content-type"))
+    return {
+        "statusCode": status_code,
+        "headers": headers,
+        "body": base64.b64encode(body).decode("utf-8") if is_binary_ else body.decode(),
+        "isBase64Encoded": is_binary_,
+    }
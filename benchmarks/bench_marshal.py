@@ -0,0 +1,150 @@
+"""
+(Де)сериализация DynamoDB: слой boto3 resource против app.db.marshal и FastTable.
+
+marshal/* - чистый CPU: TypeSerializer/TypeDeserializer против marshal_item/
+unmarshal_item на типичных FSM items. table/* - операции DynamoDBStorage через
+Table resource и через FastTable на одном клиенте (см. benchmarks/dynamo.py).
+
+    python -m benchmarks.bench_marshal [--iterations 2000] [--json marshal.json]
+"""
+import argparse
+import asyncio
+import itertools
+
+from aiogram.fsm.storage.base import StorageKey
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+
+from app.db.marshal import marshal_item, unmarshal_item
+from app.tg.fsm.states import ClientRegister
+from app.tg.fsm.storage import DynamoDBStorage
+from benchmarks.dynamo import (
+    CREDENTIALS,
+    ENDPOINT,
+    REGION,
+    TABLE_NAME,
+    configure_app_environment,
+    count_round_trips,
+    ensure_table,
+)
+from benchmarks.harness import RoundTrips, measure, print_table, save_results
+
+USERS = 50
+
+ITEMS = {
+    'state_item': {
+        'partkey': 'fsm_7272718541',
+        'sortkey': '123456789',
+        'state': ClientRegister.email.state,
+        'time': 1_700_000_000,
+        'bot': 7272718541,
+        'user': 123456789,
+    },
+    'form_item': {
+        'partkey': 'fsm_7272718541',
+        'sortkey': '123456789',
+        'state': ClientRegister.esoteric.state,
+        'time': 1_700_000_000,
+        'data': {
+            'name': 'Анна',
+            'age': 30,
+            'email': 'anna@example.net',
+            'subscribed': True,
+            'answers': [{'question': n, 'answer': f'ответ {n}', 'score': n * 3} for n in range(20)],
+        },
+    },
+}
+
+
+def marshal_cases() -> dict:
+    serializer = TypeSerializer()
+    deserializer = TypeDeserializer()
+    cases = {}
+    for name, item in ITEMS.items():
+        serialized = marshal_item(item)
+
+        async def boto3_serialize(item=item):
+            {key: serializer.serialize(value) for key, value in item.items()}
+
+        async def fast_serialize(item=item):
+            marshal_item(item)
+
+        async def boto3_deserialize(serialized=serialized):
+            {key: deserializer.deserialize(value) for key, value in serialized.items()}
+
+        async def fast_deserialize(serialized=serialized):
+            unmarshal_item(serialized)
+
+        cases[f'marshal/{name}/serialize/boto3'] = boto3_serialize
+        cases[f'marshal/{name}/serialize/fast'] = fast_serialize
+        cases[f'marshal/{name}/deserialize/boto3'] = boto3_deserialize
+        cases[f'marshal/{name}/deserialize/fast'] = fast_deserialize
+    return cases
+
+
+def table_cases(storage: DynamoDBStorage) -> dict:
+    user_ids = itertools.cycle(range(1, USERS + 1))
+
+    def next_key() -> StorageKey:
+        user_id = next(user_ids)
+        return StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+
+    async def get_data():
+        await storage.get_data(key=next_key())
+
+    async def update_data():
+        await storage.update_data(key=next_key(), data={'answers': ITEMS['form_item']['data']['answers']})
+
+    async def handler_cycle():
+        key = next_key()
+        await storage.get_state(key=key)
+        await storage.get_data(key=key)
+        await storage.set_state(key=key, state=ClientRegister.email)
+
+    return {'get_data': get_data, 'update_data': update_data, 'handler_cycle': handler_cycle}
+
+
+async def run(iterations: int) -> dict:
+    results = {}
+    for name, case in marshal_cases().items():
+        results[name] = await measure(case, iterations, alloc_iterations=100)
+
+    configure_app_environment()
+    from app.db.connection import DynamoConnectionManager
+    from app.db.fast_table import FastTable
+
+    dynamo = DynamoConnectionManager(endpoint_url=ENDPOINT, region_name=REGION, **CREDENTIALS)
+    round_trips = RoundTrips()
+    count_round_trips(dynamo, round_trips)
+    async with dynamo:
+        await ensure_table(dynamo.client)
+        variants = {
+            'resource': DynamoDBStorage(await dynamo.resource.Table(TABLE_NAME)),
+            'fast': DynamoDBStorage(FastTable(dynamo.client, TABLE_NAME)),
+        }
+        # таблица заполняется заранее, чтобы get_data читал реальные данные
+        for case in table_cases(variants['fast']).values():
+            for _ in range(USERS):
+                await case()
+        table_iterations = max(iterations // 10, 20)
+        for variant, storage in variants.items():
+            for name, case in table_cases(storage).items():
+                results[f'table/{name}/{variant}'] = await measure(
+                    case, table_iterations, round_trips={'dynamodb': round_trips}
+                )
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--json', help='куда сохранить результат')
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.iterations))
+    print_table(results)
+    if args.json:
+        save_results(args.json, 'marshal', results, dynamodb=ENDPOINT)
+
+
+if __name__ == '__main__':
+    main()
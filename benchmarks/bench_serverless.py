@@ -0,0 +1,138 @@
+"""
+Холодные и тёплые вызовы function_app.handle и entry_point.handler.
+
+Каждый холодный старт - отдельный процесс: импорт модуля, первый вызов и
+несколько тёплых вызовов в том же процессе. DynamoDB - локальная (см.
+benchmarks/dynamo.py), Bot API - HTTP заглушка в родительском процессе.
+
+    python -m benchmarks.bench_serverless [--cold-runs 5] [--warm 50] [--json serverless.json]
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import urllib.request
+
+from benchmarks.dynamo import ENDPOINT, configure_app_environment, count_round_trips, ensure_table
+from benchmarks.harness import RoundTrips, latency_stats, print_table, save_results
+from benchmarks.updates import load_updates, yc_event
+
+TARGETS = {
+    'function_app.handle': ('function_app', 'handle'),
+    'entry_point.handler': ('entry_point', 'handler'),
+}
+
+
+def telegram_total(url: str) -> int:
+    with urllib.request.urlopen(f'{url}/stats') as response:
+        return sum(json.load(response).values())
+
+
+async def child(target: str, fixture: str, warm: int) -> dict:
+    """Выполняется в дочернем процессе: один холодный старт и warm тёплых вызовов"""
+    event = yc_event(load_updates()[fixture])
+    telegram_url = os.environ['TG_API_SERVER']
+    module_name, attr = TARGETS[target]
+
+    started = time.perf_counter()
+    handler = getattr(importlib.import_module(module_name), attr)
+    import_s = time.perf_counter() - started
+
+    telegram_before = telegram_total(telegram_url)
+    dynamo_trips = RoundTrips()
+    cold_started = time.perf_counter()
+    # импорт и сессия aioboto3 всё равно нужны первому вызову, поэтому входят в холодный старт
+    from app.db.connection import dynamo_manager
+
+    count_round_trips(dynamo_manager, dynamo_trips)
+    response = await handler(event, None)
+    cold_s = time.perf_counter() - cold_started
+    assert response['statusCode'] == 200, response
+    cold_trips = {'dynamodb': dynamo_trips.total(), 'telegram': telegram_total(telegram_url) - telegram_before}
+
+    samples = []
+    dynamo_before = dynamo_trips.total()
+    telegram_before = telegram_total(telegram_url)
+    for _ in range(warm):
+        warm_started = time.perf_counter()
+        await handler(event, None)
+        samples.append(time.perf_counter() - warm_started)
+    return {
+        'import_s': import_s,
+        'cold_s': cold_s,
+        'cold_round_trips': cold_trips,
+        'warm_samples': samples,
+        'warm_round_trips': {
+            'dynamodb': round((dynamo_trips.total() - dynamo_before) / max(warm, 1), 2),
+            'telegram': round((telegram_total(telegram_url) - telegram_before) / max(warm, 1), 2),
+        },
+        'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+async def spawn(target: str, fixture: str, warm: int, env: dict) -> dict:
+    # subprocess.run в потоке: цикл событий родителя тем временем обслуживает заглушку Bot API
+    process = await asyncio.to_thread(
+        subprocess.run,
+        [sys.executable, '-m', 'benchmarks.bench_serverless',
+         '--child', target, '--fixture', fixture, '--warm', str(warm)],
+        env=env, capture_output=True, text=True,
+    )
+    if process.returncode:
+        raise RuntimeError(f'{target} child failed:\n{process.stderr}')
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+async def run(cold_runs: int, warm: int, fixture: str) -> dict:
+    # aiogram и aiohttp нужны только родителю: дочерний процесс не должен их предзагружать
+    from benchmarks.stubs import StubBotAPIServer
+
+    results = {}
+    async with StubBotAPIServer() as telegram:
+        configure_app_environment(telegram.url)
+        from app.db.connection import dynamo_manager
+
+        async with dynamo_manager:
+            await ensure_table(dynamo_manager.client)
+        env = dict(os.environ)
+        for target in TARGETS:
+            runs = [await spawn(target, fixture, warm, env) for _ in range(cold_runs)]
+            results[f'{target}/import'] = latency_stats([run['import_s'] for run in runs])
+            results[f'{target}/cold'] = {
+                **latency_stats([run['cold_s'] for run in runs]),
+                'round_trips': runs[-1]['cold_round_trips'],
+                'max_rss_mb': max(run['max_rss_mb'] for run in runs),
+            }
+            results[f'{target}/warm'] = {
+                **latency_stats([sample for run in runs for sample in run['warm_samples']]),
+                'round_trips': runs[-1]['warm_round_trips'],
+            }
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cold-runs', type=int, default=5)
+    parser.add_argument('--warm', type=int, default=50)
+    parser.add_argument('--fixture', default='start_command')
+    parser.add_argument('--child', choices=TARGETS, help=argparse.SUPPRESS)
+    parser.add_argument('--json', help='куда сохранить результат')
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(asyncio.run(child(args.child, args.fixture, args.warm))))
+        return
+
+    results = asyncio.run(run(args.cold_runs, args.warm, args.fixture))
+    print_table(results)
+    if args.json:
+        save_results(args.json, 'serverless', results, dynamodb=ENDPOINT, fixture=args.fixture)
+
+
+if __name__ == '__main__':
+    main()
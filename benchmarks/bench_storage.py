@@ -0,0 +1,121 @@
+"""
+Операции DynamoDBStorage на локальной DynamoDB (см. benchmarks/dynamo.py).
+
+Каждая операция меряется без кэша, с TTL кэшем и с бинарным кодеком данных
+(app.tg.fsm.codec); типичный цикл хендлера (get_state, get_data, update_data,
+set_state) ещё и внутри unit_of_work.
+
+    python -m benchmarks.bench_storage [--iterations 200] [--json storage.json]
+"""
+import argparse
+import asyncio
+import itertools
+
+from aiogram.fsm.storage.base import StorageKey
+
+from app.tg.fsm.cache import TTLCache
+from app.tg.fsm.codec import DataCodec
+from app.tg.fsm.states import ClientRegister
+from app.tg.fsm.storage import DynamoDBStorage
+from benchmarks.dynamo import (
+    CREDENTIALS,
+    ENDPOINT,
+    REGION,
+    TABLE_NAME,
+    configure_app_environment,
+    count_round_trips,
+    ensure_table,
+)
+from benchmarks.harness import RoundTrips, measure, print_table, save_results
+
+USERS = 50
+
+
+def storage_cases(storage: DynamoDBStorage) -> dict:
+    user_ids = itertools.cycle(range(1, USERS + 1))
+
+    def next_key() -> StorageKey:
+        user_id = next(user_ids)
+        return StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+
+    async def set_state():
+        await storage.set_state(key=next_key(), state=ClientRegister.name)
+
+    async def get_state():
+        await storage.get_state(key=next_key())
+
+    async def set_data():
+        await storage.set_data(key=next_key(), data={'name': 'Анна', 'age': 30, 'tags': ['a', 'b']})
+
+    async def get_data():
+        await storage.get_data(key=next_key())
+
+    async def update_data():
+        await storage.update_data(key=next_key(), data={'email': 'anna@example.net'})
+
+    async def handler_cycle():
+        key = next_key()
+        await storage.get_state(key=key)
+        await storage.get_data(key=key)
+        await storage.update_data(key=key, data={'age': 31})
+        await storage.set_state(key=key, state=ClientRegister.email)
+
+    async def handler_cycle_unit_of_work():
+        async with storage.unit_of_work():
+            await handler_cycle()
+
+    async def reset_state_data():
+        key = next_key()
+        await storage.set_state(key=key, state=ClientRegister.age)
+        await storage.reset_state_data(key=key)
+
+    return {
+        'set_state': set_state,
+        'get_state': get_state,
+        'set_data': set_data,
+        'get_data': get_data,
+        'update_data': update_data,
+        'handler_cycle': handler_cycle,
+        'handler_cycle_unit_of_work': handler_cycle_unit_of_work,
+        'set_state+reset_state_data': reset_state_data,
+    }
+
+
+async def run(iterations: int) -> dict:
+    configure_app_environment()
+    from app.db.connection import DynamoConnectionManager
+
+    dynamo = DynamoConnectionManager(endpoint_url=ENDPOINT, region_name=REGION, **CREDENTIALS)
+    round_trips = RoundTrips()
+    count_round_trips(dynamo, round_trips)
+    results = {}
+    async with dynamo:
+        await ensure_table(dynamo.client)
+        table = await dynamo.table(TABLE_NAME)
+        variants = {
+            'plain': DynamoDBStorage(table),
+            'cache': DynamoDBStorage(table, cache=TTLCache(maxsize=USERS * 2, ttl=60)),
+            'binary': DynamoDBStorage(table, codec=DataCodec()),
+        }
+        for variant, storage in variants.items():
+            for name, case in storage_cases(storage).items():
+                results[f'{variant}/{name}'] = await measure(
+                    case, iterations, round_trips={'dynamodb': round_trips}
+                )
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--json', help='куда сохранить результат')
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.iterations))
+    print_table(results)
+    if args.json:
+        save_results(args.json, 'storage', results, dynamodb=ENDPOINT)
+
+
+if __name__ == '__main__':
+    main()
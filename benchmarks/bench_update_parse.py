@@ -0,0 +1,78 @@
+"""
+Стоимость разбора и обработки одного update в /tgwebhook.
+
+Сравнивает прежний путь (json.loads -> Update.model_validate) с разбором прямо
+из байтов (Update.model_validate_json) и меряет разбор вместе с dp.feed_update
+на роутерах приложения, Bot API заглушен.
+
+    python -m benchmarks.bench_update_parse [--iterations 2000] [--json result.json]
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from aiogram import Dispatcher
+from aiogram.types import Update
+
+from app.tg.routers import start
+from benchmarks.stubs import load_updates, stub_bot
+
+
+def parse_legacy(body: bytes, bot) -> Update:
+    return Update.model_validate(json.loads(body), context={'bot': bot})
+
+
+def parse_fast(body: bytes, bot) -> Update:
+    return Update.model_validate_json(body, context={'bot': bot})
+
+
+def bench_sync(func, body: bytes, bot, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func(body, bot)
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+async def bench_dispatch(parse, body: bytes, bot, dp: Dispatcher, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        await dp.feed_update(bot=bot, update=parse(body, bot))
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+async def run(iterations: int) -> dict[str, dict[str, float]]:
+    bot = stub_bot()
+    dp = Dispatcher()
+    dp.include_router(start.create_router())
+    results = {}
+    for name, payload in load_updates().items():
+        body = json.dumps(payload, ensure_ascii=False).encode()
+        results[name] = {
+            'parse_legacy_us': bench_sync(parse_legacy, body, bot, iterations),
+            'parse_fast_us': bench_sync(parse_fast, body, bot, iterations),
+            'dispatch_legacy_us': await bench_dispatch(parse_legacy, body, bot, dp, iterations),
+            'dispatch_fast_us': await bench_dispatch(parse_fast, body, bot, dp, iterations),
+        }
+    await bot.session.close()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--json', help='куда сохранить результат')
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.iterations))
+    print(f'{"update":<18}{"parse old":>12}{"parse new":>12}{"+dispatch old":>15}{"+dispatch new":>15}  (us/update)')
+    for name, row in results.items():
+        print(f'{name:<18}{row["parse_legacy_us"]:>12.1f}{row["parse_fast_us"]:>12.1f}'
+              f'{row["dispatch_legacy_us"]:>15.1f}{row["dispatch_fast_us"]:>15.1f}')
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
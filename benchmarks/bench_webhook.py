@@ -0,0 +1,70 @@
+"""
+/tgwebhook целиком: FastAPI приложение с lifespan, локальная DynamoDB
+(см. benchmarks/dynamo.py) и заглушка Bot API по HTTP.
+
+На каждый update из fixtures/updates.json - латентность запроса, аллокации и
+сколько запросов ушло в DynamoDB и Bot API.
+
+    python -m benchmarks.bench_webhook [--iterations 200] [--webhook-reply] [--json webhook.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+
+from benchmarks.dynamo import ENDPOINT, configure_app_environment, count_round_trips, ensure_table
+from benchmarks.harness import RoundTrips, measure, print_table, save_results
+from benchmarks.stubs import StubBotAPIServer, load_updates
+
+
+async def run(iterations: int, webhook_reply: bool) -> dict:
+    async with StubBotAPIServer() as telegram:
+        configure_app_environment(telegram.url)
+        os.environ['WEBHOOK_REPLY'] = str(webhook_reply).lower()
+        import httpx
+        from asgi_lifespan import LifespanManager
+
+        from app.db.connection import dynamo_manager
+        from app.main import create_app
+
+        dynamo_trips = RoundTrips()
+        count_round_trips(dynamo_manager, dynamo_trips)
+        async with dynamo_manager:
+            await ensure_table(dynamo_manager.client)
+
+        results = {}
+        async with LifespanManager(create_app()) as lifespan:
+            transport = httpx.ASGITransport(app=lifespan.app)
+            async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+                for name, payload in load_updates().items():
+                    body = json.dumps(payload, ensure_ascii=False).encode()
+
+                    async def post_update():
+                        response = await client.post(
+                            '/tgwebhook', content=body, headers={'Content-Type': 'application/json'}
+                        )
+                        assert response.status_code == 200
+
+                    results[name] = await measure(
+                        post_update,
+                        iterations,
+                        round_trips={'dynamodb': dynamo_trips, 'telegram': telegram.round_trips},
+                    )
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--webhook-reply', action='store_true', help='WEBHOOK_REPLY=true')
+    parser.add_argument('--json', help='куда сохранить результат')
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.iterations, args.webhook_reply))
+    print_table(results)
+    if args.json:
+        save_results(args.json, 'webhook', results, dynamodb=ENDPOINT, webhook_reply=args.webhook_reply)
+
+
+if __name__ == '__main__':
+    main()
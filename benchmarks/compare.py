@@ -0,0 +1,54 @@
+"""
+Сравнение JSON результатов бенчмарков с базовой линией перед деплоем.
+
+Регрессия - рост p50 латентности или пика аллокаций больше чем на --threshold
+(доля) либо любой рост числа round trips в DynamoDB / Bot API.
+Код выхода 1, если есть регрессии.
+
+    python -m benchmarks.compare baseline.json current.json [--threshold 0.25]
+"""
+import argparse
+import json
+import sys
+
+RELATIVE_METRICS = ('p50_us', 'alloc_peak_kb')
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list[str]:
+    regressions = []
+    for case, before in baseline['results'].items():
+        after = current['results'].get(case)
+        if after is None:
+            continue
+        for metric in RELATIVE_METRICS:
+            old, new = before.get(metric), after.get(metric)
+            if old and new is not None and new > old * (1 + threshold):
+                regressions.append(f'{case}: {metric} {old} -> {new} (+{(new / old - 1) * 100:.0f}%)')
+        for service, old in before.get('round_trips', {}).items():
+            new = after.get('round_trips', {}).get(service)
+            if new is not None and new > old:
+                regressions.append(f'{case}: {service} round trips {old} -> {new}')
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--threshold', type=float, default=0.25)
+    args = parser.parse_args()
+
+    with open(args.baseline, encoding='utf-8') as file:
+        baseline = json.load(file)
+    with open(args.current, encoding='utf-8') as file:
+        current = json.load(file)
+    regressions = compare(baseline, current, args.threshold)
+    for line in regressions:
+        print(f'REGRESSION {line}')
+    if regressions:
+        sys.exit(1)
+    print(f'{current["suite"]}: no regressions against {baseline.get("commit") or args.baseline}')
+
+
+if __name__ == '__main__':
+    main()
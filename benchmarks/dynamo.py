@@ -0,0 +1,74 @@
+"""
+Локальная DynamoDB для бенчмарков - dynamodb-local из docker-compose.yml:
+
+    docker-compose up -d        # http://localhost:9010
+
+Другой адрес и имя таблицы задаются BENCH_DYNAMO_ENDPOINT и BENCH_DYNAMO_TABLE.
+BENCH_DYNAMO_ENDPOINT=memory:// (или memory://?latency_ms=5) запускает бенчмарки
+на базе в памяти (app.db.memory) - без docker и без сетевых задержек.
+"""
+import os
+import typing as t
+
+from app.db import key_structure
+from benchmarks.harness import RoundTrips
+
+if t.TYPE_CHECKING:
+    from app.db.connection import DynamoConnectionManager
+
+ENDPOINT = os.getenv('BENCH_DYNAMO_ENDPOINT', 'http://localhost:9010')
+TABLE_NAME = os.getenv('BENCH_DYNAMO_TABLE', 'tgstore-bench')
+REGION = 'ru-central1'
+CREDENTIALS = {'access_key': 'bench', 'secret_key': 'bench'}
+
+
+def count_round_trips(manager: 'DynamoConnectionManager', counter: RoundTrips) -> None:
+    """Каждый HTTP запрос клиентов менеджера (с повторами) попадает в counter"""
+    from app.db.connection import is_memory_endpoint
+
+    if is_memory_endpoint(manager.endpoint_url):
+        from app.db.memory import memory_database
+
+        memory_database(manager.endpoint_url).request_hooks.append(counter.add)
+        return
+
+    def on_send(request, **_):
+        target = request.headers.get('X-Amz-Target', b'')
+        if isinstance(target, bytes):
+            target = target.decode()
+        counter.add(target.rpartition('.')[2] or 'unknown')
+
+    manager.session.events.register('before-send.dynamodb', on_send)
+
+
+async def ensure_table(client, table_name: str = TABLE_NAME) -> None:
+    """Создаёт таблицу со схемой приложения (partkey / sortkey и GSI), если её ещё нет"""
+    existing = await client.list_tables()
+    if table_name in existing.get('TableNames', []):
+        return
+    await client.create_table(TableName=table_name, BillingMode='PAY_PER_REQUEST', **key_structure.table_schema())
+    await client.get_waiter('table_exists').wait(TableName=table_name)
+
+
+def app_environment(telegram_url: str = 'http://127.0.0.1:9') -> dict[str, str]:
+    """Переменные окружения, с которыми приложение ходит в локальную DynamoDB и заглушку Bot API"""
+    from benchmarks.stubs import BOT_TOKEN
+
+    return {
+        'MODE': 'CICD',
+        'YC_DATABASE_URL': ENDPOINT,
+        'YC_SERVICE_ACCOUNT_KEY_ID': CREDENTIALS['access_key'],
+        'YC_SERVICE_ACCOUNT_SECRET_KEY': CREDENTIALS['secret_key'],
+        'TABLE_SUFFIX': TABLE_NAME,
+        'TG_KEY': BOT_TOKEN,
+        'TG_API_SERVER': telegram_url,
+        'USE_WEBHOOK': 'true',
+        'WEBHOOK': 'https://example.net/tgwebhook',
+        'LOG_ASYNC': '1',
+        'LOGGING_LEVEL': os.getenv('LOGGING_LEVEL', 'WARNING'),
+    }
+
+
+def configure_app_environment(telegram_url: str = 'http://127.0.0.1:9') -> None:
+    """Вызывается до первого импорта app.config и app.core.log_config"""
+    os.environ.update(app_environment(telegram_url))
@@ -0,0 +1,116 @@
+"""Общие замеры бенчмарков: латентность, аллокации, round trips и JSON с результатами"""
+import collections
+import datetime
+import json
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+import typing as t
+
+
+class RoundTrips:
+    """Счётчик запросов к внешнему сервису (DynamoDB, Bot API) по имени операции"""
+
+    def __init__(self):
+        self.counts: collections.Counter[str] = collections.Counter()
+
+    def add(self, operation: str) -> None:
+        self.counts[operation] += 1
+
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+
+def latency_stats(samples: t.Sequence[float]) -> dict[str, float]:
+    """Статистика по замерам в секундах, результат в микросекундах"""
+    ordered = sorted(samples)
+
+    def percentile(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1e6
+
+    return {
+        'iterations': len(ordered),
+        'mean_us': round(statistics.fmean(ordered) * 1e6, 1),
+        'p50_us': round(percentile(0.5), 1),
+        'p95_us': round(percentile(0.95), 1),
+        'p99_us': round(percentile(0.99), 1),
+        'min_us': round(ordered[0] * 1e6, 1),
+    }
+
+
+async def measure(
+    func: t.Callable[[], t.Awaitable[t.Any]],
+    iterations: int,
+    warmup: int = 10,
+    round_trips: dict[str, RoundTrips] | None = None,
+    alloc_iterations: int = 20,
+) -> dict[str, t.Any]:
+    """
+    Прогоняет корутину iterations раз: латентность, round trips на вызов и аллокации.
+
+    Аллокации меряются отдельным коротким прогоном под tracemalloc, чтобы
+    трассировка не искажала латентность: пик памяти внутри вызова и сколько
+    байт в среднем остаётся занятым после него (рост говорит об утечке).
+    """
+    round_trips = round_trips or {}
+    for _ in range(warmup):
+        await func()
+
+    before = {name: counter.total() for name, counter in round_trips.items()}
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        await func()
+        samples.append(time.perf_counter() - started)
+    result = latency_stats(samples)
+    result['round_trips'] = {
+        name: round((counter.total() - before[name]) / iterations, 2) for name, counter in round_trips.items()
+    }
+
+    tracemalloc.start()
+    try:
+        peaks = []
+        retained_from, _ = tracemalloc.get_traced_memory()
+        for _ in range(alloc_iterations):
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            await func()
+            peaks.append(tracemalloc.get_traced_memory()[1] - current)
+        retained_to, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    result['alloc_peak_kb'] = round(statistics.median(peaks) / 1024, 1)
+    result['alloc_retained_bytes'] = round((retained_to - retained_from) / alloc_iterations)
+    return result
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_results(path: str, suite: str, results: dict[str, t.Any], **meta: t.Any) -> None:
+    document = {
+        'suite': suite,
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        **meta,
+        'results': results,
+    }
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(document, file, indent=2, ensure_ascii=False)
+
+
+def print_table(results: dict[str, dict[str, t.Any]]) -> None:
+    print(f'{"case":<40}{"p50 us":>11}{"p95 us":>11}{"peak kb":>10}  round trips')
+    for name, row in results.items():
+        trips = ' '.join(f'{service}={count}' for service, count in row.get('round_trips', {}).items())
+        print(f'{name:<40}{row.get("p50_us", 0):>11.1f}{row.get("p95_us", 0):>11.1f}'
+              f'{row.get("alloc_peak_kb", 0):>10.1f}  {trips}')
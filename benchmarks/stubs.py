@@ -0,0 +1,99 @@
+"""Заглушки Telegram Bot API для бенчмарков: запросы не уходят в Telegram"""
+import datetime
+import time
+import typing as t
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import SendMessage, TelegramMethod
+from aiogram.types import Chat, Message
+from aiohttp import web
+
+from benchmarks.harness import RoundTrips
+from benchmarks.updates import FIXTURES, load_updates  # noqa: F401
+
+BOT_TOKEN = '123456789:AAbenchmarkbenchmarkbenchmarkbench'
+
+
+class StubSession(BaseSession):
+    """Отвечает на вызовы Bot API синтетическим результатом и считает вызовы"""
+
+    def __init__(self, **kwargs: t.Any):
+        super().__init__(**kwargs)
+        self.calls: list[TelegramMethod] = []
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: int | None = None) -> t.Any:
+        self.calls.append(method)
+        if isinstance(method, SendMessage):
+            return Message(
+                message_id=len(self.calls),
+                date=datetime.datetime.now(),
+                chat=Chat(id=int(method.chat_id), type='private'),
+                text=method.text,
+            )
+        return True
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b''
+
+    async def close(self) -> None:
+        pass
+
+
+def stub_bot() -> Bot:
+    return Bot(BOT_TOKEN, session=StubSession())
+
+
+class StubBotAPIServer:
+    """
+    Заглушка Bot API по HTTP на 127.0.0.1 для приложения целиком (TG_API_SERVER).
+
+    Отвечает успехом на любой метод, считает запросы и отдаёт счётчики на GET /stats,
+    чтобы их видели и дочерние процессы бенчмарка.
+    """
+
+    def __init__(self):
+        self.round_trips = RoundTrips()
+        self.url: str | None = None
+        self._runner: web.AppRunner | None = None
+
+    async def _handle_method(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        self.round_trips.add(method)
+        result: t.Any = True
+        if method.lower() == 'sendmessage':
+            data = await request.post()
+            result = {
+                'message_id': self.round_trips.total(),
+                'date': int(time.time()),
+                'chat': {'id': int(data['chat_id']), 'type': 'private'},
+                'text': data.get('text', ''),
+            }
+        return web.json_response({'ok': True, 'result': result})
+
+    async def _handle_stats(self, _: web.Request) -> web.Response:
+        return web.json_response(dict(self.round_trips.counts))
+
+    async def start(self) -> 'StubBotAPIServer':
+        application = web.Application()
+        application.router.add_post('/bot{token}/{method}', self._handle_method)
+        application.router.add_get('/stats', self._handle_stats)
+        self._runner = web.AppRunner(application, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        host, port = self._runner.addresses[0][:2]
+        self.url = f'http://{host}:{port}'
+        return self
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self) -> 'StubBotAPIServer':
+        return await self.start()
+
+    async def __aexit__(self, *_) -> None:
+        await self.stop()
+
@@ -0,0 +1,23 @@
+"""Update из fixtures/updates.json и события Yandex Cloud Functions с ними; без тяжёлых импортов"""
+import json
+import pathlib
+
+FIXTURES = pathlib.Path(__file__).parent / 'fixtures'
+
+
+def load_updates() -> dict[str, dict]:
+    return json.loads((FIXTURES / 'updates.json').read_text(encoding='utf-8'))
+
+
+def yc_event(payload: dict, url: str = '/tgwebhook') -> dict:
+    """Событие HTTP вызова Yandex Cloud Functions с update в теле"""
+    return {
+        'httpMethod': 'POST',
+        'headers': {'Host': 'example.net', 'Content-Type': 'application/json'},
+        'url': url,
+        'multiValueQueryStringParameters': {},
+        'queryStringParameters': {},
+        'requestContext': {},
+        'body': json.dumps(payload, ensure_ascii=False),
+        'isBase64Encoded': False,
+    }
@@ -1,54 +1,127 @@
-from aiogram import Bot, Dispatcher
-from aiogram.types import Update
-
+from __future__ import annotations
 
 import asyncio
 import json
 import logging
 import os
+import typing as t
+
+from app.core.log_config import parse_log_level
+from app.core.metrics import collect_invocation, format_invocation, metrics
+from app.yc.asgi import event_body
+
+if t.TYPE_CHECKING:
+    from aiogram import Bot, Dispatcher
 
-from aiogram import Bot, Dispatcher
-from app.tg.routers.start import router
-from app.config import settings
+# aiogram, aioboto3 и роутеры импортируются при первом вызове (BotRuntime._build,
+# process_event), а не при загрузке модуля: на них уходит основная часть импорта
 
 # Logger initialization and logging level setting
 log = logging.getLogger(__name__)
-log.setLevel(os.environ.get('LOGGING_LEVEL', 'INFO').upper())
+log.setLevel(parse_log_level(os.environ.get('LOGGING_LEVEL')))
 
 
-# Functions for Yandex.Cloud
-async def register_handlers(dp: Dispatcher):
-    """Registration all handlers before processing update."""
+class BotRuntime:
+    """
+    Bot, Dispatcher с роутерами и FSM storage на DynamoDB, общие для тёплых вызовов.
+
+    Webhook здесь не регистрируется: это делается отдельно командой
+    `python webhook-utils.py set` при деплое.
+    """
+
+    def __init__(self):
+        self.bot: Bot | None = None
+        self.dp: Dispatcher | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    async def get(self) -> tuple[Bot, Dispatcher]:
+        if self.bot is None or self._loop is not asyncio.get_running_loop():
+            await self._start()
+        return self.bot, self.dp
+
+    async def _start(self):
+        log.info('Cold start: bot, dispatcher and DynamoDB storage initialization')
+        with metrics.timer('cold_start'):
+            await self._build()
 
-    dp.include_router(router)
-    log.debug('Handlers are registered.')
+    def _forget_previous_loop(self) -> None:
+        """
+        Клиенты DynamoDB и HTTP сессию Bot прошлого цикла событий закрыть из нового
+        нельзя, их соединения уйдут вместе со старым циклом. Они забываются без await;
+        aiohttp сессия отсоединяется от пула соединений и помечается закрытой.
+        """
+        from app.db.connection import dynamo_manager
 
+        dynamo_manager.forget()
+        if self.bot is not None:
+            session = getattr(self.bot.session, '_session', None)
+            if session is not None and not session.closed:
+                session.detach()
+        self.bot = None
+        self.dp = None
+        self._loop = None
 
-async def process_event(event, dp: Dispatcher, bot: Bot):
+    async def _build(self):
+        from app.db.connection import dynamo_manager
+        from app.tg.create_app import attach_table, build_bot, shared_dispatcher
+
+        if self._loop is not None:
+            self._forget_previous_loop()
+        table = await dynamo_manager.table()
+        self.bot = build_bot()
+        self.dp = attach_table(shared_dispatcher(), table)
+        self._loop = asyncio.get_running_loop()
+
+
+runtime = BotRuntime()
+
+
+# Functions for Yandex.Cloud
+async def process_event(event, dp: Dispatcher, bot: Bot) -> dict | None:
     """
     Converting an Yandex.Cloud functions event to an update and
     handling tha update.
     """
+    from aiogram.types import Update
 
-    update = json.loads(event['body'])
-    log.debug('Update: ' + str(update))
+    from app.tg.webhook_reply import process_update
 
-    update = Update.model_validate(update, context={"bot": bot})
-    await dp.feed_update(update=update, bot=bot)
+    with metrics.timer('update_validate'):
+        update = Update.model_validate_json(event_body(event), context={"bot": bot})
+    log.debug('Update: %s', update.update_id)
+    with metrics.timer('feed_update'):
+        return await process_update(dp, bot, update)
 
 
 async def handler(event, context):
     """Yandex.Cloud functions handler."""
 
     if event['httpMethod'] == 'POST':
-        # Bot and dispatcher initialization
-        bot = Bot(settings.TG_KEY)
-        dp = Dispatcher()
-        await bot.set_webhook(settings.WEBHOOK)
-        await register_handlers(dp)
-        await process_event(event, dp, bot)
-        await bot.delete_webhook()
-        await bot.close()
-        dp.shutdown()
+        with collect_invocation() as timings:
+            with metrics.timer('invocation'):
+                bot, dp = await runtime.get()
+                try:
+                    reply_payload = await process_event(event, dp, bot)
+                except Exception as e:
+                    log.error(f'Update processing failed: {e}')
+                    reply_payload = None
+        log.info('Invocation stages: %s', format_invocation(timings))
+        if reply_payload is not None:
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json'},
+                'body': json.dumps(reply_payload, ensure_ascii=False),
+            }
         return {'statusCode': 200, 'body': 'ok'}
     return {'statusCode': 405}
+
+
+async def compaction_handler(event, context):
+    """Yandex.Cloud functions handler для timer trigger: удаляет истёкшие FSM items."""
+    from app.config import get_settings
+    from app.db.connection import DynamoConnectionManager
+    from app.db.maintenance import bot_id_from_token, compact_fsm
+
+    async with DynamoConnectionManager() as manager:
+        deleted = await compact_fsm(await manager.table(), bot_id_from_token(get_settings().TG_KEY))
+    return {'statusCode': 200, 'body': json.dumps({'deleted': deleted})}
@@ -1,88 +1,129 @@
-import datetime
-import re
-import httpx
-from base64 import b64decode, b64encode
-from asgi_lifespan import LifespanManager
-from fastapi import FastAPI
+from __future__ import annotations
 
-from app.main import create_app as create_fastapi_app
-from app.core.log_config import logger
+import asyncio
+import typing as t
 
+from app.core.context import AppContext
+from app.core.log_config import logger, payload_sampled
+from app.core.metrics import collect_invocation, format_invocation, metrics
+from app.yc.asgi import invoke_asgi
+from app.yc.types import YFunctionResponse
 
-def body_to_bytes(event):
-    if not event["body"]:
-        pass
-    elif event["isBase64Encoded"]:
-        event["body"] = b64decode(event["body"])
-    else:
-        event["body"] = event["body"].encode()
+# fastapi, asgi_lifespan, pydantic_settings и всё приложение импортируются при первом
+# вызове: служебные события и сам импорт модуля обходятся без них
+if t.TYPE_CHECKING:
+    from asgi_lifespan import LifespanManager
+    from fastapi import FastAPI
 
 
-async def call_app(application: FastAPI, event) -> httpx.Response:
+def create_fastapi_app() -> FastAPI:
+    from app.main import create_app
+
+    return create_app(serverless=True)
+
+
+class WarmApplication:
+    """
+    Держит FastAPI приложение и его lifespan открытыми между вызовами функции.
+
+    Холодный старт платит за создание Bot, клиентов DynamoDB и Dispatcher один раз,
+    тёплые вызовы переиспользуют готовое приложение. Если проверка здоровья не прошла
+    или вызов упал, приложение пересоздаётся при следующем обращении.
+    """
+
+    def __init__(self, factory=create_fastapi_app):
+        self._factory = factory
+        self._manager: LifespanManager | None = None
+        self._app = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def is_healthy(self) -> bool:
+        if self._app is None:
+            return False
+        # ресурсы aiohttp/aiobotocore привязаны к циклу, на котором были созданы
+        if self._loop is not asyncio.get_running_loop():
+            return False
+        return AppContext().is_initialized
+
+    async def get(self):
+        if not self.is_healthy():
+            await self.reset()
+            await self._start()
+        return self._app
+
+    async def _start(self):
+        from asgi_lifespan import LifespanManager
+
+        from app.config import get_settings
+
+        logger.info('WARM APP: cold start, lifespan startup')
+        settings = get_settings()
+        application = self._factory()
+        manager = LifespanManager(
+            application,
+            startup_timeout=settings.LIFESPAN_STARTUP_TIMEOUT,
+            shutdown_timeout=settings.LIFESPAN_SHUTDOWN_TIMEOUT,
+        )
+        with metrics.timer('cold_start'):
+            await manager.__aenter__()
+        self._manager = manager
+        self._app = manager.app
+        self._loop = asyncio.get_running_loop()
+
+    async def reset(self):
+        manager, loop = self._manager, self._loop
+        self._manager = None
+        self._app = None
+        self._loop = None
+        if manager is None:
+            return
+        logger.info('WARM APP: lifespan shutdown')
+        if loop is asyncio.get_running_loop():
+            try:
+                await manager.__aexit__(None, None, None)
+            except Exception as e:
+                logger.error(f'WARM APP: ошибка при остановке lifespan: {e}')
+        else:
+            from app.db.connection import dynamo_manager
+
+            # lifespan старого цикла не завершить; клиенты DynamoDB этого цикла забываем,
+            # иначе следующий start_dynamo получит их обратно открытыми
+            dynamo_manager.forget()
+        AppContext().reset()
+
+
+warm_application = WarmApplication()
+
+
+async def call_app(application: FastAPI, event) -> YFunctionResponse:
+    from asgi_lifespan import LifespanManager
+
+    from app.config import get_settings
+
     logger.info('-----CALL APP-----')
-    host_url = event["headers"].get("Host", "https://raw-function.net")
-    if not host_url.startswith("http"):
-        host_url = f"https://{host_url}"
-    body_to_bytes(event)
+    settings = get_settings()
     async with LifespanManager(
             application,
-            startup_timeout=float(60),
-            shutdown_timeout=float(60)
+            startup_timeout=settings.LIFESPAN_STARTUP_TIMEOUT,
+            shutdown_timeout=settings.LIFESPAN_SHUTDOWN_TIMEOUT
     ) as lifespan_manager:
-        async with httpx.AsyncClient(app=lifespan_manager.app, base_url=host_url) as client:
-            request = client.build_request(
-                method=event["httpMethod"],
-                url=event["url"],
-                headers=event["headers"],
-                params=event["queryStringParameters"],
-                content=event["body"],
-            )
-            response = await client.send(request)
-            return response
-
-
-def is_binary(response):
-    if not response.headers.get("content-type"):
-        return False
-
-    content_type = response.headers["content-type"]
-    return any(
-        re_.match(content_type) for re_ in (
-            re.compile(r"image/.*"),
-            re.compile(r"video/.*"),
-            re.compile(r"audio/.*"),
-            re.compile(r".*zip"),
-            re.compile(r".*pdf"),
-        )
-    )
+        return await invoke_asgi(lifespan_manager.app, event)
 
 
-def patch_response(response: httpx.Response):
-    """
-    returns Http response in the format of
-    {
-     'status code': 200,
-     'body': body - string or base64-string in case of binary content,
-     'headers': {}
-    }
-    """
-    is_binary_ = is_binary(response)
-    if is_binary_:
-        body = b64encode(response.content).decode("utf-8")
-    else:
-        body = response.content.decode()
-    return {
-        "statusCode": response.status_code,
-        "headers": dict(response.headers),
-        "body": body,
-        "isBase64Encoded": is_binary_,
-    }
+async def call_warm_app(event) -> YFunctionResponse:
+    logger.info('-----CALL WARM APP-----')
+    application = await warm_application.get()
+    try:
+        return await invoke_asgi(application, event)
+    except Exception:
+        await warm_application.reset()
+        raise
 
 
 async def handle(event, _):
-    logger.info(f"APPLICATION STARTUP {datetime.datetime.now()}", extra={'user': 'handler'})
-    logger.debug(f'{event=}', extra={'user': 'handler'})
-    fastapi_app = create_fastapi_app()
+    logger.info("APPLICATION STARTUP", extra={'user': 'handler'})
+    if payload_sampled():
+        logger.info('event=%s', event, extra={'user': 'handler'})
 
     if not event:
         return {
@@ -95,6 +136,13 @@ async def handle(event, _):
             "statusCode": 200,
             "body": "event_metadata",
         }
-    response = await call_app(fastapi_app, event)
-    logger.info(f"APPLICATION SHUTDOWN {datetime.datetime.now()}", extra={'user': 'handler'})
-    return patch_response(response)
+    from app.config import get_settings
+
+    with collect_invocation() as timings:
+        with metrics.timer('invocation'):
+            if get_settings().WARM_INSTANCE:
+                response = await call_warm_app(event)
+            else:
+                response = await call_app(create_fastapi_app(), event)
+    logger.info("APPLICATION SHUTDOWN %s", format_invocation(timings), extra={'user': 'handler'})
+    return response
@@ -0,0 +1,40 @@
+import os
+
+import pytest
+
+# app.config читает Settings при импорте; для unit тестов хватает фиктивных значений
+os.environ.setdefault('MODE', 'CICD')
+for name, value in {
+    'YC_DATABASE_URL': 'http://localhost:9010',
+    'YC_SERVICE_ACCOUNT_KEY_ID': 'test',
+    'YC_SERVICE_ACCOUNT_SECRET_KEY': 'test',
+    'TABLE_SUFFIX': 'test',
+    'TG_KEY': '123456:test-token',
+    'WEBHOOK': 'https://example.net/tgwebhook',
+}.items():
+    os.environ.setdefault(name, value)
+
+
+class MemoryBackend:
+    """DynamoDB в памяти с таблицей test; calls - имена операций в порядке запросов"""
+
+    def __init__(self, **database_kwargs):
+        import asyncio
+
+        from app.db.memory import MemoryDynamoDB
+
+        self.database = MemoryDynamoDB(**database_kwargs)
+        self.calls: list[str] = []
+        self.database.request_hooks.append(self.calls.append)
+        self.table = asyncio.run(self.database.resource().Table('test'))
+
+    def storage(self, **storage_kwargs):
+        from app.tg.fsm.storage import DynamoDBStorage
+
+        return DynamoDBStorage(self.table, **storage_kwargs)
+
+
+@pytest.fixture
+def memory_backend():
+    """Фабрика MemoryBackend: memory_backend(latency=0.001) создаёт новую базу"""
+    return MemoryBackend
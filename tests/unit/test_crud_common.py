@@ -0,0 +1,135 @@
+import asyncio
+
+from app.db.crud.common import batch_get_items, batch_write_items, build_set_expression, iter_query, iter_scan
+
+
+class PagedTable:
+    """Таблица-заглушка: отдаёт items страницами по Limit, с поддержкой Segment"""
+
+    def __init__(self, items, page_size=3):
+        self.items = items
+        self.page_size = page_size
+        self.calls = []
+
+    def _page(self, items, kwargs):
+        self.calls.append(kwargs)
+        start = kwargs.get('ExclusiveStartKey', {}).get('index', 0)
+        size = kwargs.get('Limit', self.page_size)
+        page = items[start:start + size]
+        response = {'Items': page}
+        if start + size < len(items):
+            response['LastEvaluatedKey'] = {'index': start + size}
+        return response
+
+    async def query(self, **kwargs):
+        return self._page(self.items, kwargs)
+
+    async def scan(self, **kwargs):
+        items = self.items
+        if 'Segment' in kwargs:
+            items = items[kwargs['Segment']::kwargs['TotalSegments']]
+        return self._page(items, kwargs)
+
+
+async def collect(iterator):
+    return [item async for item in iterator]
+
+
+def test_iter_query_follows_last_evaluated_key():
+    table = PagedTable([{'n': n} for n in range(10)])
+    items = asyncio.run(collect(iter_query(table, KeyConditionExpression='x', projection=['n'])))
+    assert items == [{'n': n} for n in range(10)]
+    assert len(table.calls) == 4
+    assert table.calls[0]['ProjectionExpression'] == '#proj0'
+    assert table.calls[0]['ExpressionAttributeNames'] == {'#proj0': 'n'}
+
+
+def test_iter_query_limit_stops_paging():
+    table = PagedTable([{'n': n} for n in range(10)])
+    items = asyncio.run(collect(iter_query(table, page_size=2, limit=3)))
+    assert items == [{'n': 0}, {'n': 1}, {'n': 2}]
+    assert len(table.calls) == 2
+
+
+def test_iter_scan_parallel_segments():
+    table = PagedTable([{'n': n} for n in range(20)])
+    items = asyncio.run(collect(iter_scan(table, segments=4, max_workers=2)))
+    assert sorted(item['n'] for item in items) == list(range(20))
+    assert {call['Segment'] for call in table.calls} == {0, 1, 2, 3}
+
+
+def test_build_set_expression():
+    expression, names, values = build_set_expression({'a': 1, 'b': 2}, path='data')
+    assert expression == 'SET #path.#f0 = :f0, #path.#f1 = :f1'
+    assert names == {'#path': 'data', '#f0': 'a', '#f1': 'b'}
+    assert values == {':f0': 1, ':f1': 2}
+
+
+class BatchClient:
+    """Клиент-заглушка: первый вызов возвращает половину запроса как необработанную"""
+
+    def __init__(self):
+        self.get_calls = 0
+        self.write_calls = 0
+        self.written = []
+
+    async def batch_get_item(self, RequestItems):
+        self.get_calls += 1
+        ((name, request),) = RequestItems.items()
+        keys = request['Keys']
+        done, left = keys[:len(keys) // 2 or 1], keys[len(keys) // 2 or 1:]
+        response = {'Responses': {name: [{**key, 'v': {'N': '1'}} for key in done]}}
+        if left:
+            response['UnprocessedKeys'] = {name: {**request, 'Keys': left}}
+        return response
+
+    async def batch_write_item(self, RequestItems):
+        self.write_calls += 1
+        ((name, requests),) = RequestItems.items()
+        assert len(requests) <= 25
+        self.written.extend(requests[:20])
+        if requests[20:]:
+            return {'UnprocessedItems': {name: requests[20:]}}
+        return {}
+
+
+class BatchTable:
+    name = 'test'
+
+    def __init__(self):
+        self.meta = type('Meta', (), {'client': BatchClient()})()
+
+
+def test_batch_get_items_retries_unprocessed_keys():
+    table = BatchTable()
+    keys = [{'partkey': 'client', 'sortkey': str(n)} for n in range(150)] + [{'partkey': 'client', 'sortkey': '0'}]
+    items = asyncio.run(batch_get_items(table, keys, base_delay=0))
+    assert sorted(int(item['sortkey']) for item in items) == list(range(150))
+    assert items[0]['v'] == 1
+
+
+def test_batch_write_items_chunks_and_retries():
+    table = BatchTable()
+    puts = [{'partkey': 'client', 'sortkey': str(n), 'v': n} for n in range(60)]
+    deletes = [{'partkey': 'client', 'sortkey': '0'}]
+    calls = asyncio.run(batch_write_items(table, puts, deletes, base_delay=0))
+    written = table.meta.client.written
+    assert len(written) == 60
+    assert calls == table.meta.client.write_calls == 5
+    assert {'DeleteRequest': {'Key': {'partkey': {'S': 'client'}, 'sortkey': {'S': '0'}}}} in written
+
+
+def test_batch_write_items_keeps_last_operation_per_key():
+    table = BatchTable()
+    first = {'partkey': 'client', 'sortkey': '1'}
+    second = {'partkey': 'client', 'sortkey': '2'}
+    asyncio.run(batch_write_items(table, writes=[
+        {'PutRequest': {'Item': {**first, 'v': 1}}},
+        {'DeleteRequest': {'Key': first}},
+        {'DeleteRequest': {'Key': second}},
+        {'PutRequest': {'Item': {**second, 'v': 2}}},
+    ], base_delay=0))
+    assert table.meta.client.written == [
+        {'DeleteRequest': {'Key': {'partkey': {'S': 'client'}, 'sortkey': {'S': '1'}}}},
+        {'PutRequest': {'Item': {'partkey': {'S': 'client'}, 'sortkey': {'S': '2'}, 'v': {'N': '2'}}}},
+    ]
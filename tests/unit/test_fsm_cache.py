@@ -0,0 +1,38 @@
+from app.tg.fsm.cache import TTLCache, MISSING
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_ttl_expiry_and_counters():
+    timer = FakeTimer()
+    cache = TTLCache(maxsize=10, ttl=5, timer=timer)
+    cache.set('a', 1)
+    assert cache.get('a') == 1
+    timer.now = 6
+    assert cache.get('a') is MISSING
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'size': 0}
+
+
+def test_lru_eviction():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('b') is MISSING
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+
+
+def test_invalidate():
+    cache = TTLCache()
+    cache.set('a', None)
+    assert cache.get('a') is None
+    cache.invalidate('a')
+    assert cache.get('a', 'default') == 'default'
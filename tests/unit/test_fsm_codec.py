@@ -0,0 +1,111 @@
+import asyncio
+from decimal import Decimal
+
+import pytest
+from aiogram.fsm.storage.base import StorageKey
+
+from app.tg.fsm.codec import PLAIN_JSON, ZLIB_JSON, DataCodec, DataCodecError
+from app.tg.fsm.storage import DATA_BLOB_ATTRIBUTE
+
+KEY = StorageKey(bot_id=1, chat_id=5, user_id=5)
+ITEM_KEY = {'partkey': 'fsm_1', 'sortkey': '5'}
+
+
+def make_storage(backend):
+    return backend.storage(codec=DataCodec(min_size=64)), backend.table
+
+
+def test_codec_round_trip_and_versions():
+    codec = DataCodec(min_size=64)
+    small = {'name': 'Анна'}
+    large = {'answers': ['ответ'] * 50, 'age': Decimal(30), 'score': Decimal('0.5')}
+    assert codec.encode(small)[0] == PLAIN_JSON
+    assert codec.encode(large)[0] == ZLIB_JSON
+    assert len(codec.encode(large)) < len(str(large).encode())
+    assert codec.decode(codec.encode(small)) == small
+    assert codec.decode(codec.encode(large)) == {'answers': ['ответ'] * 50, 'age': 30, 'score': Decimal('0.5')}
+    with pytest.raises(DataCodecError):
+        codec.decode(b'\x7f{}')
+
+
+def test_fractional_decimals_round_trip_exactly(memory_backend):
+    codec = DataCodec(min_size=64)
+    data = {'price': Decimal('0.1'), 'items': [{'weight': Decimal('1.10')}], 'tags': {'a'}, 'count': Decimal(2)}
+    encoded = codec.encode(data)
+    assert b'"price":0.1,' in encoded
+    decoded = codec.decode(encoded)
+    assert decoded == {'price': Decimal('0.1'), 'items': [{'weight': Decimal('1.10')}], 'tags': ['a'], 'count': 2}
+    assert str(decoded['items'][0]['weight']) == '1.10'
+
+    # codec и map-атрибут отдают одно и то же
+    backend = memory_backend()
+    results = []
+
+    async def run(storage):
+        await storage.set_data(key=KEY, data={'price': Decimal('0.1')})
+        results.append(await storage.get_data(key=KEY))
+
+    asyncio.run(run(backend.storage(codec=codec)))
+    asyncio.run(run(backend.storage()))
+    assert results == [{'price': Decimal('0.1')}] * 2
+
+
+def test_storage_writes_single_binary_attribute(memory_backend):
+    storage, table = make_storage(memory_backend())
+
+    async def run():
+        await storage.set_state(key=KEY, state='form:name')
+        await storage.set_data(key=KEY, data={'name': 'Анна'})
+        await storage.update_data(key=KEY, data={'age': 30})
+        return await storage.get_data(key=KEY), (await table.get_item(Key=ITEM_KEY))['Item']
+
+    data, item = asyncio.run(run())
+    assert data == {'name': 'Анна', 'age': 30}
+    assert 'data' not in item
+    assert DataCodec().decode(item[DATA_BLOB_ATTRIBUTE]) == data
+    assert item['state'] == 'form:name'
+
+
+def test_legacy_map_items_are_read_and_migrated(memory_backend):
+    storage, table = make_storage(memory_backend())
+
+    async def run():
+        await table.put_item(Item={**ITEM_KEY, 'state': 'form:age', 'data': {'name': 'Анна', 'age': 30}})
+        legacy = await storage.get_data(key=KEY)
+        await storage.update_data(key=KEY, data={'email': 'anna@example.net'})
+        return legacy, (await table.get_item(Key=ITEM_KEY))['Item']
+
+    legacy, item = asyncio.run(run())
+    assert legacy == {'name': 'Анна', 'age': 30}
+    assert 'data' not in item
+    assert DataCodec().decode(item[DATA_BLOB_ATTRIBUTE]) == {'name': 'Анна', 'age': 30, 'email': 'anna@example.net'}
+
+
+def test_concurrent_updates_are_not_lost(memory_backend):
+    # задержка заставляет чтения конкурентных update_data пересечься
+    storage, _ = make_storage(memory_backend(latency=0.001))
+
+    async def run():
+        await asyncio.gather(*(storage.update_data(key=KEY, data={f'field{n}': n}) for n in range(3)))
+        return await storage.get_data(key=KEY)
+
+    assert asyncio.run(run()) == {f'field{n}': n for n in range(3)}
+
+
+def test_binary_items_are_read_after_codec_is_disabled(memory_backend):
+    backend = memory_backend()
+    encoded, table = make_storage(backend)
+    plain = backend.storage()
+
+    async def run():
+        await encoded.set_state(key=KEY, state='form:name')
+        await encoded.set_data(key=KEY, data={'name': 'Анна'})
+        await plain.update_data(key=KEY, data={'age': 30})
+        merged = await plain.get_data(key=KEY)
+        await plain.set_data(key=KEY, data={**merged, 'email': 'anna@example.net'})
+        return merged, (await table.get_item(Key=ITEM_KEY))['Item']
+
+    merged, item = asyncio.run(run())
+    assert merged == {'name': 'Анна', 'age': 30}
+    assert DATA_BLOB_ATTRIBUTE not in item
+    assert item['data'] == {'name': 'Анна', 'age': 30, 'email': 'anna@example.net'}
@@ -0,0 +1,165 @@
+import asyncio
+
+import pytest
+from aiogram.fsm.storage.base import StorageKey
+
+from app.db.maintenance import compact_fsm
+from app.tg.fsm.expiry import FSMExpiry
+from app.tg.fsm.states import AddAdmin, ClientRegister
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def make_storage(memory_backend):
+    def make(**expiry):
+        clock = FakeClock()
+        backend = memory_backend()
+        return backend.storage(expiry=FSMExpiry(clock=clock, **expiry)), backend.table, clock
+
+    return make
+
+
+def user(user_id: int) -> StorageKey:
+    return StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+
+
+def test_ttl_per_state_group():
+    expiry = FSMExpiry(default=100, groups={'AddAdmin': 10, 'CreateEsoLink': 0}, clock=FakeClock())
+    assert expiry.ttl(AddAdmin.tg_id.state) == 10
+    assert expiry.ttl(ClientRegister.name.state) == 100
+    assert expiry.ttl(None) == 100
+    assert expiry.expires_at('CreateEsoLink:receiver') is None
+
+
+def test_expired_item_reads_as_absent_and_is_deleted(make_storage):
+    storage, table, clock = make_storage(default=0, groups={'ClientRegister': 60})
+
+    async def run():
+        await storage.set_state(key=user(1), state=ClientRegister.name)
+        await storage.update_data(key=user(1), data={'name': 'Анна'})
+        clock.now += 30
+        alive = await storage.get_state(key=user(1)), await storage.get_data(key=user(1))
+        clock.now += 31
+        expired = await storage.get_state(key=user(1)), await storage.get_data(key=user(1))
+        item = await table.get_item(Key={'partkey': 'fsm_1', 'sortkey': '1'})
+        return alive, expired, item
+
+    alive, expired, item = asyncio.run(run())
+    assert alive == ('ClientRegister:name', {'name': 'Анна'})
+    assert expired == (None, {})
+    assert 'Item' not in item
+
+
+def test_state_change_refreshes_and_removes_expiry(make_storage):
+    storage, table, clock = make_storage(default=0, groups={'ClientRegister': 60})
+    key = {'partkey': 'fsm_1', 'sortkey': '1'}
+
+    async def run():
+        await storage.set_state(key=user(1), state=ClientRegister.name)
+        first = (await table.get_item(Key=key))['Item']['expires_at']
+        clock.now += 50
+        async with storage.unit_of_work():
+            await storage.set_state(key=user(1), state=ClientRegister.age)
+        second = (await table.get_item(Key=key))['Item']['expires_at']
+        await storage.set_state(key=user(1), state=None)
+        return first, second, (await table.get_item(Key=key))['Item']
+
+    first, second, item = asyncio.run(run())
+    assert second - first == 50
+    assert 'expires_at' not in item
+
+
+def test_data_writes_get_default_expiry_once(make_storage):
+    storage, table, clock = make_storage(default=100)
+    key = {'partkey': 'fsm_1', 'sortkey': '2'}
+
+    async def run():
+        await storage.set_data(key=user(2), data={'a': 1})
+        first = (await table.get_item(Key=key))['Item']['expires_at']
+        clock.now += 10
+        await storage.update_data(key=user(2), data={'b': 2})
+        return first, (await table.get_item(Key=key))['Item']['expires_at']
+
+    first, second = asyncio.run(run())
+    assert first == second == 1_000_100
+
+
+def test_state_write_to_expired_item_drops_old_data(make_storage):
+    storage, table, clock = make_storage(default=0, groups={'ClientRegister': 60})
+
+    async def run():
+        await storage.set_state(key=user(1), state=ClientRegister.name)
+        await storage.update_data(key=user(1), data={'name': 'Анна'})
+        clock.now += 61
+        # запись без чтения: item истёк, но ещё лежит в таблице
+        await storage.set_state(key=user(1), state=ClientRegister.age)
+        return await storage.get_state(key=user(1)), await storage.get_data(key=user(1))
+
+    assert asyncio.run(run()) == ('ClientRegister:age', {})
+
+
+def test_data_write_to_expired_item_survives_next_read(make_storage):
+    storage, table, clock = make_storage(default=60)
+
+    async def run():
+        await storage.update_data(key=user(1), data={'old': 1})
+        await storage.set_data(key=user(2), data={'old': 1})
+        clock.now += 61
+        await storage.update_data(key=user(1), data={'new': 2})
+        await storage.set_data(key=user(2), data={'new': 2})
+        return await storage.get_data(key=user(1)), await storage.get_data(key=user(2))
+
+    assert asyncio.run(run()) == ({'new': 2}, {'new': 2})
+
+
+def test_compaction_deletes_only_expired_items_of_the_bot(make_storage):
+    storage, table, clock = make_storage(default=0, groups={'AddAdmin': 10})
+
+    async def run():
+        await storage.set_state(key=user(1), state=AddAdmin.tg_id)
+        await storage.set_state(key=user(2), state=ClientRegister.name)
+        await storage.set_state(key=StorageKey(bot_id=2, chat_id=3, user_id=3), state=AddAdmin.tg_id)
+        await table.put_item(Item={'partkey': 'fsm_1', 'sortkey': '4', 'state': 'x', 'time': int(clock.now) - 100})
+        clock.now += 20
+        deleted = await compact_fsm(table, bot_id=1, now=int(clock.now))
+        legacy = await compact_fsm(table, bot_id=1, now=int(clock.now), older_than=60)
+        left = await table.scan()
+        return deleted, legacy, sorted((item['partkey'], item['sortkey']) for item in left['Items'])
+
+    deleted, legacy, left = asyncio.run(run())
+    assert (deleted, legacy) == (1, 1)
+    assert left == [('fsm_1', '2'), ('fsm_2', '3')]
+
+
+def test_compaction_keeps_item_extended_after_query(memory_backend):
+    backend = memory_backend()
+    clock = FakeClock()
+    storage = backend.storage(expiry=FSMExpiry(clock=clock, groups={'AddAdmin': 10}))
+    extended = []
+
+    def extend_before_delete(operation):
+        # другой экземпляр продлевает item между query и удалением
+        if operation == 'DeleteItem' and not extended:
+            extended.append(operation)
+            backend.database.update_item({
+                'TableName': 'test',
+                'Key': {'partkey': {'S': 'fsm_1'}, 'sortkey': {'S': '1'}},
+                'UpdateExpression': 'SET expires_at = :expires',
+                'ExpressionAttributeValues': {':expires': {'N': str(int(clock.now) + 100)}},
+            })
+
+    async def run():
+        await storage.set_state(key=user(1), state=AddAdmin.tg_id)
+        clock.now += 20
+        backend.database.request_hooks.append(extend_before_delete)
+        deleted = await compact_fsm(backend.table, bot_id=1, now=int(clock.now))
+        return deleted, await storage.get_state(key=user(1))
+
+    assert asyncio.run(run()) == (0, AddAdmin.tg_id.state)
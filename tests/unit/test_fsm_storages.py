@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+from aiogram.fsm.storage.base import StorageKey
+
+from app.config import settings
+from app.tg.create_app import build_dispatcher, build_storage
+from app.tg.fsm.cache import TTLCache
+from app.tg.fsm.memory import MemoryFSMStorage
+from app.tg.fsm.storage import DynamoDBStorage
+from app.tg.fsm.tiered import TieredStorage
+
+KEY = StorageKey(bot_id=1, chat_id=10, user_id=10)
+GROUP_CHAT_KEY = StorageKey(bot_id=1, chat_id=-100, user_id=10)
+
+
+def test_memory_storage_uses_dynamo_key_conventions():
+    storage = MemoryFSMStorage()
+
+    async def run():
+        await storage.set_state(key=KEY, state='form:name')
+        await storage.update_data(key=KEY, data={'name': 'Анна'})
+        data = await storage.get_data(key=GROUP_CHAT_KEY)
+        data['name'] = 'changed'
+        result = await storage.get_state(key=GROUP_CHAT_KEY), await storage.get_data(key=KEY)
+        await storage.reset_state_data(key=KEY)
+        return result, await storage.get_state(key=KEY), await storage.get_data(key=KEY, default={'d': 1})
+
+    (state, data), reset_state, reset_data = asyncio.run(run())
+    assert state == 'form:name'
+    assert data == {'name': 'Анна'}
+    assert reset_state is None and reset_data == {'d': 1}
+    assert list(storage.records) == []
+
+
+def test_tiered_write_through_serves_reads_from_l1(memory_backend):
+    backend = memory_backend()
+    table, calls = backend.table, backend.calls
+    storage = TieredStorage(backend.storage(), cache=TTLCache(ttl=60))
+
+    async def run():
+        await storage.set_state(key=KEY, state='form:name')
+        await storage.update_data(key=KEY, data={'name': 'Анна'})
+        writes = len(calls)
+        for _ in range(3):
+            assert await storage.get_state(key=KEY) == 'form:name'
+            assert await storage.get_data(key=KEY) == {'name': 'Анна'}
+        return writes, len(calls), await DynamoDBStorage(table).get_data(key=KEY)
+
+    writes, requests, durable = asyncio.run(run())
+    assert requests == writes
+    assert durable == {'name': 'Анна'}
+
+
+def test_tiered_write_back_coalesces_writes(memory_backend):
+    backend = memory_backend()
+    table, calls = backend.table, backend.calls
+    storage = TieredStorage(backend.storage(), cache=TTLCache(ttl=60), consistency='write_back', flush_delay=60)
+    other = StorageKey(bot_id=1, chat_id=11, user_id=11)
+
+    async def run():
+        await storage.set_state(key=KEY, state='form:name')
+        await storage.update_data(key=KEY, data={'name': 'Анна'})
+        await storage.update_data(key=KEY, data={'age': 30})
+        await storage.set_state(key=other, state='form:age')
+        await storage.reset_state_data(key=other)
+        storage.cache.clear()
+        assert await storage.get_data(key=KEY) == {'name': 'Анна', 'age': 30}
+        # до flush в DynamoDB только чтение данных, которых ещё не было в L1
+        assert calls == ['GetItem']
+        await storage.close()
+        l2 = DynamoDBStorage(table)
+        return await l2.get_state(key=KEY), await l2.get_data(key=KEY), await l2.get_state(key=other)
+
+    state, data, other_state = asyncio.run(run())
+    assert (state, data, other_state) == ('form:name', {'name': 'Анна', 'age': 30}, None)
+    assert calls[1] == 'TransactWriteItems'
+
+
+def test_tiered_rejects_unknown_consistency():
+    with pytest.raises(ValueError):
+        TieredStorage(DynamoDBStorage(None), cache=TTLCache(), consistency='eventual')
+
+
+@pytest.mark.parametrize('backend, storage_type', [
+    ('memory', MemoryFSMStorage),
+    ('dynamo', DynamoDBStorage),
+    ('tiered', TieredStorage),
+])
+def test_storage_is_selected_from_settings(monkeypatch, backend, storage_type):
+    monkeypatch.setattr(settings, 'FSM_STORAGE', backend)
+    dp = build_dispatcher(build_storage(table='table'))
+    assert type(dp.fsm.storage) is storage_type
+    if backend != 'memory':
+        assert dp.fsm.storage.table == 'table'
@@ -0,0 +1,129 @@
+import asyncio
+import datetime
+
+import pytest
+from aiogram import Bot, Dispatcher, Router
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.types import Chat, Message, Update, User
+
+from app.tg.fsm.cache import TTLCache
+from app.tg.fsm.middleware import install_unit_of_work
+from app.tg.fsm.tiered import TieredStorage
+
+BOT = Bot('123456:test-token')
+KEY = StorageKey(bot_id=BOT.id, chat_id=7, user_id=7)
+
+
+def message_update(text: str) -> Update:
+    return Update(update_id=1, message=Message(
+        message_id=1,
+        date=datetime.datetime.now(),
+        chat=Chat(id=7, type='private'),
+        from_user=User(id=7, is_bot=False, first_name='Анна'),
+        text=text,
+    ))
+
+
+def test_unit_of_work_reads_once_and_writes_fields(memory_backend):
+    backend = memory_backend()
+    storage = backend.storage()
+    other_writer = backend.storage()
+
+    async def run():
+        await storage.set_state(key=KEY, state='form:name')
+        await storage.set_data(key=KEY, data={'name': 'Анна'})
+        backend.calls.clear()
+        async with storage.unit_of_work():
+            assert await storage.get_state(key=KEY) == 'form:name'
+            assert await storage.get_data(key=KEY) == {'name': 'Анна'}
+            # другой update пишет в те же данные, пока этот обрабатывается
+            await other_writer.update_data(key=KEY, data={'phone': '123'})
+            assert await storage.update_data(key=KEY, data={'age': 30}) == {'name': 'Анна', 'age': 30}
+            await storage.set_state(key=KEY, state='form:age')
+        calls = list(backend.calls)
+        return calls, await storage.get_state(key=KEY), await storage.get_data(key=KEY)
+
+    calls, state, data = asyncio.run(run())
+    assert calls == ['GetItem', 'UpdateItem', 'UpdateItem']
+    assert state == 'form:age'
+    assert data == {'name': 'Анна', 'phone': '123', 'age': 30}
+
+
+def test_unit_of_work_discards_writes_on_error(memory_backend):
+    backend = memory_backend()
+    storage = backend.storage()
+
+    async def run():
+        with pytest.raises(ValueError):
+            async with storage.unit_of_work():
+                await storage.set_state(key=KEY, state='form:name')
+                await storage.update_data(key=KEY, data={'name': 'Анна'})
+                raise ValueError('handler failed')
+        return await storage.get_state(key=KEY), await storage.get_data(key=KEY)
+
+    assert asyncio.run(run()) == (None, {})
+    assert 'UpdateItem' not in backend.calls
+
+
+def test_middleware_coalesces_handler_writes(memory_backend):
+    backend = memory_backend()
+    storage = backend.storage()
+    dp = Dispatcher(storage=storage)
+    install_unit_of_work(dp, storage)
+    router = Router()
+
+    @router.message()
+    async def handler(message: Message, state: FSMContext):
+        if message.text == 'fail':
+            await state.set_state('form:broken')
+            raise RuntimeError('handler failed')
+        await state.get_state()
+        await state.update_data(name=message.text)
+        await state.set_state('form:age')
+
+    dp.include_router(router)
+
+    async def run():
+        await dp.feed_update(BOT, message_update('Анна'))
+        handled = list(backend.calls)
+        with pytest.raises(RuntimeError):
+            await dp.feed_update(BOT, message_update('fail'))
+        return handled, await storage.get_state(key=KEY), await storage.get_data(key=KEY)
+
+    handled, state, data = asyncio.run(run())
+    assert handled == ['GetItem', 'UpdateItem']
+    assert state == 'form:age'
+    assert data == {'name': 'Анна'}
+
+
+def test_write_back_flushes_outside_handler_unit_of_work(memory_backend):
+    backend = memory_backend()
+    storage = TieredStorage(backend.storage(), cache=TTLCache(ttl=60), consistency='write_back', flush_delay=0)
+    dp = Dispatcher(storage=storage)
+    install_unit_of_work(dp, storage)
+    router = Router()
+
+    @router.message()
+    async def handler(message: Message, state: FSMContext):
+        await state.update_data(name=message.text)
+        await state.set_state('form:age')
+        if message.text == 'fail':
+            # очередь забрана flush(), ошибка хендлера не должна её потерять
+            await storage.flush()
+            raise RuntimeError('handler failed')
+
+    dp.include_router(router)
+    reader = backend.storage()
+
+    async def run():
+        await dp.feed_update(BOT, message_update('Анна'))
+        await storage._flush_task
+        flushed = await reader.get_state(key=KEY), await reader.get_data(key=KEY)
+        with pytest.raises(RuntimeError):
+            await dp.feed_update(BOT, message_update('fail'))
+        return flushed, await reader.get_data(key=KEY)
+
+    flushed, data = asyncio.run(run())
+    assert flushed == ('form:age', {'name': 'Анна'})
+    assert data == {'name': 'fail'}
@@ -0,0 +1,43 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[2]
+
+# модули, которые должны подгружаться только при первом вызове; время импорта
+# не замеряется, оно зависит от раннера, а проверяется, что их нет в sys.modules
+HEAVY_MODULES = (
+    'aiogram',
+    'aiohttp',
+    'aioboto3',
+    'aiobotocore',
+    'boto3',
+    'botocore',
+    'pydantic',
+    'fastapi',
+    'httpx',
+    'asgi_lifespan',
+    'pydantic_settings',
+    'types_aiobotocore_dynamodb',
+    'app.config',
+    'app.main',
+    'app.routers',
+    'app.tg.create_app',
+)
+
+
+def _run(*args: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, *args], cwd=ROOT, env=os.environ.copy(), capture_output=True, text=True, check=True
+    )
+
+
+@pytest.mark.parametrize('module', ['entry_point', 'function_app'])
+def test_entry_module_does_not_import_heavy_dependencies(module):
+    code = f'import json, sys, {module}; print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))'
+    assert json.loads(_run('-c', code).stdout) == []
+
@@ -0,0 +1,112 @@
+import asyncio
+
+import pytest
+
+from app.db import key_structure
+from app.db.crud.common import batch_write_items, iter_pattern, scan
+from app.db.fast_table import FastTable
+from app.db.key_structure import EntityKeys, KeyFormat, KeyStructureError
+from app.db.maintenance import ensure_indexes
+from app.db.memory import MemoryDynamoDB
+
+
+def test_key_formats():
+    order = KeyFormat('{created_at:012d}_{order_id}')
+    assert order.fields == ('created_at', 'order_id')
+    assert order(created_at=1_700_000_000, order_id='a1') == '001700000000_a1'
+    assert order.prefix(created_at=1_700_000_000) == '001700000000_'
+    assert order.prefix(order_id='a1') == ''
+    assert order.parse('001700000000_a1') == {'created_at': '001700000000', 'order_id': 'a1'}
+    with pytest.raises(KeyStructureError):
+        order(order_id='a1')
+    with pytest.raises(KeyStructureError):
+        key_structure.access_pattern('unknown')
+    with pytest.raises(ValueError):
+        EntityKeys('order', 'order', '{order_id}', indexes={'gsi9': ('a', 'b')})
+
+
+def test_entity_items_and_legacy_keys():
+    assert key_structure.FSM.key(bot_id=1, user_id=5) == {'partkey': 'fsm_1', 'sortkey': '5'}
+    assert key_structure.CLIENT.key(telegram_id=42) == {
+        'partkey': key_structure.client_partkey,
+        'sortkey': key_structure.client_sortkey.format(telegramID=42),
+    }
+    order = key_structure.ORDER
+    item = order.item({'total': 10}, telegram_id=42, created_at=5, order_id='a1', status='new')
+    assert item == {
+        'total': 10,
+        'partkey': 'order_42', 'sortkey': '000000000005_a1',
+        'gsi1pk': 'order_status_new', 'gsi1sk': '000000000005_a1',
+    }
+    assert order.parse(item) == {'telegram_id': '42', 'created_at': '000000000005', 'order_id': 'a1'}
+
+
+def test_access_patterns_are_queries():
+    database = MemoryDynamoDB()
+    operations = []
+    database.request_hooks.append(operations.append)
+    table = FastTable(database.client(), 'test')
+    order = key_structure.ORDER
+    orders = [
+        order.item({'total': n}, telegram_id=n % 2, created_at=n, order_id=f'o{n}', status='paid' if n % 3 else 'new')
+        for n in range(1, 7)
+    ]
+    clients = [key_structure.CLIENT.item({'name': name}, telegram_id=n) for n, name in enumerate(['Анна', 'Борис'])]
+
+    async def listing(pattern, **fields):
+        return [item async for item in iter_pattern(table, pattern, page_size=2, **fields)]
+
+    async def run():
+        await batch_write_items(table, put_items=orders + clients)
+        # смена статуса переносит заказ в другую партицию GSI
+        await table.update_item(
+            Key=order.key(telegram_id=1, created_at=5, order_id='o5'),
+            UpdateExpression='SET #pk = :pk',
+            ExpressionAttributeNames={'#pk': 'gsi1pk'},
+            ExpressionAttributeValues={':pk': order.indexes['gsi1'][0](status='new')},
+        )
+        operations.clear()
+        return {
+            'client_orders': await listing('client_orders', telegram_id=1),
+            'orders_by_status': await listing('orders_by_status', status='new'),
+            'since': await listing('client_orders', telegram_id=0, created_at=4),
+            'clients': await listing('clients'),
+        }
+
+    result = asyncio.run(run())
+    assert [item['order_id'] for item in map(order.parse, result['client_orders'])] == ['o5', 'o3', 'o1']
+    assert [item['total'] for item in result['orders_by_status']] == [6, 5, 3]
+    assert [item['total'] for item in result['since']] == [4]
+    assert sorted(item['name'] for item in result['clients']) == ['Анна', 'Борис']
+    assert set(operations) == {'Query'}
+
+
+def test_ensure_indexes_adds_missing_gsi_to_existing_table():
+    database = MemoryDynamoDB(auto_create=False)
+    client = database.client()
+    table = FastTable(client, 'test')
+    schema = key_structure.table_schema()
+    # таблица, созданная до появления gsi1 в схеме
+    key_attributes = {key_structure.table_partkey, key_structure.table_sortkey}
+    old_schema = {
+        'AttributeDefinitions': [
+            definition for definition in schema['AttributeDefinitions'] if definition['AttributeName'] in key_attributes
+        ],
+        'KeySchema': schema['KeySchema'],
+    }
+    order = key_structure.ORDER
+
+    async def run():
+        await client.create_table(TableName='test', BillingMode='PAY_PER_REQUEST', **old_schema)
+        await table.put_item(Item=order.item({'total': 1}, telegram_id=1, created_at=1, order_id='o1', status='new'))
+        created = await ensure_indexes(client, 'test', poll_interval=0)
+        again = await ensure_indexes(client, 'test', poll_interval=0)
+        listed = [item async for item in iter_pattern(table, 'orders_by_status', status='new')]
+        indexes = (await client.describe_table(TableName='test'))['Table']['GlobalSecondaryIndexes']
+        return created, again, listed, indexes, await scan(table)
+
+    created, again, listed, indexes, scanned = asyncio.run(run())
+    assert (created, again) == (['gsi1'], [])
+    assert [index['IndexName'] for index in indexes] == ['gsi1']
+    assert [item['total'] for item in listed] == [1]
+    assert [item['total'] for item in scanned['Items']] == [1]
@@ -0,0 +1,36 @@
+import logging
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from app.core.log_config import parse_log_level, parse_sample_rate
+
+ROOT = Path(__file__).resolve().parents[2]
+
+
+def test_parse_log_level_falls_back_on_unknown_name():
+    assert parse_log_level('debug') == logging.DEBUG
+    assert parse_log_level(' warning ') == logging.WARNING
+    assert parse_log_level('verbose') == logging.INFO
+    assert parse_log_level(None) == logging.INFO
+    assert parse_log_level('verbose', default=None) is None
+
+
+def test_parse_sample_rate_clamps_to_fraction():
+    assert parse_sample_rate('0.25') == 0.25
+    assert parse_sample_rate(None) == 0.0
+    assert parse_sample_rate('5') == 1.0
+    assert parse_sample_rate('-1') == 0.0
+    assert parse_sample_rate('nan') is None
+    assert parse_sample_rate('10%') is None
+
+
+def test_invalid_level_and_default_output_at_import():
+    code = 'from app.core import log_config as c; print(c.LOGGER_LEVEL, c.log_listener, c.LOG_PAYLOAD_SAMPLE_RATE)'
+    env = {**os.environ, 'LOGGING_LEVEL': 'verbose', 'LOG_PAYLOAD_SAMPLE_RATE': '10%'}
+    env.pop('LOG_ASYNC', None)
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    assert result.stdout.split() == [str(logging.INFO), 'None', '0.0']
+    assert 'Unknown LOGGING_LEVEL' in result.stderr
+    assert 'Invalid LOG_PAYLOAD_SAMPLE_RATE' in result.stderr
@@ -0,0 +1,87 @@
+import asyncio
+import json
+from decimal import Decimal
+
+from aiogram.fsm.storage.base import StorageKey
+
+from app.db.maintenance import export_table, import_table, load_item, migrate_fsm
+from app.tg.fsm.codec import DataCodec
+
+ITEM = {
+    'partkey': 'fsm_1',
+    'sortkey': '5',
+    'data_bin': DataCodec().encode({'name': 'Анна', 'answers': ['да'] * 100}),
+    'tags': {'a', 'b'},
+    'scores': {1, 2},
+    'price': Decimal('0.1000000000000000000000000001'),
+    'form': {'files': [b'\x00\xff'], 'age': 30},
+}
+
+
+def test_export_import_round_trip(memory_backend, tmp_path):
+    source = memory_backend().table
+    target = memory_backend().table
+    path = str(tmp_path / 'dump.jsonl')
+
+    async def run():
+        await source.put_item(Item=ITEM)
+        exported = await export_table(source, path, segments=2, workers=2)
+        imported = await import_table(target, path)
+        return exported, imported, (await target.get_item(Key={'partkey': 'fsm_1', 'sortkey': '5'}))['Item']
+
+    exported, imported, item = asyncio.run(run())
+    assert exported == imported == 1
+    assert item == (asyncio.run(source.get_item(Key={'partkey': 'fsm_1', 'sortkey': '5'})))['Item']
+    assert bytes(item['data_bin']) == ITEM['data_bin']
+    assert item['tags'] == {'a', 'b'} and item['price'] == ITEM['price']
+    with open(path, encoding='utf-8') as file:
+        assert json.loads(file.readline())['Item']['tags'].keys() == {'SS'}
+
+
+def test_legacy_plain_json_lines_are_imported():
+    assert load_item('{"partkey": "client", "sortkey": "1", "balance": 10.5}') == {
+        'partkey': 'client', 'sortkey': '1', 'balance': Decimal('10.5'),
+    }
+
+
+def test_migrate_fsm_moves_legacy_layout_to_single_item(memory_backend):
+    backend = memory_backend()
+    table = backend.table
+    storage = backend.storage(codec=DataCodec())
+
+    def key(user_id):
+        return StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+
+    async def run():
+        # раскладка до единого item: state и data в разных партициях
+        await table.put_item(Item={'partkey': 'state_1', 'sortkey': '5', 'time': 100, 'bot': 1, 'user': 5,
+                                   'state': 'form:age'})
+        await table.put_item(Item={'partkey': 'data_state_1', 'sortkey': '5', 'name': 'Анна', 'age': 30})
+        await table.put_item(Item={'partkey': 'data_state_1', 'sortkey': '7', 'name': 'Борис'})
+        await table.put_item(Item={'partkey': 'state_1', 'sortkey': '8', 'state': 'form:old'})
+        # пользователь 8 уже написал боту после выкладки: его новый item не затирается
+        await storage.set_state(key=key(8), state='form:new')
+        migrated = await migrate_fsm(table, bot_id=1)
+        again = await migrate_fsm(table, bot_id=1)
+        fsm = {
+            user_id: (await storage.get_state(key=key(user_id)), await storage.get_data(key=key(user_id)))
+            for user_id in (5, 7, 8)
+        }
+        leftovers = [
+            item for partkey in ('state_1', 'data_state_1')
+            for item in (await table.query(
+                KeyConditionExpression='#pk = :pk',
+                ExpressionAttributeNames={'#pk': 'partkey'},
+                ExpressionAttributeValues={':pk': partkey},
+            ))['Items']
+        ]
+        return migrated, again, fsm, leftovers
+
+    migrated, again, fsm, leftovers = asyncio.run(run())
+    assert (migrated, again) == (2, 0)
+    assert fsm == {
+        5: ('form:age', {'name': 'Анна', 'age': 30}),
+        7: (None, {'name': 'Борис'}),
+        8: ('form:new', {}),
+    }
+    assert leftovers == []
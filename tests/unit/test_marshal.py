@@ -0,0 +1,95 @@
+import asyncio
+from decimal import Decimal
+
+import pytest
+from aiogram.fsm.storage.base import StorageKey
+from boto3.dynamodb.conditions import Attr, Key
+from boto3.dynamodb.types import Binary, TypeDeserializer, TypeSerializer
+
+from app.db.crud.common import batch_get_items, batch_write_items, iter_query
+from app.db.fast_table import FastTable
+from app.db.marshal import MarshalError, marshal_item, marshal_value, unmarshal_item, unmarshal_value
+from app.db.memory import MemoryDynamoDB
+from app.tg.fsm.storage import DynamoDBStorage
+
+ITEM = {
+    'partkey': 'client',
+    'sortkey': '42',
+    'name': 'Анна',
+    'age': 30,
+    'balance': Decimal('10.5'),
+    'active': True,
+    'note': None,
+    'tags': {'a', 'b'},
+    'photo': b'\x89PNG',
+    'form': {'answers': ['да', 1, False, {'nested': []}], 'empty': {}},
+}
+
+
+def test_marshal_matches_boto3_serializer():
+    assert marshal_item(ITEM) == {name: TypeSerializer().serialize(value) for name, value in ITEM.items()}
+
+
+def test_unmarshal_returns_native_types():
+    serialized = {name: TypeSerializer().serialize(value) for name, value in ITEM.items()}
+    item = unmarshal_item(serialized)
+    assert item == ITEM
+    assert type(item['age']) is int and type(item['balance']) is Decimal
+    assert unmarshal_value({'NS': ['1', '2.5']}) == {1, Decimal('2.5')}
+    assert {name: TypeDeserializer().deserialize(value) for name, value in serialized.items()} == item
+
+
+def test_fractional_numbers_keep_precision():
+    # целые - int, дробные - Decimal без округления через float
+    assert unmarshal_value(marshal_value(Decimal('19.99'))) == Decimal('19.99')
+    assert unmarshal_value({'N': '0.1234567890123456789'}) == Decimal('0.1234567890123456789')
+    assert unmarshal_value({'N': '1E+2'}) == Decimal('1E+2')
+    assert marshal_value(Binary(b'\x00')) == {'B': b'\x00'}
+
+
+@pytest.mark.parametrize('value', [float('nan'), set(), object()])
+def test_unsupported_values(value):
+    with pytest.raises(MarshalError):
+        marshal_value(value)
+
+
+@pytest.mark.parametrize('value', [0.1, {'price': 19.99}, [1.5], float('inf')])
+def test_floats_are_rejected_like_boto3(memory_backend, value):
+    with pytest.raises(TypeError):
+        TypeSerializer().serialize(value)
+    with pytest.raises(TypeError):
+        marshal_value(value)
+    # запись через boto3 resource и через FastTable ведёт себя одинаково
+    backend = memory_backend()
+    for table in (backend.table, FastTable(backend.database.client(), 'test')):
+        with pytest.raises(TypeError):
+            asyncio.run(table.put_item(Item={'partkey': 'p', 'sortkey': 's', 'value': value}))
+
+
+def test_fast_table_over_low_level_client():
+    database = MemoryDynamoDB()
+    table = FastTable(database.client(), 'test')
+    storage = DynamoDBStorage(table)
+    key = StorageKey(bot_id=1, chat_id=7, user_id=7)
+
+    async def run():
+        await batch_write_items(table, put_items=[{'partkey': 'p', 'sortkey': f's{n}', 'n': n} for n in range(5)])
+        queried = [item async for item in iter_query(
+            table, page_size=2, KeyConditionExpression=Key('partkey').eq('p'), FilterExpression=Attr('n').gte(2),
+        )]
+        fetched = await batch_get_items(table, [{'partkey': 'p', 'sortkey': 's1'}])
+        await storage.set_state(key=key, state='form:name')
+        await storage.update_data(key=key, data={'age': 30, 'answers': [1, 2]})
+        async with storage.unit_of_work():
+            await storage.update_data(key=key, data={'name': 'Анна'})
+            await storage.set_data(key=StorageKey(bot_id=1, chat_id=8, user_id=8), data={'x': Decimal('1.5')})
+        other = await storage.get_data(key=StorageKey(bot_id=1, chat_id=8, user_id=8))
+        return queried, fetched, await storage.get_state(key=key), await storage.get_data(key=key), other
+
+    queried, fetched, state, data, other = asyncio.run(run())
+    assert [item['n'] for item in queried] == [2, 3, 4]
+    assert type(fetched[0]['n']) is int
+    assert state == 'form:name'
+    assert data == {'age': 30, 'answers': [1, 2], 'name': 'Анна'}
+    assert type(data['age']) is int
+    assert other == {'x': Decimal('1.5')}
@@ -0,0 +1,244 @@
+import asyncio
+import time
+from decimal import Decimal
+
+import pytest
+from aiogram.fsm.storage.base import StorageKey
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+
+from app.db.crud.common import batch_get_items, batch_write_items, iter_query, iter_scan
+
+
+def error_code(error: ClientError) -> str:
+    return error.response['Error']['Code']
+
+
+def test_put_get_with_condition_and_projection(memory_backend):
+    table = memory_backend().table
+
+    async def run():
+        await table.put_item(Item={'partkey': 'p', 'sortkey': 's', 'n': 1, 'm': {'a': 'x', 'b': [1, 2]}})
+        with pytest.raises(ClientError) as error:
+            await table.put_item(
+                Item={'partkey': 'p', 'sortkey': 's'},
+                ConditionExpression='attribute_not_exists(#pk)',
+                ExpressionAttributeNames={'#pk': 'partkey'},
+            )
+        assert error_code(error.value) == 'ConditionalCheckFailedException'
+        full = await table.get_item(Key={'partkey': 'p', 'sortkey': 's'})
+        part = await table.get_item(
+            Key={'partkey': 'p', 'sortkey': 's'},
+            ProjectionExpression='#m.#b[1], n',
+            ExpressionAttributeNames={'#m': 'm', '#b': 'b'},
+        )
+        missing = await table.get_item(Key={'partkey': 'p', 'sortkey': 'other'})
+        return full, part, missing
+
+    full, part, missing = asyncio.run(run())
+    assert full['Item']['n'] == Decimal(1)
+    assert part['Item'] == {'n': Decimal(1), 'm': {'b': [Decimal(2)]}}
+    assert 'Item' not in missing
+
+
+def test_update_expressions_and_validation(memory_backend):
+    table = memory_backend().table
+    key = {'partkey': 'p', 'sortkey': 's'}
+
+    async def run():
+        with pytest.raises(ClientError) as error:
+            await table.update_item(
+                Key=key,
+                UpdateExpression='SET #data.#f = :v',
+                ExpressionAttributeNames={'#data': 'data', '#f': 'f'},
+                ExpressionAttributeValues={':v': 1},
+            )
+        assert error_code(error.value) == 'ValidationException'
+        with pytest.raises(ClientError) as error:
+            await table.update_item(
+                Key=key,
+                UpdateExpression='SET a = :v',
+                ExpressionAttributeValues={':v': 1, ':unused': 2},
+            )
+        assert error_code(error.value) == 'ValidationException'
+
+        await table.update_item(
+            Key=key,
+            UpdateExpression='SET #data = :data, #c = if_not_exists(#c, :zero) + :one, #l = list_append(:l, :l) '
+                             'ADD #tags :tags',
+            ExpressionAttributeNames={'#data': 'data', '#c': 'counter', '#l': 'list', '#tags': 'tags'},
+            ExpressionAttributeValues={':data': {'f': 1}, ':zero': 0, ':one': 1, ':l': ['x'], ':tags': {'a', 'b'}},
+        )
+        return await table.update_item(
+            Key=key,
+            UpdateExpression='SET #data.#g = :g, #c = #c + :one REMOVE #l[0] DELETE #tags :drop',
+            ConditionExpression='attribute_exists(#data) AND #c BETWEEN :zero AND :one',
+            ExpressionAttributeNames={'#data': 'data', '#g': 'g', '#c': 'counter', '#l': 'list', '#tags': 'tags'},
+            ExpressionAttributeValues={':g': 'new', ':one': 1, ':zero': 0, ':drop': {'a'}},
+            ReturnValues='ALL_NEW',
+        )
+
+    item = asyncio.run(run())['Attributes']
+    assert item == {
+        'partkey': 'p', 'sortkey': 's',
+        'data': {'f': Decimal(1), 'g': 'new'},
+        'counter': Decimal(2),
+        'list': ['x'],
+        'tags': {'b'},
+    }
+
+
+def test_query_scan_pagination_and_batch_helpers(memory_backend):
+    table = memory_backend().table
+    items = [{'partkey': f'p{n % 3}', 'sortkey': f's{n:02}', 'n': n} for n in range(30)]
+
+    async def run():
+        await batch_write_items(table, put_items=items)
+        queried = [item async for item in iter_query(
+            table, page_size=4, KeyConditionExpression=Key('partkey').eq('p1') & Key('sortkey').gte('s10'),
+        )]
+        newest = await table.query(
+            KeyConditionExpression='#pk = :pk AND begins_with(#sk, :prefix)',
+            FilterExpression='#n > :n',
+            ExpressionAttributeNames={'#pk': 'partkey', '#sk': 'sortkey', '#n': 'n'},
+            ExpressionAttributeValues={':pk': 'p0', ':prefix': 's2', ':n': 21},
+            ScanIndexForward=False,
+        )
+        scanned = [item async for item in iter_scan(table, segments=3, max_workers=2, page_size=5)]
+        fetched = await batch_get_items(table, [{'partkey': 'p2', 'sortkey': 's05'}, {'partkey': 'x', 'sortkey': 'y'}])
+        await batch_write_items(table, delete_keys=[{'partkey': item['partkey'], 'sortkey': item['sortkey']}
+                                                    for item in items[:10]])
+        left = await table.scan(Select='COUNT')
+        return queried, newest, scanned, fetched, left
+
+    queried, newest, scanned, fetched, left = asyncio.run(run())
+    assert [item['n'] for item in queried] == [10, 13, 16, 19, 22, 25, 28]
+    assert [item['n'] for item in newest['Items']] == [27, 24]
+    assert newest['ScannedCount'] == 3
+    assert sorted(item['n'] for item in scanned) == list(range(30))
+    assert fetched == [{'partkey': 'p2', 'sortkey': 's05', 'n': Decimal(5)}]
+    assert left['Count'] == 20 and 'Items' not in left
+
+
+@pytest.mark.parametrize('index, forward', [(None, True), (None, False), ('gsi1', True), ('gsi1', False)])
+def test_query_resumes_after_deleted_start_key(memory_backend, index, forward):
+    table = memory_backend().table
+    items = [
+        {'partkey': 'p', 'sortkey': f's{n}', 'gsi1pk': 'g', 'gsi1sk': f'g{n}', 'n': n}
+        for n in range(6)
+    ]
+    query_args = {'KeyConditionExpression': Key('gsi1pk' if index else 'partkey').eq('g' if index else 'p'),
+                  'ScanIndexForward': forward, 'Limit': 2}
+    if index:
+        query_args['IndexName'] = index
+
+    async def run():
+        await batch_write_items(table, put_items=items)
+        pages = []
+        response = await table.query(**query_args)
+        while True:
+            pages.append([item['n'] for item in response['Items']])
+            if 'LastEvaluatedKey' not in response or len(pages) > 5:
+                return pages
+            # последний отданный item удаляется до запроса следующей страницы
+            last = response['Items'][-1]
+            await table.delete_item(Key={'partkey': last['partkey'], 'sortkey': last['sortkey']})
+            response = await table.query(**query_args, ExclusiveStartKey=response['LastEvaluatedKey'])
+
+    expected = [[0, 1], [2, 3], [4, 5]] if forward else [[5, 4], [3, 2], [1, 0]]
+    assert asyncio.run(run()) == expected
+
+
+def test_dynamodb_storage_on_memory_table(memory_backend):
+    backend = memory_backend()
+    calls = backend.calls
+    storage = backend.storage()
+    key = StorageKey(bot_id=1, chat_id=2, user_id=2)
+    other = StorageKey(bot_id=1, chat_id=3, user_id=3)
+
+    async def run():
+        await storage.set_state(key=key, state='form:name')
+        await storage.update_data(key=key, data={'name': 'Анна'})
+        await storage.update_data(key=key, data={'age': 30})
+        async with storage.unit_of_work():
+            await storage.set_state(key=key, state='form:age')
+            await storage.set_data(key=other, data={'x': 1})
+        return (
+            await storage.get_state(key=key),
+            await storage.get_data(key=key),
+            await storage.get_data(key=other),
+        )
+
+    state, data, other_data = asyncio.run(run())
+    assert state == 'form:age'
+    assert data == {'name': 'Анна', 'age': 30}
+    assert other_data == {'x': 1}
+    assert calls.count('TransactWriteItems') == 1
+
+
+def test_transaction_is_cancelled_atomically(memory_backend):
+    table = memory_backend().table
+    client = table.meta.client
+
+    async def run():
+        await table.put_item(Item={'partkey': 'p', 'sortkey': 'a', 'v': 1})
+        with pytest.raises(ClientError) as error:
+            await client.transact_write_items(TransactItems=[
+                {'Put': {'TableName': 'test', 'Item': {'partkey': {'S': 'p'}, 'sortkey': {'S': 'b'}}}},
+                {'Delete': {
+                    'TableName': 'test',
+                    'Key': {'partkey': {'S': 'p'}, 'sortkey': {'S': 'a'}},
+                    'ConditionExpression': 'v = :two',
+                    'ExpressionAttributeValues': {':two': {'N': '2'}},
+                }},
+            ])
+        return error.value, await table.scan()
+
+    error, scan = asyncio.run(run())
+    assert error_code(error) == 'TransactionCanceledException'
+    assert [reason['Code'] for reason in error.response['CancellationReasons']] == ['None', 'ConditionalCheckFailed']
+    assert [item['sortkey'] for item in scan['Items']] == ['a']
+
+
+def test_injected_latency(memory_backend):
+    table = memory_backend(latency=0.02).table
+
+    async def run():
+        started = time.perf_counter()
+        await asyncio.gather(*(table.get_item(Key={'partkey': 'p', 'sortkey': str(n)}) for n in range(5)))
+        return time.perf_counter() - started
+
+    assert 0.015 <= asyncio.run(run()) < 0.1
+
+
+def test_update_data_round_trips(memory_backend):
+    backend = memory_backend()
+    storage = backend.storage()
+    new_user = StorageKey(bot_id=1, chat_id=4, user_id=4)
+    with_state = StorageKey(bot_id=1, chat_id=5, user_id=5)
+
+    async def run():
+        first = await storage.update_data(key=new_user, data={'name': 'Анна'})
+        first_calls = len(backend.calls)
+        await storage.set_state(key=with_state, state='form:name')
+        backend.calls.clear()
+        after_state = await storage.update_data(key=with_state, data={'age': 30})
+        return first, first_calls, after_state, len(backend.calls)
+
+    first, first_calls, after_state, after_state_calls = asyncio.run(run())
+    # первая запись пользователя без item: условная запись по полю и создание map
+    assert first == {'name': 'Анна'} and first_calls == 2
+    assert after_state == {'age': 30} and after_state_calls == 1
+
+
+def test_concurrent_first_update_data_keeps_all_fields(memory_backend):
+    backend = memory_backend(latency=0.001)
+    storage = backend.storage()
+    key = StorageKey(bot_id=1, chat_id=6, user_id=6)
+
+    async def run():
+        await asyncio.gather(*(storage.update_data(key=key, data={f'field{n}': n}) for n in range(4)))
+        return await storage.get_data(key=key)
+
+    assert asyncio.run(run()) == {f'field{n}': n for n in range(4)}
+    assert backend.calls.count('UpdateItem') <= 4 * 4
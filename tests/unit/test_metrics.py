@@ -0,0 +1,47 @@
+import asyncio
+
+import pytest
+
+from app.core.metrics import MetricsRegistry, collect_invocation, format_invocation
+
+
+def test_histogram_quantiles_and_prometheus_text():
+    registry = MetricsRegistry()
+    for _ in range(99):
+        registry.observe('feed_update', 0.004)
+    registry.observe('feed_update', 0.2)
+
+    summary = registry.summary()['feed_update']
+    assert summary == {'count': 100, 'p50_ms': 5.0, 'p99_ms': 5.0}
+
+    text = registry.render_prometheus()
+    assert 'tgstore_stage_duration_seconds_bucket{stage="feed_update",le="0.005"} 99' in text
+    assert 'tgstore_stage_duration_seconds_bucket{stage="feed_update",le="+Inf"} 100' in text
+    assert 'tgstore_stage_duration_seconds_count{stage="feed_update"} 100' in text
+
+
+def test_timed_counts_errors():
+    registry = MetricsRegistry()
+
+    @registry.timed('fsm_get_state')
+    async def failing():
+        raise ValueError('boom')
+
+    with pytest.raises(ValueError):
+        asyncio.run(failing())
+
+    assert registry.histograms['fsm_get_state'].count == 1
+    assert registry.counters[('errors_total', 'fsm_get_state')] == 1
+    assert 'tgstore_errors_total{stage="fsm_get_state"} 1' in registry.render_prometheus()
+
+
+def test_collect_invocation_sums_stages():
+    registry = MetricsRegistry()
+    registry.observe('feed_update', 1.0)
+    with collect_invocation() as timings:
+        registry.observe('fsm_get_state', 0.01)
+        registry.observe('fsm_get_state', 0.02)
+        registry.observe('bot_api.SendMessage', 0.1)
+
+    assert timings == pytest.approx({'fsm_get_state': 0.03, 'bot_api.SendMessage': 0.1})
+    assert format_invocation(timings) == 'fsm_get_state=30.0ms bot_api.SendMessage=100.0ms'
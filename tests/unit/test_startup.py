@@ -0,0 +1,114 @@
+import asyncio
+import time
+
+import pytest
+
+from app import main
+from app.config import settings
+from app.db import connection
+from app.main import startup_step
+from app.tg.create_app import attach_table, build_dispatcher, build_storage, shared_dispatcher
+
+
+class FakeClient:
+    def __init__(self):
+        self.calls = 0
+
+    async def describe_table(self, TableName):
+        self.calls += 1
+        return {'Table': {'TableName': TableName, 'TableStatus': 'ACTIVE'}}
+
+
+def test_describe_table_is_cached_per_container(monkeypatch):
+    monkeypatch.setattr(connection, '_table_descriptions', {})
+    client = FakeClient()
+
+    async def run():
+        for _ in range(3):
+            conn = connection.DynamoConnection(client, dyno_resource=None, default_table='store')
+            assert (await conn.describe_table())['TableName'] == 'store'
+
+    asyncio.run(run())
+    assert client.calls == 1
+
+
+def test_startup_step_timeout():
+    with pytest.raises(TimeoutError):
+        asyncio.run(startup_step('slow', 0.01, asyncio.sleep(1)))
+
+
+def test_dispatcher_can_be_rebuilt_for_new_table():
+    first = build_dispatcher(build_storage(table='table-a'))
+    second = build_dispatcher(build_storage(table='table-b'))
+    assert first.fsm.storage.table == 'table-a'
+    assert second.fsm.storage.table == 'table-b'
+    assert first.sub_routers[0] is not second.sub_routers[0]
+
+
+def test_shared_dispatcher_is_built_once_and_gets_table_of_each_start():
+    dp = shared_dispatcher()
+    assert shared_dispatcher() is dp
+    assert attach_table(dp, 'table-a').fsm.storage.table == 'table-a'
+    assert attach_table(shared_dispatcher(), 'table-b').fsm.storage.table == 'table-b'
+
+
+def test_lifespan_builds_bot_while_dynamo_starts(monkeypatch):
+    # describe_table ждёт 0.2s, сборка Bot и Dispatcher занимает ещё 0.2s
+    manager = connection.DynamoConnectionManager(endpoint_url='memory://?latency_ms=200')
+    monkeypatch.setattr(connection, 'dynamo_manager', manager)
+    monkeypatch.setattr(connection, '_table_descriptions', {})
+    monkeypatch.setattr(settings, 'USE_WEBHOOK', True)
+    monkeypatch.setattr(settings, 'DYNAMO_TRUST_TABLE', False)
+    build_telegram = main.start_telegram
+
+    def slow_start_telegram():
+        time.sleep(0.2)
+        return build_telegram()
+
+    monkeypatch.setattr(main, 'start_telegram', slow_start_telegram)
+    app = main.create_app()
+
+    async def run():
+        started = time.perf_counter()
+        async with main.lifespan(app):
+            elapsed = time.perf_counter() - started
+            return elapsed, shared_dispatcher().fsm.storage.table
+
+    elapsed, table = asyncio.run(run())
+    assert elapsed < 0.35
+    assert table is not None
+
+
+def test_dynamo_manager_reopens_on_new_event_loop():
+    manager = connection.DynamoConnectionManager(endpoint_url='memory://')
+
+    async def open_manager():
+        await manager.open()
+        return manager.client, await manager.table('store')
+
+    first_client, first_table = asyncio.run(open_manager())
+    assert manager.is_open
+    second_client, second_table = asyncio.run(open_manager())
+    assert second_client is not first_client
+    assert second_table is not first_table
+
+    async def close_on_other_loop():
+        await manager.close()
+
+    asyncio.run(close_on_other_loop())
+    assert not manager.is_open
+
+
+def test_runtime_forgets_previous_loop_without_awaiting():
+    from aiogram import Bot
+
+    from entry_point import BotRuntime
+
+    runtime = BotRuntime()
+    runtime.bot = Bot('123456:test-token')
+    session = asyncio.run(runtime.bot.session.create_session())
+    runtime._loop = object()
+
+    runtime._forget_previous_loop()
+    assert session.closed
+    assert runtime.bot is None and runtime._loop is None
@@ -0,0 +1,86 @@
+import asyncio
+
+from aiogram.types import Update
+
+from app.tg.workers import UpdateWorkerPool
+
+
+def make_update(update_id: int, chat_id: int) -> Update:
+    return Update.model_validate({
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': 1718000000,
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'test'},
+            'text': str(update_id),
+        },
+    })
+
+
+class RecordingDispatcher:
+    def __init__(self):
+        self.processed = []
+        self.active = 0
+        self.max_active = 0
+
+    async def feed_update(self, bot, update):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(0.01 if update.update_id % 2 else 0)
+        self.processed.append((update.message.chat.id, update.update_id))
+        self.active -= 1
+
+
+def test_updates_of_one_chat_are_ordered_and_chats_run_concurrently():
+    async def scenario():
+        dp = RecordingDispatcher()
+        pool = UpdateWorkerPool(dp, bot=None, max_in_flight=4)
+        for update_id in range(1, 9):
+            await pool.submit(make_update(update_id, chat_id=update_id % 2))
+        await pool.close(timeout=5)
+        return dp, pool
+
+    dp, pool = asyncio.run(scenario())
+    for chat_id in (0, 1):
+        chat_updates = [update_id for chat, update_id in dp.processed if chat == chat_id]
+        assert chat_updates == sorted(chat_updates)
+    assert len(dp.processed) == 8
+    assert dp.max_active == 2
+    assert pool.depth == 0
+
+
+def test_ack_first_is_refused_in_cloud_functions(monkeypatch):
+    from app.config import settings
+    from app.main import ack_first_enabled
+
+    monkeypatch.setattr(settings, 'USE_WEBHOOK', True)
+    monkeypatch.setattr(settings, 'WEBHOOK_ACK_FIRST', True)
+    assert ack_first_enabled(serverless=False)
+    assert not ack_first_enabled(serverless=True)
+
+
+def test_closed_pool_answers_503_and_publishes_depth():
+    from aiogram import Bot
+
+    from app.core.metrics import metrics
+    from app.routers import telegram_webhook
+    from app.tg.workers import QUEUE_DEPTH_GAUGE
+
+    class RawRequest:
+        async def body(self):
+            return make_update(1, chat_id=1).model_dump_json(exclude_none=True).encode()
+
+    async def scenario():
+        pool = UpdateWorkerPool(RecordingDispatcher(), bot=None, max_in_flight=1)
+        published = metrics.render_prometheus()
+        await pool.close(timeout=5)
+        response = await telegram_webhook(RawRequest(), dp=None, bot=Bot('123456:test-token'), update_workers=pool)
+        return published, response
+
+    published, response = asyncio.run(scenario())
+    assert f'# TYPE tgstore_{QUEUE_DEPTH_GAUGE} gauge' in published
+    assert f'tgstore_{QUEUE_DEPTH_GAUGE} 0' in published
+    assert QUEUE_DEPTH_GAUGE not in metrics.gauges
+    # Telegram повторит update, а не потеряет его
+    assert response.status_code == 503
@@ -0,0 +1,56 @@
+import asyncio
+
+from aiogram import Bot
+from aiogram.client.default import DefaultBotProperties
+from aiogram.methods import AnswerCallbackQuery, DeleteMessage, SendMessage
+
+from app.tg.webhook_reply import WebhookReplyMiddleware, build_reply_payload, collect_webhook_reply
+
+bot = Bot('123456:test-token', default=DefaultBotProperties(parse_mode='HTML'))
+
+
+def test_build_reply_payload_resolves_defaults():
+    payload = build_reply_payload(bot, SendMessage(chat_id=42, text='hi'))
+    assert payload == {'method': 'sendMessage', 'chat_id': 42, 'text': 'hi', 'parse_mode': 'HTML'}
+
+
+def test_middleware_defers_first_bool_method_only():
+    sent = []
+
+    async def make_request(bot_, method):
+        sent.append(method)
+        return 'sent'
+
+    async def scenario():
+        middleware = WebhookReplyMiddleware()
+        with collect_webhook_reply() as reply:
+            first = await middleware(make_request, bot, AnswerCallbackQuery(callback_query_id='1'))
+            second = await middleware(make_request, bot, AnswerCallbackQuery(callback_query_id='2'))
+            message = await middleware(make_request, bot, SendMessage(chat_id=1, text='x'))
+        outside = await middleware(make_request, bot, AnswerCallbackQuery(callback_query_id='3'))
+        return reply, first, second, message, outside
+
+    reply, first, second, message, outside = asyncio.run(scenario())
+    assert first.result is True
+    assert reply.payload == {'method': 'answerCallbackQuery', 'callback_query_id': '1'}
+    assert (second, message, outside) == ('sent', 'sent', 'sent')
+    assert [method.callback_query_id for method in sent if isinstance(method, AnswerCallbackQuery)] == ['2', '3']
+
+
+def test_middleware_keeps_order_sensitive_methods():
+    sent = []
+
+    async def make_request(bot_, method):
+        sent.append(method)
+        return True
+
+    async def scenario():
+        middleware = WebhookReplyMiddleware()
+        with collect_webhook_reply() as reply:
+            await middleware(make_request, bot, DeleteMessage(chat_id=1, message_id=5))
+            await middleware(make_request, bot, SendMessage(chat_id=1, text='x'))
+        return reply
+
+    reply = asyncio.run(scenario())
+    assert reply.payload is None
+    assert [type(method) for method in sent] == [DeleteMessage, SendMessage]
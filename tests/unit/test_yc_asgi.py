@@ -0,0 +1,62 @@
+import asyncio
+import base64
+
+from app.yc.asgi import build_scope, invoke_asgi, is_binary_content_type
+
+
+def make_event(**overrides):
+    event = {
+        'httpMethod': 'POST',
+        'headers': {'Host': 'example.net', 'Content-Type': 'application/json'},
+        'url': '/tgwebhook',
+        'multiValueQueryStringParameters': {},
+        'queryStringParameters': {},
+        'requestContext': {},
+        'body': '{"update_id": 1}',
+        'isBase64Encoded': False,
+    }
+    event.update(overrides)
+    return event
+
+
+async def echo_app(scope, receive, send):
+    message = await receive()
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [(b'content-type', scope['path'].endswith('.png') and b'image/png' or b'text/plain')],
+    })
+    await send({'type': 'http.response.body', 'body': message['body'] + scope['query_string']})
+
+
+def test_build_scope():
+    scope = build_scope(make_event(url='/tgwebhook?a=1', queryStringParameters={'b': '2'}))
+    assert scope['method'] == 'POST'
+    assert scope['path'] == '/tgwebhook'
+    assert scope['query_string'] == b'a=1&b=2'
+    assert scope['server'] == ('example.net', 443)
+    assert (b'content-type', b'application/json') in scope['headers']
+
+
+def test_is_binary_content_type():
+    assert is_binary_content_type('image/png')
+    assert is_binary_content_type('application/zip')
+    assert is_binary_content_type('application/pdf')
+    assert not is_binary_content_type('application/json')
+    assert not is_binary_content_type(None)
+
+
+def test_invoke_asgi_text_and_binary():
+    response = asyncio.run(invoke_asgi(echo_app, make_event()))
+    assert response == {
+        'statusCode': 200,
+        'headers': {'content-type': 'text/plain'},
+        'body': '{"update_id": 1}',
+        'isBase64Encoded': False,
+    }
+
+    raw = b'\x89PNG'
+    event = make_event(url='/img.png', body=base64.b64encode(raw).decode(), isBase64Encoded=True)
+    response = asyncio.run(invoke_asgi(echo_app, event))
+    assert response['isBase64Encoded'] is True
+    assert base64.b64decode(response['body']) == raw
@@ -1,23 +1,55 @@
+"""
+Регистрация webhook бота. Запускается отдельно (при деплое), а не из функции:
+
+    python webhook-utils.py set [--url URL]
+    python webhook-utils.py delete
+    python webhook-utils.py info
+"""
+import argparse
+import json
+
 import requests
 from app.config import settings
+from app.tg.create_app import build_dispatcher, resolve_allowed_updates
 
 
 TG_TOKEN = settings.TG_KEY
-WEBHOOK_URL = 'https://d5d6goq6did08enqmi0a.apigw.yandexcloud.net/tgwebhook'
+WEBHOOK_URL = settings.WEBHOOK
 
-method = 'setWebhook'
-# method = 'deleteWebhook'
-# method = 'getWebhookInfo'
 
-url = 'https://api.telegram.org/bot{token}/{method}'.format(token=TG_TOKEN, method=method)
+def api_url(method: str) -> str:
+    return 'https://api.telegram.org/bot{token}/{method}'.format(token=TG_TOKEN, method=method)
 
-data = {'url': WEBHOOK_URL}
+
+def set_webhook(url: str = WEBHOOK_URL):
+    data = {
+        'url': url,
+        'allowed_updates': json.dumps(resolve_allowed_updates(build_dispatcher())),
+    }
+    r = requests.post(api_url('setWebhook'), data)
+    print(r.json())
+
+
+def delete_webhook():
+    r = requests.post(api_url('deleteWebhook'))
+    print(r.json())
 
 
-def set_webhook():
-    r = requests.post(url, data)
+def webhook_info():
+    r = requests.get(api_url('getWebhookInfo'))
     print(r.json())
 
 
 if __name__ == '__main__':
-    set_webhook()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['set', 'delete', 'info'], nargs='?', default='set')
+    parser.add_argument('--url', default=WEBHOOK_URL)
+    args = parser.parse_args()
+
+    match args.command:
+        case 'set':
+            set_webhook(args.url)
+        case 'delete':
+            delete_webhook()
+        case 'info':
+            webhook_info()